@@ -11,6 +11,54 @@ export interface Timer {
   fechaFin: Date;
   activo: boolean;
   completado: boolean;
+  // Id del timer de grupo (lote) del que este timer es miembro; el servidor lo descuenta una vez por lote
+  grupoId?: string;
+}
+
+// Sincronización de reloj (PING/PONG): muestras conservadas y periodo entre PING.
+// El periodo debe quedar por debajo de CLOCK_SYNC_MAX_AGE_SECONDS del servidor.
+const CLOCK_SYNC_WINDOW = 8;
+const CLOCK_SYNC_INTERVAL_MS = 30000;
+
+// Un timer de grupo llega con `miembros` y se expande en un timer por TIC con el estado del grupo;
+// las operaciones sobre un miembro (pausar, eliminar) usan su id y el servidor lo separa del grupo.
+// Los timers en curso del TIMER_SYNC llegan sin tiempo restante: se deriva de fechaFin con la
+// hora del servidor estimada (`ahoraServidor`).
+const expandirTimer = (t: any, ahoraServidor: number = Date.now()): Timer[] => {
+  const fechaFin = new Date(t.fechaFin);
+  const base: Timer = {
+    ...t,
+    fechaInicio: new Date(t.fechaInicio),
+    fechaFin,
+    tiempoRestanteSegundos: t.server_remaining_time ?? t.tiempoRestanteSegundos
+      ?? Math.max(0, Math.floor((fechaFin.getTime() - ahoraServidor) / 1000))
+  };
+  if (!Array.isArray(t.miembros)) return [base];
+  return t.miembros.map((m: any) => ({
+    ...base,
+    id: m.id,
+    nombre: m.nombre ?? m.rfid,
+    rfid: m.rfid,
+    inventario_id: m.inventario_id,
+    miembros: undefined,
+    grupoId: t.id
+  }));
+};
+
+// Sustituir en `prev` los timers recibidos; un grupo reemplaza a todos sus miembros anteriores
+const reemplazarTimers = (prev: Timer[], registros: any[]): Timer[] => {
+  const grupos = new Set(registros.filter(r => Array.isArray(r.miembros)).map(r => r.id));
+  const mapa = new Map(prev.filter(p => !(p.grupoId && grupos.has(p.grupoId))).map(p => [p.id, p]));
+  registros.flatMap(r => expandirTimer(r)).forEach(n => mapa.set(n.id, n));
+  return Array.from(mapa.values());
+};
+
+// Selector de las operaciones por lote: se aplican a los timers que coinciden con cualquier criterio
+export interface SeleccionTimers {
+  timerIds?: string[];
+  inventario_ids?: number[];
+  rfids?: string[];
+  lote?: string | string[];
 }
 
 interface TimerContextType {
@@ -21,6 +69,10 @@ interface TimerContextType {
   pausarTimer: (id: string) => void;
   reanudarTimer: (id: string) => void;
   eliminarTimer: (id: string) => void;
+  // Operaciones por lote: un único mensaje y un único TIMERS_UPDATED_BATCH / TIMERS_DELETED_BATCH
+  pausarTimers: (seleccion: SeleccionTimers) => void;
+  reanudarTimers: (seleccion: SeleccionTimers) => void;
+  eliminarTimers: (seleccion: SeleccionTimers) => void;
   formatearTiempo: (segundos: number) => string;
   // Métodos de compatibilidad mínima (creación basada en nombre)
   crearTimer: (nombre: string, tipoOperacion: 'congelamiento' | 'atemperamiento' | 'envio' | 'inspeccion', tiempoMinutos: number) => string | undefined;
@@ -37,6 +89,18 @@ interface TimerProviderProps {
 
 export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
   const [timers, setTimers] = useState<Timer[]>([]);
+  // Modo de tick anunciado por el servidor; en 'local' el cliente descuenta a partir de fechaFin
+  const [tickMode, setTickMode] = useState<string>('batch');
+  // Diferencia (ms) entre el reloj del servidor y el local: aproximada con cada TIMER_SYNC hasta
+  // que hay muestras PING/PONG (t0..t3, estilo NTP); entonces se usa la de menor RTT
+  const serverOffsetRef = useRef<number>(0);
+  const clockSamplesRef = useRef<{ rtt: number; offset: number }[]>([]);
+  // El servidor permite la cuenta atrás local cuando la estimación del desfase es fiable;
+  // entonces deja de enviar a esta conexión los reportes periódicos (solo completaciones)
+  const [localCountdown, setLocalCountdown] = useState<boolean>(false);
+  // Último cambio visto (seq) y epoch de la instancia: permiten pedir solo los deltas perdidos
+  const lastSeqRef = useRef<number | null>(null);
+  const epochRef = useRef<string | null>(null);
   // Fuente única de verdad: servidor. Sin creación optimista.
   
   // WebSocket para comunicación con el backend
@@ -46,7 +110,7 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
       try {
         const u = new URL(apiBase);
         const wsProto = u.protocol === 'https:' ? 'wss:' : 'ws:';
-        return `${wsProto}//${u.host}/ws/timers`;
+        return `${wsProto}//${u.host}/ws/timers?sync=request`;
       } catch {
         // fall through to same-origin
       }
@@ -54,34 +118,71 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
 
     if (typeof window !== 'undefined') {
       const proto = window.location.protocol === 'https:' ? 'wss' : 'ws';
-      return `${proto}://${window.location.host}/ws/timers`;
+      return `${proto}://${window.location.host}/ws/timers?sync=request`;
     }
-    return 'ws://localhost:8006/ws/timers';
+    return 'ws://localhost:8006/ws/timers?sync=request';
   })();
 
   const { isConnected, sendMessage, lastMessage } = useWebSocket(timerWsUrl);
 
-  // Escuchar mensajes del WebSocket
-  useEffect(() => {
-    if (!lastMessage) return;
-  // Debug logs removed (mensaje recibido)
+  // Pedir sincronización indicando el último cambio visto; el servidor responde con
+  // TIMER_DELTA_SYNC (solo lo perdido) o con TIMER_SYNC completo si el hueco es muy antiguo
+  const requestSync = () => {
+    sendMessage({
+      type: 'REQUEST_SYNC',
+      data: lastSeqRef.current !== null ? { since_seq: lastSeqRef.current, epoch: epochRef.current } : {}
+    });
+  };
+
+  // Desfase aproximado con el server_timestamp de un snapshot (ignora la latencia de red)
+  const ajustarDesfase = (serverTimestamp: unknown) => {
+    if (typeof serverTimestamp === 'number' && clockSamplesRef.current.length === 0) {
+      serverOffsetRef.current = serverTimestamp - Date.now();
+    }
+  };
+
+  // PING de sincronización de reloj: lleva la hora de envío (t0) y la última muestra medida
+  const enviarPing = () => {
+    const muestras = clockSamplesRef.current;
+    const ultima = muestras[muestras.length - 1];
+    sendMessage({ type: 'PING', data: { t0: Date.now(), ...(ultima ?? {}) } });
+  };
+
+  // Aplicar un mensaje del servidor al estado (también se usa para los cambios de un TIMER_DELTA_SYNC)
+  const applyServerMessage = (message: { type: string; data: any; seq?: number }) => {
+    if (typeof message.seq === 'number' && (lastSeqRef.current === null || message.seq > lastSeqRef.current)) {
+      lastSeqRef.current = message.seq;
+    }
 
-    switch (lastMessage.type) {
+    switch (message.type) {
       case 'TIMER_SYNC':
-        if (Array.isArray(lastMessage.data.timers)) {
-          setTimers(lastMessage.data.timers.map((t: any) => ({
-            ...t,
-            fechaInicio: new Date(t.fechaInicio),
-            fechaFin: new Date(t.fechaFin),
-            tiempoRestanteSegundos: t.server_remaining_time ?? t.tiempoRestanteSegundos
-          })));
+        ajustarDesfase(message.data.server_timestamp);
+        if (message.data.tick_mode) setTickMode(message.data.tick_mode);
+        if (typeof message.data.seq === 'number') {
+          lastSeqRef.current = message.data.seq;
+          epochRef.current = message.data.epoch ?? null;
         }
+        if (Array.isArray(message.data.timers)) {
+          const ahoraServidor = Date.now() + serverOffsetRef.current;
+          setTimers(message.data.timers.flatMap((t: any) => expandirTimer(t, ahoraServidor)));
+        }
+        break;
+
+      case 'TIMER_DELTA_SYNC':
+        ajustarDesfase(message.data.server_timestamp);
+        if (message.data.tick_mode) setTickMode(message.data.tick_mode);
+        if (Array.isArray(message.data.changes)) {
+          message.data.changes.forEach((change: any) => applyServerMessage(change));
+        }
+        if (typeof message.data.seq === 'number') lastSeqRef.current = message.data.seq;
         break;
 
       case 'TIMER_BATCH_UPDATE':
-        if (Array.isArray(lastMessage.data.updates)) {
+        if (Array.isArray(message.data.updates)) {
+          // Una actualización de un grupo se aplica a todos sus miembros
+          const updates = new Map<string, any>(message.data.updates.map((u: any) => [u.timerId, u]));
           setTimers(prev => prev.map(timer => {
-            const update = lastMessage.data.updates.find((u: any) => u.timerId === timer.id);
+            const update = updates.get(timer.id) ?? (timer.grupoId ? updates.get(timer.grupoId) : undefined);
             if (!update) return timer;
             return {
               ...timer,
@@ -93,50 +194,70 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
         }
         break;
 
+      case 'PONG': {
+        const { t0, t1, t2 } = message.data;
+        if (typeof t0 === 'number' && typeof t1 === 'number' && typeof t2 === 'number') {
+          const t3 = Date.now();
+          const muestras = [...clockSamplesRef.current, {
+            rtt: (t3 - t0) - (t2 - t1),
+            offset: ((t1 - t0) + (t2 - t3)) / 2
+          }].slice(-CLOCK_SYNC_WINDOW);
+          clockSamplesRef.current = muestras;
+          // Filtro de mínimo RTT: la muestra con menor latencia es la de desfase más fiable
+          serverOffsetRef.current = muestras.reduce((a, b) => (b.rtt < a.rtt ? b : a)).offset;
+        }
+        setLocalCountdown(Boolean(message.data.local_countdown));
+        break;
+      }
+
       case 'TIMER_CREATED':
-        if (lastMessage.data.timer) {
-          const t = lastMessage.data.timer;
-          const nuevo: Timer = {
-            ...t,
-            fechaInicio: new Date(t.fechaInicio),
-            fechaFin: new Date(t.fechaFin)
-          };
-          setTimers(prev => prev.find(x => x.id === nuevo.id) ? prev.map(x => x.id === nuevo.id ? nuevo : x) : [...prev, nuevo]);
+      case 'TIMER_UPDATED':
+        if (message.data.timer) {
+          const t = message.data.timer;
+          setTimers(prev => reemplazarTimers(prev, [t]));
         }
         break;
+
       case 'TIMERS_CREATED_BATCH':
-        if (Array.isArray(lastMessage.data.timers)) {
-          const nuevos: Timer[] = lastMessage.data.timers.map((t: any) => ({
-            ...t,
-            fechaInicio: new Date(t.fechaInicio),
-            fechaFin: new Date(t.fechaFin)
-          }));
-          setTimers(prev => {
-            const mapa = new Map(prev.map(p => [p.id, p]));
-            nuevos.forEach(n => mapa.set(n.id, n));
-            return Array.from(mapa.values());
-          });
+      case 'TIMERS_UPDATED_BATCH':
+        if (Array.isArray(message.data.timers)) {
+          const registros = message.data.timers;
+          setTimers(prev => reemplazarTimers(prev, registros));
         }
         break;
 
-      case 'TIMER_UPDATED':
-        if (lastMessage.data.timer) {
-          const t = lastMessage.data.timer;
-            const nuevo: Timer = {
-              ...t,
-              fechaInicio: new Date(t.fechaInicio),
-              fechaFin: new Date(t.fechaFin)
-            };
-            setTimers(prev => prev.find(x => x.id === nuevo.id) ? prev.map(x => x.id === nuevo.id ? nuevo : x) : [...prev, nuevo]);
-        }
+      // Lote de pausa/reanudación/eliminación (y fusiones entre instancias): altas, cambios y
+      // bajas en un solo paso
+      case 'TIMERS_CHANGED_BATCH': {
+        const registros = Array.isArray(message.data.timers) ? message.data.timers : [];
+        const eliminados = new Set<string>(Array.isArray(message.data.timerIds) ? message.data.timerIds : []);
+        setTimers(prev => reemplazarTimers(
+          prev.filter(timer => !eliminados.has(timer.id) && !(timer.grupoId && eliminados.has(timer.grupoId))),
+          registros
+        ));
         break;
+      }
 
       case 'TIMER_DELETED':
-        if (lastMessage.data.timerId) {
-          setTimers(prev => prev.filter(timer => timer.id !== lastMessage.data.timerId));
+        if (message.data.timerId) {
+          const id = message.data.timerId;
+          setTimers(prev => prev.filter(timer => timer.id !== id && timer.grupoId !== id));
+        }
+        break;
+
+      case 'TIMERS_DELETED_BATCH':
+        if (Array.isArray(message.data.timerIds)) {
+          const eliminados = new Set<string>(message.data.timerIds);
+          setTimers(prev => prev.filter(timer => !eliminados.has(timer.id) && !(timer.grupoId && eliminados.has(timer.grupoId))));
         }
         break;
     }
+  };
+
+  // Escuchar mensajes del WebSocket
+  useEffect(() => {
+    if (!lastMessage) return;
+    applyServerMessage(lastMessage);
   }, [lastMessage]);
 
   // Eliminada la detección de completados locales (el servidor es la única fuente de verdad).
@@ -144,13 +265,23 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
   // Solicitar sincronización al conectar
   useEffect(() => {
     if (isConnected) {
-      sendMessage({
-        type: 'REQUEST_SYNC',
-        data: {}
-      });
+      requestSync();
     }
   }, [isConnected, sendMessage]);
 
+  // Sincronización de reloj: ráfaga de PING al conectar y luego uno periódico
+  useEffect(() => {
+    if (!isConnected) return;
+    clockSamplesRef.current = [];
+    setLocalCountdown(false);
+    const rafaga = [0, 1000, 2000].map(ms => setTimeout(enviarPing, ms));
+    const interval = setInterval(enviarPing, CLOCK_SYNC_INTERVAL_MS);
+    return () => {
+      rafaga.forEach(clearTimeout);
+      clearInterval(interval);
+    };
+  }, [isConnected, sendMessage]);
+
   // Creación directa (sin optimismo): esperar evento TIMER_CREATED del servidor.
   const iniciarTimer = (nombre: string, tipoOperacion: Timer['tipoOperacion'], tiempoMinutos: number) => {
     if (isConnected) {
@@ -159,7 +290,7 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
       setTimeout(() => {
         setTimers(prev => prev.some(t => t.nombre === nombre && t.tipoOperacion === tipoOperacion && t.tiempoInicialMinutos === tiempoMinutos)
           ? prev
-          : (sendMessage({ type: 'REQUEST_SYNC', data: {} }), prev)
+          : (requestSync(), prev)
         );
       }, 2500);
     }
@@ -170,7 +301,7 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
     if (isConnected) {
       const timersData = nombres.map(nombre => ({ nombre, tipoOperacion, tiempoInicialMinutos: tiempoMinutos }));
       sendMessage({ type: 'CREATE_TIMERS_BATCH', data: { timers: timersData } });
-      setTimeout(() => sendMessage({ type: 'REQUEST_SYNC', data: {} }), 2500);
+      setTimeout(() => requestSync(), 2500);
     }
   };
 
@@ -180,6 +311,12 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
 
   const eliminarTimer = (id: string) => { if (isConnected) sendMessage({ type: 'DELETE_TIMER', data: { timerId: id } }); };
 
+  const pausarTimers = (seleccion: SeleccionTimers) => { if (isConnected) sendMessage({ type: 'PAUSE_TIMERS_BATCH', data: seleccion }); };
+
+  const reanudarTimers = (seleccion: SeleccionTimers) => { if (isConnected) sendMessage({ type: 'RESUME_TIMERS_BATCH', data: seleccion }); };
+
+  const eliminarTimers = (seleccion: SeleccionTimers) => { if (isConnected) sendMessage({ type: 'DELETE_TIMERS_BATCH', data: seleccion }); };
+
   // Métodos legacy eliminados: marcarTimersCompletados, recentCompletions, forceClear.
 
   const formatearTiempo = (segundos: number): string => {
@@ -212,11 +349,27 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
     return timers.filter(t => t.completado);
   };
 
+  // Forzar siempre el snapshot completo (sin since_seq)
   const forzarSincronizacion = (): void => { if (isConnected) sendMessage({ type: 'REQUEST_SYNC', data: {} }); };
 
   // Eliminado soporte de getRecentCompletion / getRecentCompletionById.
 
-  // Eliminado: tick local. El servidor envía TIMER_BATCH_UPDATE cada segundo.
+  // Tick local salvo en modo 'per_timer' (el servidor envía un frame por timer y segundo).
+  // En modo 'batch' el servidor reporta según la cadencia de cada timer (cada 60 s / 10 s / 1 s
+  // según lo que falte); entre reportes la cuenta atrás se interpola aquí con fechaFin. Con
+  // cuenta atrás local permitida el servidor solo envía las completaciones.
+  useEffect(() => {
+    if (tickMode === 'per_timer' && !localCountdown) return;
+    const interval = setInterval(() => {
+      const ahoraServidor = Date.now() + serverOffsetRef.current;
+      setTimers(prev => prev.map(t => {
+        if (!t.activo || t.completado) return t;
+        const restante = Math.max(0, Math.floor((t.fechaFin.getTime() - ahoraServidor) / 1000));
+        return restante === t.tiempoRestanteSegundos ? t : { ...t, tiempoRestanteSegundos: restante };
+      }));
+    }, 1000);
+    return () => clearInterval(interval);
+  }, [tickMode, localCountdown]);
 
   // Eliminado: reconciliación de timers optimistas (no se usan temporales locales).
 
@@ -228,6 +381,9 @@ export const TimerProvider: React.FC<TimerProviderProps> = ({ children }) => {
     pausarTimer,
     reanudarTimer,
     eliminarTimer,
+    pausarTimers,
+    reanudarTimers,
+    eliminarTimers,
   formatearTiempo,
   // Exponer shims de compatibilidad
   crearTimer,
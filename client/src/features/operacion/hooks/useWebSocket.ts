@@ -1,4 +1,5 @@
 import { useEffect, useRef, useState } from 'react';
+import { withAuthToken } from '../../../hooks/useWebSocket';
 
 interface WebSocketMessage {
   type: 'activity_created' | 'inventory_updated' | 'timer_completed';
@@ -28,7 +29,7 @@ export const useWebSocket = (onMessage?: (message: WebSocketMessage) => void) =>
       
   // Debug log removed: connecting websocket
       
-      wsRef.current = new WebSocket(wsUrl);
+      wsRef.current = new WebSocket(withAuthToken(wsUrl));
       
       wsRef.current.onopen = () => {
   // Debug log removed: websocket connected
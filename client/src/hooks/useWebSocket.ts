@@ -3,6 +3,8 @@ import { useState, useEffect, useRef } from 'react';
 interface WebSocketMessage {
   type: string;
   data: any;
+  // Secuencia de los cambios de estado de timers (reanudación delta)
+  seq?: number;
 }
 
 interface UseWebSocketReturn {
@@ -11,6 +13,15 @@ interface UseWebSocketReturn {
   lastMessage: WebSocketMessage | null;
 }
 
+// /ws/timers autentica con el JWT (query ?token=) para unir la conexión a la sala de su tenant.
+// Se lee en cada intento de conexión para que las reconexiones usen el token vigente.
+export const withAuthToken = (url: string): string => {
+  const token = typeof localStorage !== 'undefined' ? localStorage.getItem('accessToken') : null;
+  if (!token) return url;
+  const sep = url.includes('?') ? '&' : '?';
+  return `${url}${sep}token=${encodeURIComponent(token)}`;
+};
+
 export const useWebSocket = (url: string): UseWebSocketReturn => {
   const [isConnected, setIsConnected] = useState(false);
   const [lastMessage, setLastMessage] = useState<WebSocketMessage | null>(null);
@@ -28,7 +39,7 @@ export const useWebSocket = (url: string): UseWebSocketReturn => {
       isReconnecting.current = true;
   // Debug log removed: attempting websocket connect
       
-      ws.current = new WebSocket(url);
+      ws.current = new WebSocket(withAuthToken(url));
 
       ws.current.onopen = () => {
         // Solo log inicial importante si es la primera conexión
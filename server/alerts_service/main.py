@@ -1,14 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict
 from datetime import datetime
 import asyncio
 import logging
 
-from shared.database import get_db
+from shared.database import (
+    dispose_async_engine,
+    get_async_db,
+    get_async_engine,
+    pool_metrics_text,
+    pool_status,
+    prewarm_async_pool,
+)
 from shared.models import Alerta
 from shared.message_queue import message_queue, publish_alert_created
+from shared.queries import consulta
+from shared.tenant_db import get_async_tenant_db
+from shared.timer_completions import (
+    TIMER_COMPLETED_BATCH_SIZE,
+    TIMER_COMPLETED_DEDUP_SIZE,
+    MicroBatcher,
+    completion_key,
+    expand_completion,
+)
+from shared.timer_store import _safe_schema
 from shared.utils import get_current_user_from_token
 from .schemas import AlertaCreate, AlertaUpdate, Alerta as AlertaSchema
 
@@ -34,6 +53,11 @@ def get_tenant_schema(current_user: Dict[str, Any]) -> str:
 @app.on_event("startup")
 async def startup_event():
     """Inicializar conexión a RabbitMQ y consumidores"""
+    try:
+        await prewarm_async_pool()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo precalentar el pool de DB: {e}")
+    
     max_retries = 5
     retry_delay = 3
     
@@ -59,122 +83,166 @@ async def startup_event():
 async def shutdown_event():
     """Cerrar conexión a RabbitMQ"""
     await message_queue.disconnect()
+    await dispose_async_engine()
     logger.info("🛑 Servicio de Alertas detenido")
 
 # --- Funciones para manejar eventos ---
 
 async def consume_timer_completed_events():
-    """Consumir eventos de timer completado"""
+    """Consumir eventos de timer completado en micro-lotes"""
+    batcher = MicroBatcher(create_timer_completed_alerts)
+
     async def handle_timer_completed(message_data):
+        if message_data.get("event_type") != "timer_completed":
+            return
+        timer_data = message_data.get("timer") or {}
         try:
-            timer_data = message_data.get("timer", {})
-            event_type = message_data.get("event_type")
-            
-            if event_type == "timer_completed":
-                await create_timer_completed_alert(timer_data)
-                
+            _safe_schema(timer_data.get("tenant") or "tenant_base")
+        except ValueError as e:
+            # Nunca se podrá procesar: se confirma y se descarta en lugar de reintentarlo
+            logger.error(f"❌ Evento de timer completado descartado: {e}")
+            return
+        try:
+            await batcher.submit(timer_data)
         except Exception as e:
             logger.error(f"❌ Error procesando evento de timer completado: {e}")
-    
-    await message_queue.consume_messages("timer_completed", handle_timer_completed)
+            # Se reintenta un número acotado de veces (ver consume_messages)
+            raise
+    
+    await message_queue.consume_messages(
+        "timer_completed",
+        handle_timer_completed,
+        prefetch_count=TIMER_COMPLETED_BATCH_SIZE,
+        requeue=True,
+    )
 
-async def create_timer_completed_alert(timer_data):
-    """Crear alerta cuando se completa un timer"""
-    try:
-        # Obtener sesión de base de datos
-        db = next(get_db())
-        
-        # Para alertas automáticas, obtener tenant del contexto del timer o usar tenant_base por defecto
-        # En el futuro esto debería venir del contexto del usuario que activó el timer
-        tenant_schema = timer_data.get("tenant", "tenant_base")  # Mejorado: obtener del contexto
-        logger.info(f"📍 Creando alerta automática para tenant: {tenant_schema}")
-        logger.info(f"🔍 Datos del timer recibidos: {timer_data}")
-        
-        # Determinar tipo de alerta basado en el tipo de operación
-        tipo_operacion = timer_data.get("tipoOperacion", "")
-        rfid = timer_data.get("nombre", "")
-        
-        if tipo_operacion == "atemperamiento":
-            tipo_alerta = "TIMER_ATEMPERAMIENTO_COMPLETADO"
-            descripcion = f"Timer de atemperamiento completado para TIC {rfid}. Transición automática a Acondicionamiento."
-        elif tipo_operacion == "congelamiento":
-            tipo_alerta = "TIMER_CONGELAMIENTO_COMPLETADO" 
-            descripcion = f"Timer de congelamiento completado para TIC {rfid}. Requiere acción manual para mover a Atemperamiento."
-        else:
-            tipo_alerta = "TIMER_COMPLETADO"
-            descripcion = f"Timer completado para TIC {rfid}"
-        
-        # Buscar inventario_id por RFID (esto podría requerir consulta al servicio de inventario)
-        # Por simplicidad, lo dejamos como None por ahora
-        inventario_id = None
+# Completaciones ya convertidas en alerta (la cola es at-least-once)
+_completaciones_procesadas: "OrderedDict[Any, None]" = OrderedDict()
+
+def _alerta_timer_completado(timer_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Tipo y descripción de la alerta según el tipo de operación del timer"""
+    tipo_operacion = timer_data.get("tipoOperacion", "")
+    rfid = timer_data.get("rfid") or timer_data.get("nombre", "")
+    
+    if tipo_operacion == "atemperamiento":
+        tipo_alerta = "TIMER_ATEMPERAMIENTO_COMPLETADO"
+        descripcion = f"Timer de atemperamiento completado para TIC {rfid}. Transición automática a Acondicionamiento."
+    elif tipo_operacion == "congelamiento":
+        tipo_alerta = "TIMER_CONGELAMIENTO_COMPLETADO" 
+        descripcion = f"Timer de congelamiento completado para TIC {rfid}. Requiere acción manual para mover a Atemperamiento."
+    else:
+        tipo_alerta = "TIMER_COMPLETADO"
+        descripcion = f"Timer completado para TIC {rfid}"
+    return {
+        "inventario_id": timer_data.get("inventario_id"),
+        "tipo_alerta": tipo_alerta,
+        "descripcion": descripcion,
+        "rfid": rfid,
+    }
+
+async def _insertar_alertas_tenant(schema: str, alertas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resolver inventario_id por RFID e insertar las alertas de un tenant: una consulta y un
+    INSERT multi-fila en su propia transacción"""
+    creadas: List[Dict[str, Any]] = []
+    async with get_async_engine().begin() as conn:
+        rfids = sorted({a["rfid"] for a in alertas if a["inventario_id"] is None and a["rfid"]})
+        if rfids:
+            rows = (await conn.execute(
+                text(f"SELECT rfid, id FROM {schema}.inventario_credocubes WHERE rfid = ANY(:rfids)"),
+                {"rfids": rfids},
+            )).fetchall()
+            ids_por_rfid = {r[0]: r[1] for r in rows}
+            for alerta in alertas:
+                if alerta["inventario_id"] is None:
+                    alerta["inventario_id"] = ids_por_rfid.get(alerta["rfid"])
         
-        # Crear alerta en el esquema del tenant
-        insert_query = f"""
-            INSERT INTO {tenant_schema}.alertas (inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta)
-            VALUES (:inventario_id, :tipo_alerta, :descripcion, NOW(), false)
+        values = []
+        params: Dict[str, Any] = {}
+        for i, alerta in enumerate(alertas):
+            values.append(f"(:inventario_id_{i}, :tipo_alerta_{i}, :descripcion_{i}, NOW(), false)")
+            params[f"inventario_id_{i}"] = alerta["inventario_id"]
+            params[f"tipo_alerta_{i}"] = alerta["tipo_alerta"]
+            params[f"descripcion_{i}"] = alerta["descripcion"]
+        result = await conn.execute(text(f"""
+            INSERT INTO {schema}.alertas (inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta)
+            VALUES {", ".join(values)}
             RETURNING id
-        """
-        
-        result = db.execute(text(insert_query), {
-            "inventario_id": inventario_id,
-            "tipo_alerta": tipo_alerta,
-            "descripcion": descripcion
-        })
-        
-        db.commit()
-        nueva_alerta_id = result.fetchone()[0]
-        
-        logger.info(f"✅ Alerta creada para timer completado: {nueva_alerta_id}")
-        
-        # Publicar evento de alerta creada
+        """), params)
+        for alerta, row in zip(alertas, result.fetchall()):
+            creadas.append({**alerta, "id": row[0], "tenant": schema})
+    return creadas
+
+async def create_timer_completed_alerts(timers: List[Dict[str, Any]]) -> Dict[int, BaseException]:
+    """Crear las alertas de un micro-lote de timers completados.
+
+    Las completaciones repetidas se descartan y un timer de grupo genera una alerta por TIC.
+    Cada tenant se inserta en su propia transacción: si uno falla, solo sus eventos se
+    devuelven como fallidos (posición en el lote -> excepción) y los demás se confirman.
+    """
+    nuevos: List[int] = []
+    for i, timer_data in enumerate(timers):
+        key = completion_key(timer_data)
+        if key in _completaciones_procesadas:
+            continue
+        _completaciones_procesadas[key] = None
+        nuevos.append(i)
+    while len(_completaciones_procesadas) > TIMER_COMPLETED_DEDUP_SIZE:
+        _completaciones_procesadas.popitem(last=False)
+    if not nuevos:
+        return {}
+    
+    por_tenant: Dict[str, List[Dict[str, Any]]] = {}
+    posiciones: Dict[str, List[int]] = {}
+    for i in nuevos:
+        timer_data = timers[i]
+        tenant_schema = _safe_schema(timer_data.get("tenant") or "tenant_base")
+        posiciones.setdefault(tenant_schema, []).append(i)
+        for registro in expand_completion(timer_data):
+            por_tenant.setdefault(tenant_schema, []).append(_alerta_timer_completado(registro))
+    
+    creadas: List[Dict[str, Any]] = []
+    fallidos: Dict[int, BaseException] = {}
+    for tenant_schema, alertas in por_tenant.items():
+        try:
+            creadas.extend(await _insertar_alertas_tenant(tenant_schema, alertas))
+        except Exception as e:
+            # Sin alertas: permitir que un reenvío de los mismos eventos las cree
+            for i in posiciones[tenant_schema]:
+                _completaciones_procesadas.pop(completion_key(timers[i]), None)
+                fallidos[i] = e
+            logger.error(f"❌ Error creando alertas de {len(posiciones[tenant_schema])} timers completados en {tenant_schema}: {e}")
+    
+    logger.info(f"✅ {len(creadas)} alertas creadas para {len(nuevos) - len(fallidos)} timers completados ({len(por_tenant)} tenants)")
+    
+    # Publicar evento de alerta creada
+    timestamp = datetime.now().isoformat()
+    for alerta in creadas:
         await publish_alert_created({
-            "id": nueva_alerta_id,
-            "tipo_alerta": tipo_alerta,
-            "descripcion": descripcion,
-            "rfid": rfid,
-            "timestamp": datetime.now().isoformat()
+            "id": alerta["id"],
+            "tipo_alerta": alerta["tipo_alerta"],
+            "descripcion": alerta["descripcion"],
+            "rfid": alerta["rfid"],
+            "inventario_id": alerta["inventario_id"],
+            "tenant": alerta["tenant"],
+            "timestamp": timestamp
         })
-        
-        db.close()
-        
-    except Exception as e:
-        logger.error(f"❌ Error creando alerta para timer completado: {e}")
+    return fallidos
 
 # --- Endpoints para Alertas ---
 
 # Obtener todas las alertas
 @app.get("/alertas/", response_model=List[AlertaSchema])
-def get_alertas(
+async def get_alertas(
     inventario_id: Optional[int] = None, 
     resuelta: Optional[bool] = None, 
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
-    tenant_schema = get_tenant_schema(current_user)
-    
-    # Construir consulta SQL con el esquema del tenant
-    base_query = f"""
-        SELECT id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion
-        FROM {tenant_schema}.alertas
-        WHERE 1=1
-    """
-    
-    params = {}
-    if inventario_id is not None:
-        base_query += " AND inventario_id = :inventario_id"
-        params["inventario_id"] = inventario_id
-    
-    if resuelta is not None:
-        base_query += " AND resuelta = :resuelta"
-        params["resuelta"] = resuelta
-        
-    base_query += " ORDER BY fecha_creacion DESC OFFSET :skip LIMIT :limit"
-    params["skip"] = skip
-    params["limit"] = limit
-    
-    result = db.execute(text(base_query), params)
+    # Filtros opcionales: None = sin filtro (misma sentencia para cualquier combinación)
+    params = {"inventario_id": inventario_id, "resuelta": resuelta, "skip": skip, "limit": limit}
+    result = await db.execute(consulta("alertas.listado"), params)
     alertas = result.fetchall()
     
     # Convertir resultados a formato de respuesta
@@ -194,20 +262,12 @@ def get_alertas(
 
 # Obtener una alerta por ID
 @app.get("/alertas/{alerta_id}", response_model=AlertaSchema)
-def get_alerta(
+async def get_alerta(
     alerta_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
-    tenant_schema = get_tenant_schema(current_user)
-    
-    query = f"""
-        SELECT id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion
-        FROM {tenant_schema}.alertas
-        WHERE id = :alerta_id
-    """
-    
-    result = db.execute(text(query), {"alerta_id": alerta_id})
+    result = await db.execute(consulta("alertas.por_id"), {"id": alerta_id})
     alerta = result.fetchone()
     
     if alerta is None:
@@ -228,27 +288,19 @@ def get_alerta(
 
 # Crear una nueva alerta
 @app.post("/alertas/", response_model=AlertaSchema, status_code=status.HTTP_201_CREATED)
-def create_alerta(
+async def create_alerta(
     alerta: AlertaCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
-    tenant_schema = get_tenant_schema(current_user)
-    
-    # Insertar la nueva alerta en el esquema del tenant
-    query = f"""
-        INSERT INTO {tenant_schema}.alertas (inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta)
-        VALUES (:inventario_id, :tipo_alerta, :descripcion, NOW(), false)
-        RETURNING id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion
-    """
-    
-    result = db.execute(text(query), {
+    # Insertar la nueva alerta en el esquema del tenant (search_path de la sesión)
+    result = await db.execute(consulta("alertas.insertar"), {
         "inventario_id": alerta.inventario_id,
         "tipo_alerta": alerta.tipo_alerta,
         "descripcion": alerta.descripcion
     })
     
-    db.commit()
+    await db.commit()
     nueva_alerta = result.fetchone()
     
     return {
@@ -263,20 +315,14 @@ def create_alerta(
 
 # Actualizar una alerta (ej. para marcarla como resuelta)
 @app.put("/alertas/{alerta_id}", response_model=AlertaSchema)
-def update_alerta(
+async def update_alerta(
     alerta_id: int, 
     alerta: AlertaUpdate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
-    tenant_schema = get_tenant_schema(current_user)
-    
     # Primero verificar que la alerta existe
-    check_query = f"""
-        SELECT id FROM {tenant_schema}.alertas WHERE id = :alerta_id
-    """
-    
-    result = db.execute(text(check_query), {"alerta_id": alerta_id})
+    result = await db.execute(consulta("alertas.existe"), {"id": alerta_id})
     if result.fetchone() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -299,23 +345,19 @@ def update_alerta(
     
     if not update_fields:
         # No hay nada que actualizar, devolver la alerta actual
-        get_query = f"""
-            SELECT id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion
-            FROM {tenant_schema}.alertas WHERE id = :alerta_id
-        """
-        result = db.execute(text(get_query), {"alerta_id": alerta_id})
+        result = await db.execute(consulta("alertas.por_id"), {"id": alerta_id})
         alerta_actual = result.fetchone()
     else:
         # Realizar la actualización
         update_query = f"""
-            UPDATE {tenant_schema}.alertas 
+            UPDATE alertas 
             SET {', '.join(update_fields)}
             WHERE id = :alerta_id
             RETURNING id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion
         """
         
-        result = db.execute(text(update_query), params)
-        db.commit()
+        result = await db.execute(text(update_query), params)
+        await db.commit()
         alerta_actual = result.fetchone()
     
     return {
@@ -330,21 +372,13 @@ def update_alerta(
 
 # Eliminar una alerta
 @app.delete("/alertas/{alerta_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_alerta(
+async def delete_alerta(
     alerta_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
-    tenant_schema = get_tenant_schema(current_user)
-    
     # Verificar que la alerta existe y eliminarla
-    delete_query = f"""
-        DELETE FROM {tenant_schema}.alertas 
-        WHERE id = :alerta_id
-        RETURNING id
-    """
-    
-    result = db.execute(text(delete_query), {"alerta_id": alerta_id})
+    result = await db.execute(consulta("alertas.eliminar"), {"id": alerta_id})
     deleted_alerta = result.fetchone()
     
     if deleted_alerta is None:
@@ -353,7 +387,7 @@ def delete_alerta(
             detail="Alerta no encontrada"
         )
     
-    db.commit()
+    await db.commit()
     return None
 
 # Endpoint para verificar salud del servicio
@@ -361,6 +395,13 @@ def delete_alerta(
 def health_check():
     return {"status": "ok", "service": "alerts_service"}
 
+# Estado del pool de conexiones a la base de datos
+@app.get("/metrics/db-pool")
+def db_pool_metrics(formato: str = Query("json", description="json | prometheus")):
+    if formato == "prometheus":
+        return PlainTextResponse(pool_metrics_text("alerts_service"))
+    return pool_status()
+
 # Endpoint de debug para verificar tenant del usuario
 @app.get("/debug/tenant")
 def debug_tenant(current_user: Dict[str, Any] = Depends(get_current_user_from_token)):
@@ -382,8 +423,8 @@ if __name__ == "__main__":
 
 # Endpoint de debug para verificar consultas SQL por tenant
 @app.get("/debug/query")
-def debug_query_info(
-    db: Session = Depends(get_db),
+async def debug_query_info(
+    db: AsyncSession = Depends(get_async_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     tenant_schema = get_tenant_schema(current_user)
@@ -393,13 +434,13 @@ def debug_query_info(
     tenant_brandon_query = "SELECT id, descripcion FROM tenant_brandon.alertas ORDER BY id"
     
     try:
-        tenant_base_result = db.execute(text(tenant_base_query)).fetchall()
+        tenant_base_result = (await db.execute(text(tenant_base_query))).fetchall()
         tenant_base_alerts = [{"id": r[0], "descripcion": r[1]} for r in tenant_base_result]
     except Exception as e:
         tenant_base_alerts = f"Error: {str(e)}"
     
     try:
-        tenant_brandon_result = db.execute(text(tenant_brandon_query)).fetchall()
+        tenant_brandon_result = (await db.execute(text(tenant_brandon_query))).fetchall()
         tenant_brandon_alerts = [{"id": r[0], "descripcion": r[1]} for r in tenant_brandon_result]
     except Exception as e:
         tenant_brandon_alerts = f"Error: {str(e)}"
@@ -408,7 +449,7 @@ def debug_query_info(
     user_query = f"SELECT id, descripcion FROM {tenant_schema}.alertas ORDER BY id"
     
     try:
-        user_result = db.execute(text(user_query)).fetchall()
+        user_result = (await db.execute(text(user_query))).fetchall()
         user_alerts = [{"id": r[0], "descripcion": r[1]} for r in user_result]
     except Exception as e:
         user_alerts = f"Error: {str(e)}"
@@ -425,23 +466,14 @@ def debug_query_info(
 
 # Endpoint para obtener estadísticas por tenant
 @app.get("/estadisticas/")
-def get_estadisticas_alertas(
-    db: Session = Depends(get_db),
+async def get_estadisticas_alertas(
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     tenant_schema = get_tenant_schema(current_user)
     
     # Obtener estadísticas del tenant actual
-    stats_query = f"""
-        SELECT 
-            COUNT(*) as total,
-            COUNT(CASE WHEN resuelta = false THEN 1 END) as pendientes,
-            COUNT(CASE WHEN resuelta = true THEN 1 END) as resueltas,
-            COUNT(CASE WHEN fecha_creacion >= NOW() - INTERVAL '24 hours' THEN 1 END) as ultimas_24h
-        FROM {tenant_schema}.alertas
-    """
-    
-    result = db.execute(text(stats_query))
+    result = await db.execute(consulta("alertas.estadisticas"))
     stats = result.fetchone()
     
     return {
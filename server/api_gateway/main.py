@@ -1,11 +1,12 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Body, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Dict, Any, Set
+from typing import Iterable, List, Optional, Dict, Any, Set, Tuple
 from pydantic import BaseModel, Field
 import json
 import asyncio
@@ -57,10 +58,24 @@ class Timer(BaseModel):
     fechaFin: datetime
     activo: bool = True
     completado: bool = False
+    # Vínculos opcionales con el inventario y el tenant dueño del timer
+    tenant: Optional[str] = None
+    rfid: Optional[str] = None
+    inventario_id: Optional[int] = None
+    # Versión de la última escritura (fusión last-writer-wins entre instancias)
+    version: int = 0
+    # Timer de grupo (lote): un registro por TIC {"id", "rfid", "inventario_id", "nombre"} que
+    # comparte el estado del grupo; None en los timers individuales
+    miembros: Optional[List[Dict[str, Any]]] = None
 
-    # Ignorar campos extra (para permitir payloads enriquecidos como rfid, inventario_id)
+    # Ignorar campos extra no modelados
     model_config = {"extra": "ignore"}
 
+    @property
+    def fin_ms(self) -> int:
+        """fechaFin en epoch ms (misma interfaz que CompactTimer)."""
+        return int(self.fechaFin.timestamp() * 1000)
+
     def to_dict(self) -> Dict[str, Any]:
         """Representación serializable (fechas en ISO)."""
         return {
@@ -73,10 +88,38 @@ class Timer(BaseModel):
             "fechaFin": self.fechaFin.isoformat() if isinstance(self.fechaFin, datetime) else self.fechaFin,
             "activo": self.activo,
             "completado": self.completado,
+            "tenant": self.tenant,
+            "rfid": self.rfid,
+            "inventario_id": self.inventario_id,
+            "version": self.version,
+            **({"miembros": self.miembros} if self.miembros is not None else {}),
         }
 
-from shared.database import get_db, get_engine
-from shared.message_queue import message_queue
+from shared.database import get_db, get_engine, pool_metrics_text, pool_status, prewarm_pool
+from shared.message_queue import message_queue, publish_timer_completed
+from shared.queries import consulta
+from shared.tenant_db import get_tenant_db
+from shared.ws_fanout import WebSocketFanout, encode_message
+from shared.timer_scheduler import CompletionScheduler
+from shared.timer_journal import TimerJournal
+from shared.timer_store import PostgresTimerStore
+from shared.timer_compact import CompactTimer
+from shared.timer_sync_cache import TimerSyncCache
+from shared.timer_cadence import CadencePolicy
+from shared.timer_selector import BATCH_ACTIONS, TimerSelector
+from shared.timer_index import ESTADOS, IndexedTimers, decode_cursor, encode_cursor
+from shared.timer_archive import (
+    TIMER_ARCHIVE_STORED_INTERVAL_SECONDS,
+    TIMER_RETENTION_INTERVAL_SECONDS,
+    TimerRetention,
+    build_timer_archive,
+)
+from shared.clock_sync import ClockSyncState
+from shared.timer_completions import TIMER_COMPLETED_PUBLISH, TimerCompletionPublisher
+from shared.timer_transitions import CompletionTransitions
+from shared.timer_versions import TimerTombstones, TimerVersionClock, diff_digest, is_newer
+from shared.timer_changelog import TimerChangeLog
+from shared.timer_membership import ClusterMembership
 from shared.utils import verify_password, get_password_hash, create_access_token, get_current_user_from_token
 from api_gateway.models import Usuario
 from api_gateway.schemas import UsuarioCreate, Usuario as UsuarioModel, UsuarioSchema, Token, LoginRequest, UsuarioUpdate
@@ -84,21 +127,6 @@ from api_gateway.schemas import UsuarioCreate, Usuario as UsuarioModel, UsuarioS
 # Instancia global del timer manager (se define más abajo)
 # timer_manager se inicializa después de la clase TimerManager completa
 
-# Funciones de validación
-
-def get_tenant_schemas(db: Session) -> List[str]:
-    """Obtener lista de schemas de inquilinos"""
-    try:
-        result = db.execute(text("""
-            SELECT schema_name 
-            FROM information_schema.schemata 
-            WHERE schema_name NOT IN ('information_schema', 'pg_catalog', 'pg_toast', 'public')
-        """))
-        return [row[0] for row in result.fetchall()]
-    except Exception as e:
-        print(f"Error obteniendo schemas de inquilinos: {e}")
-        return []
-
 # Funciones de validación
 def validate_token(token: str) -> Dict:
     """Validar token JWT y extraer información del usuario"""
@@ -237,10 +265,52 @@ def cors_config():
 
 # Archivo de persistencia para timers
 TIMERS_FILE = "timers_data.json"
+# Diario de cambios de solo anexado; se compacta periódicamente en TIMERS_FILE
+TIMERS_JOURNAL_FILE = os.getenv("TIMERS_JOURNAL_FILE", "timers_journal.jsonl")
+# Backend de persistencia de timers: "journal" (archivo local) o "postgres" (tabla timers por tenant)
+TIMER_PERSISTENCE = os.getenv("TIMER_PERSISTENCE", "journal").strip().lower()
+# "true": los timers en memoria son registros compactos (__slots__, fechas en epoch ms) y
+# Pydantic solo valida los timers que entran por la API (WebSocket / REST)
+TIMER_COMPACT_STORE = os.getenv("TIMER_COMPACT_STORE", "false").strip().lower() in ("1", "true", "yes", "y")
+
+# Modo de emisión del tick de timers:
+#  - "batch": un único TIMER_BATCH_UPDATE por tick con solo los timers que cambiaron (por defecto)
+#  - "per_timer": un TIMER_TIME_UPDATE por timer activo en cada tick (comportamiento legado)
+#  - "local": sin frames por segundo; el cliente cuenta con fechaFin + server_timestamp y
+#    el servidor solo envía cambios de estado (completaciones, pausas, etc.)
+TIMER_TICK_MODE = os.getenv("TIMER_TICK_MODE", "batch").strip().lower()
+# Espera mínima entre despertares del tick (evita girar en vacío alrededor de una completación)
+TIMER_TICK_MIN_SLEEP_SECONDS = float(os.getenv("TIMER_TICK_MIN_SLEEP_SECONDS", "0.01"))
+
+# Timers de grupo: iniciar_timers_masivo crea un único timer por lote (con un miembro por TIC)
+# cuando el lote tiene al menos TIMER_GROUP_MIN_MEMBERS items; "false" crea un timer por item
+TIMER_GROUPS_ENABLED = os.getenv("TIMER_GROUPS_ENABLED", "true").strip().lower() in ("1", "true", "yes", "y")
+TIMER_GROUP_MIN_MEMBERS = int(os.getenv("TIMER_GROUP_MIN_MEMBERS", "2"))
+
+# Tamaño de página por defecto y máximo de GET /api/timers (y máximo de RFIDs en /api/timers/lookup)
+TIMER_QUERY_PAGE_SIZE = int(os.getenv("TIMER_QUERY_PAGE_SIZE", "200"))
+TIMER_QUERY_MAX_PAGE_SIZE = int(os.getenv("TIMER_QUERY_MAX_PAGE_SIZE", "1000"))
+
+# /ws/timers exige el JWT (query ?token= o cabecera Authorization) para unirse a la sala del tenant.
+# Con "false" las conexiones sin token se aceptan en la sala del tenant por defecto (transición).
+WS_TIMERS_REQUIRE_AUTH = os.getenv("WS_TIMERS_REQUIRE_AUTH", "true").strip().lower() in ("1", "true", "yes", "y")
 
 # Configurar logging específico para timers
 timer_logger = logging.getLogger("timer_service")
 
+
+def timer_from_input(data: Dict[str, Any]):
+    """Validar con Pydantic un timer recibido por la API y pasarlo a la representación en memoria."""
+    timer = Timer(**data)
+    return CompactTimer.from_model(timer) if TIMER_COMPACT_STORE else timer
+
+
+def timer_from_record(data: Dict[str, Any]):
+    """Timer en memoria desde un registro interno ya validado (store, MQ, fusión entre instancias)."""
+    if TIMER_COMPACT_STORE:
+        return CompactTimer.from_dict(data)
+    return Timer(**data)
+
 class WebSocketMessage(BaseModel):
     type: str
     data: Dict
@@ -261,129 +331,538 @@ class TimerCompletedEvent(BaseModel):
 # Estado global de timers y conexiones
 class TimerManager:
     def __init__(self):
-        self.timers: Dict[str, Timer] = {}
+        # Índices secundarios (rfid, inventario_id, tipo, tenant, estado) para las consultas REST y el sync por tenant
+        self.timers: IndexedTimers = IndexedTimers(self.timer_tenant)
         self.connections: Set[WebSocket] = set()
+        # Salas por tenant: cada conexión solo recibe los eventos de los timers de su tenant
+        self.rooms: Dict[str, Set[WebSocket]] = {}
+        self.connection_tenants: Dict[WebSocket, str] = {}
+        self.fanout = WebSocketFanout()
+        # Sincronización de reloj por conexión (PING/PONG): decide si puede descontar en local
+        self.clock_sync: Dict[WebSocket, ClockSyncState] = {}
+        self.scheduler = CompletionScheduler()
         self.running = True
         self.instance_id = str(uuid.uuid4())
-        # Cargar timers existentes al inicializar
-        self.load_timers_from_file()
+        # Secuencia de cambios para reanudación delta (REQUEST_SYNC con since_seq)
+        self.changelog = TimerChangeLog(epoch=self.instance_id)
+        # Reparto de timers entre instancias: solo el dueño de un timer lo descuenta y lo completa
+        self.membership = ClusterMembership(self.instance_id, message_queue, on_change=self.rebalance, role="api_gateway")
+        # Versiones por timer y lápidas de eliminados para fusionar el estado con otras instancias
+        self.clock = TimerVersionClock(self.instance_id)
+        self.tombstones = TimerTombstones()
+        # Lista de timers del TIMER_SYNC ya serializada por tenant; se invalida con cada mutación
+        self.sync_cache = TimerSyncCache(self.sync_records)
+        # Cadencia de reporte del tiempo restante (por tenant) y último valor reportado de cada timer
+        self.cadence = CadencePolicy()
+        self.reported_remaining: Dict[str, int] = {}
+        # Completaciones propias pendientes de publicar en la cola timer_completed (sin duplicados)
+        self.completions = TimerCompletionPublisher(publish_timer_completed)
+        # Transición de estado del inventario de los items cuyos timers completa esta instancia
+        self.transitions = CompletionTransitions(get_engine)
+        # Retención: los completados vencidos (TTL / máximo por tenant) salen de memoria al archivo
+        self.retention = TimerRetention()
+        if TIMER_PERSISTENCE == "postgres":
+            self.store = PostgresTimerStore(get_engine, default_tenant=DEFAULT_TENANT_SCHEMA)
+        else:
+            self.store = TimerJournal(TIMERS_FILE, TIMERS_JOURNAL_FILE, snapshot_provider=self.snapshot_for_persistence)
+        self.archive = build_timer_archive(TIMER_PERSISTENCE, get_engine, DEFAULT_TENANT_SCHEMA)
+        self.evicted = 0
 
     def get_server_timestamp(self) -> int:
         return int(get_utc_now().timestamp() * 1000)
         
-    def save_timers_to_file(self):
-        """Guardar timers en archivo JSON"""
-        try:
-            timers_data = {}
-            for timer_id, timer in self.timers.items():
-                timers_data[timer_id] = {
-                    "id": timer.id,
-                    "nombre": timer.nombre,
-                    "tipoOperacion": timer.tipoOperacion,
-                    "tiempoInicialMinutos": timer.tiempoInicialMinutos,
-                    "tiempoRestanteSegundos": timer.tiempoRestanteSegundos,
-                    "fechaInicio": timer.fechaInicio.isoformat(),
-                    "fechaFin": timer.fechaFin.isoformat(),
-                    "activo": timer.activo,
-                    "completado": timer.completado
-                }
-            
-            with open(TIMERS_FILE, 'w') as f:
-                json.dump(timers_data, f, indent=2)
-            timer_logger.info(f"Timers guardados en {TIMERS_FILE}: {len(timers_data)} timers")
-        except Exception as e:
-            timer_logger.error(f"Error guardando timers: {e}")
+    def timer_to_record(self, timer: Timer) -> Dict[str, Any]:
+        """Representación persistida de un timer."""
+        return timer.to_dict()
+
+    def snapshot_for_persistence(self) -> Dict[str, Dict[str, Any]]:
+        """Estado completo para la compactación del diario (formato de TIMERS_FILE)."""
+        return {timer_id: self.timer_to_record(timer) for timer_id, timer in self.timers.items()}
+
+    def persist_timer(self, timer: Timer):
+        """Registrar el estado de un timer en el diario (O(1), sin E/S en el event loop)."""
+        self.store.record_put(self.timer_to_record(timer))
+
+    def persist_delete(self, timer: Timer):
+        # La lápida ya lleva la versión de la eliminación (mayor que la del último estado)
+        self.store.record_delete(timer.id, timer.tenant, max(timer.version, self.tombstones.version(timer.id)))
+
+    def persists_remote(self, timer_id: str) -> bool:
+        """Si esta instancia debe persistir un cambio recibido de otra.
+
+        El diario es propio de cada instancia y tiene que reflejar todos los cambios; la tabla de
+        PostgreSQL es compartida y solo la escribe la instancia dueña del timer, para que las demás
+        no repitan la misma escritura.
+        """
+        return TIMER_PERSISTENCE != "postgres" or self.membership.owns(timer_id)
+
+    def persist_remote(self, timer: Timer):
+        if self.persists_remote(timer.id):
+            self.persist_timer(timer)
+
+    def persist_remote_delete(self, timer: Timer):
+        if self.persists_remote(timer.id):
+            self.persist_delete(timer)
+
+    async def start_persistence(self):
+        """Cargar los timers persistidos (sin bloquear el event loop) e iniciar el escritor."""
+        await asyncio.to_thread(self.load_timers)
+        self.store.start()
     
-    def load_timers_from_file(self):
-        """Cargar timers desde archivo JSON"""
-        if not os.path.exists(TIMERS_FILE):
-            timer_logger.info(f"Archivo {TIMERS_FILE} no existe, iniciando sin timers")
-            return
-            
+    def load_timers(self):
+        """Cargar timers desde el backend de persistencia (snapshot + diario, o PostgreSQL)"""
         try:
-            with open(TIMERS_FILE, 'r') as f:
-                timers_data = json.load(f)
+            timers_data = self.store.load()
+            current_time = get_utc_now()
             
             for timer_id, timer_dict in timers_data.items():
-                timer_dict['fechaInicio'] = datetime.fromisoformat(timer_dict['fechaInicio'])
-                timer_dict['fechaFin'] = datetime.fromisoformat(timer_dict['fechaFin'])
+                timer_dict['fechaInicio'] = parse_iso_datetime(timer_dict['fechaInicio'])
+                timer_dict['fechaFin'] = parse_iso_datetime(timer_dict['fechaFin'])
                 
-                # Recalcular tiempo restante basado en tiempo actual
-                current_time = datetime.utcnow()
-                tiempo_restante_ms = (timer_dict['fechaFin'] - current_time).total_seconds()
-                timer_dict['tiempoRestanteSegundos'] = max(0, int(tiempo_restante_ms))
+                # Recalcular tiempo restante de los timers en curso (los pausados conservan el suyo)
+                if timer_dict.get('activo') and not timer_dict.get('completado'):
+                    tiempo_restante_ms = (timer_dict['fechaFin'] - current_time).total_seconds()
+                    timer_dict['tiempoRestanteSegundos'] = max(0, int(tiempo_restante_ms))
                 
-                # Actualizar estado basado en tiempo restante
-                if timer_dict['tiempoRestanteSegundos'] == 0 and not timer_dict['completado']:
-                    timer_dict['completado'] = True
-                    timer_dict['activo'] = False
-                
-                timer = Timer(**timer_dict)
+                timer = timer_from_record(timer_dict)
                 self.timers[timer_id] = timer
             
-            timer_logger.info(f"Timers cargados desde {TIMERS_FILE}: {len(self.timers)} timers")
+            # Los vencidos durante la caída se completan en el primer tick
+            self.rebuild_schedule()
+            for tenant in {self.timer_tenant(timer) for timer in self.timers.values()}:
+                self.sync_cache.touch(tenant)
+            timer_logger.info(f"Timers cargados ({TIMER_PERSISTENCE}): {len(self.timers)} timers")
         except Exception as e:
             timer_logger.error(f"Error cargando timers: {e}")
         
-    async def add_connection(self, websocket: WebSocket):
-        """Agregar nueva conexión WebSocket"""
-        self.connections.add(websocket)
-        timer_logger.info(f"Nueva conexión WebSocket. Total: {len(self.connections)}")
-        
-        # Enviar timers existentes al cliente recién conectado
+    @staticmethod
+    def timer_tenant(timer: Timer) -> str:
+        """Tenant dueño de un timer (los timers legados sin tenant pertenecen al tenant por defecto)."""
+        return timer.tenant or DEFAULT_TENANT_SCHEMA
+
+    def tenant_of(self, websocket: WebSocket) -> str:
+        return self.connection_tenants.get(websocket, DEFAULT_TENANT_SCHEMA)
+
+    @staticmethod
+    def sync_record(timer: Timer) -> Dict[str, Any]:
+        """Registro de un timer en el TIMER_SYNC: sin el tiempo restante de los timers en curso
+        (el cliente lo deriva de fechaFin), de modo que el tick no invalida el snapshot."""
+        record = timer.to_dict()
+        if record["activo"] and not record["completado"]:
+            record.pop("tiempoRestanteSegundos")
+        return record
+
+    def sync_records(self, tenant: Optional[str] = None):
+        """Timers del TIMER_SYNC (de un tenant, si se indica) y el seq del instante en que se tomaron."""
+        timers = self.timers.values()
+        if tenant is not None:
+            timers = [self.timers[timer_id] for timer_id in self.timers.ids_matching(tenant=tenant)]
+        return [self.sync_record(t) for t in timers], self.changelog.seq
+
+    def sync_header(self, seq: int) -> Dict[str, Any]:
+        return {
+            "server_timestamp": self.get_server_timestamp(),
+            # Punto de reanudación: el cliente envía seq/epoch en su próximo REQUEST_SYNC
+            "seq": seq,
+            "epoch": self.changelog.epoch,
+            # En modo "local" el cliente descuenta por su cuenta a partir de fechaFin
+            "tick_mode": TIMER_TICK_MODE
+        }
+
+    def build_sync_message(self, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """Construir el mensaje TIMER_SYNC con el estado completo de los timers, sin pasar por el cache."""
+        records, seq = self.sync_records(tenant)
+        return {"type": "TIMER_SYNC", "data": {"timers": records, **self.sync_header(seq)}}
+
+    async def encoded_sync_message(self, tenant: Optional[str] = None) -> str:
+        """TIMER_SYNC ya serializado: la lista de timers sale del cache versionado y solo la
+        cabecera (con server_timestamp actual, que el cliente usa para estimar su desfase) se
+        serializa en cada petición."""
+        timers_json, seq = await self.sync_cache.get(tenant)
+        header = encode_message(self.sync_header(seq))
+        return '{"type":"TIMER_SYNC","data":{"timers":%s,%s}}' % (timers_json, header[1:-1])
+
+    async def send_sync(self, websocket: WebSocket, tenant: str):
+        await self.send_to_client(websocket, {"type": "TIMER_SYNC"}, payload=await self.encoded_sync_message(tenant))
+
+    async def send_resync(self, websocket: WebSocket, tenant: str, since_seq: Any = None, epoch: Optional[str] = None):
+        """Responder a REQUEST_SYNC con el delta desde `since_seq` o, si no es posible, el TIMER_SYNC completo."""
+        delta = self.build_resync_message(tenant, since_seq, epoch)
+        if delta is None:
+            await self.send_sync(websocket, tenant)
+        else:
+            await self.send_to_client(websocket, delta)
+
+    def sync_schedule(self, timer: Timer):
+        """Mantener el planificador de completación (solo timers de los que esta instancia es
+        dueña) y los índices secundarios alineados con el estado del timer."""
+        self.timers.reindex(timer)
+        if self.membership.owns(timer.id):
+            self.scheduler.sync(timer.id, timer.fechaFin, timer.activo, timer.completado)
+        else:
+            self.scheduler.cancel(timer.id)
+
+    def rebuild_schedule(self):
+        """Reconstruir el planificador con los timers propios (carga, snapshot o cambio de miembros)."""
+        self.scheduler.rebuild(t for t in self.timers.values() if self.membership.owns(t.id))
+
+    async def rebalance(self):
+        """Recalcular los timers propios tras un cambio de miembros; los vencidos se completan en el siguiente tick."""
+        self.rebuild_schedule()
+        timer_logger.info(
+            f"Timers reasignados: {len(self.scheduler)} activos propios de {len(self.timers)} "
+            f"({len(self.membership.members)} instancias)"
+        )
+
+    # ---- Retención y archivo de timers completados ----
+
+    async def apply_retention(self) -> int:
+        """Archivar y sacar de memoria los timers completados que ya no se retienen.
+
+        Solo el dueño de cada timer lo escribe en el archivo (todas las instancias aplican la
+        misma política sobre el mismo estado y lo desalojan igual). Si el archivo falla no se
+        desaloja nada y se reintenta en la siguiente pasada. El desalojo deja una lápida con la
+        versión del timer para que una copia de otra instancia no lo vuelva a traer.
+        """
+        completed = [self.timers[timer_id] for timer_id in self.timers.ids_matching(estado="completado")]
+        if not completed:
+            return 0
+        live_by_tenant = {
+            tenant: len(self.timers.ids_matching(tenant=tenant))
+            for tenant in {self.timer_tenant(t) for t in completed}
+        }
+        expired = self.retention.select(completed, live_by_tenant, self.timer_tenant, get_utc_now().timestamp())
+        if not expired:
+            return 0
+
+        records = [t.to_dict() for t in expired if self.membership.owns(t.id)]
+        if records:
+            try:
+                await asyncio.to_thread(self.archive.write, records)
+            except Exception as e:
+                timer_logger.error(f"Error archivando {len(records)} timers completados: {e}")
+                return 0
+
+        por_tenant: Dict[str, List[str]] = {}
+        for timer in expired:
+            # Reemplazado o reactivado mientras se escribía el archivo: se queda
+            if self.timers.get(timer.id) is not timer or not timer.completado:
+                continue
+            del self.timers[timer.id]
+            self.scheduler.cancel(timer.id)
+            self.reported_remaining.pop(timer.id, None)
+            self.tombstones.add(timer.id, timer.version)
+            self.persist_delete(timer)
+            por_tenant.setdefault(self.timer_tenant(timer), []).append(timer.id)
+        evicted = sum(len(ids) for ids in por_tenant.values())
+        self.evicted += evicted
+        for tenant, ids in por_tenant.items():
+            await self.publish_change({
+                "type": "TIMERS_DELETED_BATCH",
+                "data": {"timerIds": ids}
+            }, tenant)
+        timer_logger.info(f"Retención: {evicted} timers completados archivados ({len(records)} escritos por esta instancia)")
+        return evicted
+
+    async def archive_stored_completed(self):
+        """Archivar por TTL los completados que quedaron en la tabla `timers` de PostgreSQL (la
+        carga de arranque no los trae a memoria), con una pasada en SQL por lotes."""
+        if TIMER_PERSISTENCE != "postgres" or self.retention.ttl <= 0:
+            return
+        try:
+            moved = await asyncio.to_thread(self.archive.archive_stored, get_engine, self.retention.ttl)
+        except Exception as e:
+            timer_logger.error(f"Error archivando los timers completados de la tabla: {e}")
+            return
+        if moved:
+            timer_logger.info(f"Retención: {moved} timers completados archivados desde la tabla timers")
+
+    async def run_retention(self):
+        """Pasada de retención cada TIMER_RETENTION_INTERVAL_SECONDS (y la de la tabla cada
+        TIMER_ARCHIVE_STORED_INTERVAL_SECONDS)."""
+        if not self.retention.enabled:
+            return
+        try:
+            await asyncio.to_thread(self.archive.refresh_count)
+        except Exception as e:
+            timer_logger.error(f"No se pudo contar el archivo de timers: {e}")
+        loop = asyncio.get_running_loop()
+        await self.archive_stored_completed()
+        stored_at = loop.time()
+        while self.running:
+            await asyncio.sleep(TIMER_RETENTION_INTERVAL_SECONDS)
+            try:
+                await self.apply_retention()
+            except Exception as e:
+                timer_logger.error(f"Error en la retención de timers: {e}")
+            if loop.time() - stored_at >= TIMER_ARCHIVE_STORED_INTERVAL_SECONDS:
+                await self.archive_stored_completed()
+                stored_at = loop.time()
+
+    def retention_stats(self) -> Dict[str, Any]:
+        return {
+            **self.retention.describe(),
+            "live": len(self.timers),
+            "live_completed": len(self.timers.ids_matching(estado="completado")),
+            "archived": self.archive.archived,
+            "evicted": self.evicted,
+        }
+
+    # ---- Fusión de estado entre instancias (last-writer-wins por versión) ----
+
+    def build_digest_message(self) -> Dict[str, Any]:
+        """Digest compacto del estado (id -> versión, más las lápidas) que se anuncia al arrancar."""
+        return {
+            "event": "TIMERS_DIGEST",
+            "origin": self.instance_id,
+            "digest": {timer_id: t.version for timer_id, t in self.timers.items()},
+            "tombstones": self.tombstones.snapshot(),
+        }
+
+    def accepts_remote(self, timer_id: Optional[str], version: Any) -> bool:
+        """True si un evento de otra instancia sobre `timer_id` gana a la copia y lápida locales."""
+        if not timer_id:
+            return False
+        if isinstance(version, int) and version <= self.tombstones.version(timer_id):
+            return False
+        current = self.timers.get(timer_id)
+        return current is None or is_newer(version, current.version)
+
+    def accepts_delete(self, timer_id: str, version: Any) -> bool:
+        """True si una eliminación remota con `version` gana a la copia local del timer."""
+        current = self.timers.get(timer_id)
+        return current is not None and (not isinstance(version, int) or current.version <= version)
+
+    async def handle_digest(self, msg: Dict[str, Any]):
+        """Responder al digest de otra instancia enviando solo los timers y lápidas que difieren."""
+        plan = diff_digest(
+            {timer_id: t.version for timer_id, t in self.timers.items()},
+            self.tombstones.snapshot(),
+            msg.get("digest") or {},
+            msg.get("tombstones") or {},
+        )
+        if plan["delete"]:
+            await self.merge_remote([], plan["delete"])
+        if not (plan["send"] or plan["tombstones"] or plan["want"]):
+            return
+        timer_logger.info(
+            f"Fusión con {msg.get('origin')}: {len(plan['send'])} timers y {len(plan['tombstones'])} "
+            f"lápidas enviados, {len(plan['want'])} solicitados"
+        )
+        await message_queue.publish_fanout("timers.events", {
+            "event": "TIMERS_MERGE",
+            "origin": self.instance_id,
+            "target": msg.get("origin"),
+            "timers": [self.timers[timer_id].to_dict() for timer_id in plan["send"]],
+            "tombstones": plan["tombstones"],
+            "want": plan["want"],
+        })
+
+    async def handle_merge(self, msg: Dict[str, Any]):
+        """Aplicar un TIMERS_MERGE y, si iba dirigido a esta instancia, devolver los timers pedidos."""
+        await self.merge_remote(msg.get("timers") or [], msg.get("tombstones") or {})
+        want = [timer_id for timer_id in msg.get("want") or [] if timer_id in self.timers]
+        if msg.get("target") == self.instance_id and want:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_MERGE",
+                "origin": self.instance_id,
+                "target": msg.get("origin"),
+                "timers": [self.timers[timer_id].to_dict() for timer_id in want],
+                "tombstones": {},
+                "want": [],
+            })
+
+    async def merge_remote(self, timers_data: List[Dict[str, Any]], tombstones: Dict[str, int]):
+        """Fusionar timers y lápidas de otra instancia: gana la versión más alta.
+
+        Los clientes reciben solo lo que cambió (un TIMERS_CHANGED_BATCH por sala) en lugar de
+        un TIMER_SYNC completo.
+        """
         server_ts = self.get_server_timestamp()
-        await self.send_to_client(websocket, {
-            "type": "TIMER_SYNC",
+        cambiados: Dict[str, Timer] = {}
+        eliminados: Dict[str, str] = {}
+
+        for data in timers_data:
+            timer_id = data.get("id")
+            version = data.get("version") or 0
+            current = self.timers.get(timer_id)
+            if not timer_id or version <= self.tombstones.version(timer_id):
+                continue
+            if current is not None and version <= current.version:
+                continue
+            for date_field in ("fechaInicio", "fechaFin"):
+                if isinstance(data.get(date_field), str):
+                    data[date_field] = parse_iso_datetime(data[date_field])
+            timer = timer_from_record(data)
+            self.timers[timer_id] = timer
+            self.sync_schedule(timer)
+            self.persist_remote(timer)
+            cambiados[timer_id] = timer
+
+        for timer_id, version in tombstones.items():
+            self.tombstones.add(timer_id, version)
+            current = self.timers.get(timer_id)
+            if current is None or current.version > version:
+                continue
+            del self.timers[timer_id]
+            self.scheduler.cancel(timer_id)
+            self.reported_remaining.pop(timer_id, None)
+            self.persist_remote_delete(current)
+            cambiados.pop(timer_id, None)
+            eliminados[timer_id] = self.timer_tenant(current)
+
+        await self.broadcast_timer_changes(list(cambiados.values()), eliminados, server_ts)
+
+    def build_resync_message(self, tenant: str, since_seq: Any = None, epoch: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """TIMER_DELTA_SYNC con los cambios perdidos desde `since_seq` si siguen en el registro de
+        cambios; None si hace falta el TIMER_SYNC completo (hueco demasiado antiguo u otra instancia)."""
+        changes = self.changelog.since(since_seq, tenant, epoch) if since_seq is not None else None
+        if changes is None:
+            return None
+        return {
+            "type": "TIMER_DELTA_SYNC",
             "data": {
-                "timers": [
-                    {
-                        **timer.to_dict(),
-                        "server_timestamp": server_ts
-                    } for timer in self.timers.values()
-                ],
-                "server_timestamp": server_ts
+                "changes": changes,
+                "seq": self.changelog.seq,
+                "epoch": self.changelog.epoch,
+                "server_timestamp": self.get_server_timestamp(),
+                "tick_mode": TIMER_TICK_MODE
             }
-        })
+        }
+
+    async def publish_change(self, message: Dict, tenant: str, exclude: Optional[WebSocket] = None):
+        """Numerar un cambio de estado, guardarlo en el registro de cambios y emitirlo a la sala."""
+        self.changelog.record(tenant, message)
+        self.sync_cache.touch(tenant)
+        await self.broadcast(message, exclude=exclude, tenant=tenant)
+
+    async def add_connection(self, websocket: WebSocket, tenant: Optional[str] = None, send_sync: bool = True):
+        """Agregar nueva conexión WebSocket a la sala de su tenant"""
+        tenant = tenant or DEFAULT_TENANT_SCHEMA
+        self.connections.add(websocket)
+        self.rooms.setdefault(tenant, set()).add(websocket)
+        self.connection_tenants[websocket] = tenant
+        self.fanout.register(websocket, on_dead=self.remove_connection)
+        timer_logger.info(f"Nueva conexión WebSocket (tenant={tenant}). Total: {len(self.connections)}")
+        
+        # Enviar los timers del tenant al cliente recién conectado, salvo que el cliente
+        # vaya a pedir su propio REQUEST_SYNC (posiblemente delta) al conectar
+        if send_sync:
+            await self.send_sync(websocket, tenant)
         
     async def remove_connection(self, websocket: WebSocket):
         """Remover conexión WebSocket"""
         self.connections.discard(websocket)
+        tenant = self.connection_tenants.pop(websocket, None)
+        room = self.rooms.get(tenant)
+        if room is not None:
+            room.discard(websocket)
+            if not room:
+                del self.rooms[tenant]
+        self.fanout.unregister(websocket)
+        self.clock_sync.pop(websocket, None)
         timer_logger.info(f"Conexión WebSocket removida. Total: {len(self.connections)}")
         
-    async def send_to_client(self, websocket: WebSocket, message: Dict):
-        """Enviar mensaje a un cliente específico"""
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            timer_logger.error(f"Error enviando mensaje a cliente: {e}")
+    async def send_to_client(self, websocket: WebSocket, message: Dict, payload: Optional[str] = None):
+        """Enviar mensaje a un cliente específico (a través de su cola de salida)"""
+        if await self.fanout.send([websocket], message, payload=payload):
+            timer_logger.error("Error enviando mensaje a cliente: cola de salida desbordada")
             await self.remove_connection(websocket)
             
-    async def broadcast(self, message: Dict, exclude: Optional[WebSocket] = None):
-        """Enviar mensaje a todos los clientes conectados"""
-        disconnected = set()
-        
-        if not self.connections:
+    async def handle_ping(self, websocket: WebSocket, data: Dict[str, Any]):
+        """Responder a un PING de sincronización de reloj con t0/t1/t2 y si la conexión puede
+        descontar en local (en modo "per_timer" el servidor siempre envía cada segundo)"""
+        received_ms = self.get_server_timestamp()
+        state = self.clock_sync.setdefault(websocket, ClockSyncState())
+        pong = state.pong(data, received_ms, self.get_server_timestamp())
+        if TIMER_TICK_MODE == "per_timer":
+            pong["local_countdown"] = False
+        await self.send_to_client(websocket, {"type": "PONG", "data": pong})
+
+    def local_countdown_connections(self, tenant: str) -> Set[WebSocket]:
+        """Conexiones de la sala que descuentan en local y no necesitan los reportes periódicos"""
+        local = set()
+        for websocket in self.rooms.get(tenant, ()):
+            state = self.clock_sync.get(websocket)
+            if state is not None and state.local_countdown_allowed():
+                local.add(websocket)
+        return local
+
+    async def broadcast(self, message: Dict, exclude: Optional[WebSocket] = None, tenant: Optional[str] = None,
+                        payload: Optional[str] = None, connections: Optional[Iterable[WebSocket]] = None):
+        """Enviar mensaje a la sala de `tenant` (o a todas las conexiones si no se indica, o solo a
+        `connections`), serializado una vez y vía la cola de salida de cada conexión"""
+        if connections is not None:
+            targets = connections
+        else:
+            targets = self.connections if tenant is None else self.rooms.get(tenant)
+        if not targets:
             # Solo log ocasional para reducir spam
             return
             
-        # Solo log para mensajes importantes, no para TIMER_TIME_UPDATE
-        if message.get('type') != 'TIMER_TIME_UPDATE':
-            timer_logger.info(f"Broadcasting mensaje tipo '{message.get('type')}' a {len(self.connections)} conexiones")
+        # Solo log para mensajes importantes, no para las actualizaciones de cada tick
+        if message.get('type') not in ('TIMER_TIME_UPDATE', 'TIMER_BATCH_UPDATE'):
+            timer_logger.info(f"Broadcasting mensaje tipo '{message.get('type')}' a {len(targets)} conexiones (tenant={tenant or '*'})")
         
-        for connection in self.connections:
-            if connection == exclude:
-                continue
-                
-            try:
-                await connection.send_text(json.dumps(message))
-            except Exception as e:
-                timer_logger.error(f"Error en broadcast a conexión: {e}")
-                disconnected.add(connection)
+        disconnected = await self.fanout.send(list(targets), message, exclude=exclude, payload=payload)
                 
-        # Remover conexiones desconectadas
+        # Remover conexiones desconectadas o lentas
         for conn in disconnected:
             await self.remove_connection(conn)
+
+    async def broadcast_sync(self, tenant: Optional[str] = None):
+        """Enviar a cada sala (o solo a la de `tenant`) el TIMER_SYNC con los timers de su tenant."""
+        tenants = [tenant] if tenant is not None else list(self.rooms)
+        for room_tenant in tenants:
+            if not self.rooms.get(room_tenant):
+                continue
+            payload = await self.encoded_sync_message(room_tenant)
+            await self.broadcast({"type": "TIMER_SYNC"}, tenant=room_tenant, payload=payload)
+
+    def belongs_to(self, timer_id: str, tenant: str) -> bool:
+        """True si el timer (o el grupo del miembro `timer_id`) existe y pertenece a `tenant`."""
+        timer = self.timers.get(timer_id)
+        if timer is None:
+            group_id = self.timers.group_of(timer_id)
+            timer = self.timers.get(group_id) if group_id else None
+        return timer is not None and self.timer_tenant(timer) == tenant
             
+    @staticmethod
+    def normalize_new_timer(timer_data: Dict, now: datetime) -> Dict:
+        """Completar los campos requeridos de un timer nuevo si el cliente no los envió."""
+        # fechaInicio
+        fi = timer_data.get('fechaInicio')
+        if not fi:
+            timer_data['fechaInicio'] = now
+        elif isinstance(fi, str):
+            timer_data['fechaInicio'] = parse_iso_datetime(fi)
+
+        # fechaFin
+        ff = timer_data.get('fechaFin')
+        if not ff:
+            minutos = int(timer_data.get('tiempoInicialMinutos', 0) or 0)
+            base = timer_data['fechaInicio'] if isinstance(timer_data['fechaInicio'], datetime) else now
+            timer_data['fechaFin'] = base + timedelta(minutes=minutos)
+        elif isinstance(ff, str):
+            timer_data['fechaFin'] = parse_iso_datetime(ff)
+
+        # tiempoRestanteSegundos
+        restante = max(0, int((timer_data['fechaFin'] - now).total_seconds()))
+        if not isinstance(timer_data.get('tiempoRestanteSegundos'), int):
+            timer_data['tiempoRestanteSegundos'] = restante
+
+        # Flags
+        completado = bool(timer_data.get('completado', False)) or timer_data['tiempoRestanteSegundos'] == 0
+        activo = bool(timer_data.get('activo', True)) and not completado
+        timer_data['completado'] = completado
+        timer_data['activo'] = activo
+        return timer_data
+
+    def stamp_new(self, timer: Timer):
+        """Asignar la versión de un timer recién creado (por encima de una lápida previa del mismo id)."""
+        timer.version = self.clock.next(self.tombstones.version(timer.id))
+        self.tombstones.discard(timer.id)
+
     async def create_timer(self, timer_data: Dict, websocket: Optional[WebSocket] = None):
         """Crear nuevo temporizador"""
         # Verificar si el timer ya existe para evitar duplicados
@@ -392,53 +871,28 @@ class TimerManager:
             timer_logger.info(f"Timer ya existe, actualizando: {timer_id}")
             await self.update_timer(timer_id, timer_data, websocket)
             return
-        # Asegurar campos requeridos si el cliente no los envió
         try:
-            now = get_utc_now()
-            # fechaInicio
-            fi = timer_data.get('fechaInicio')
-            if not fi:
-                timer_data['fechaInicio'] = now
-            elif isinstance(fi, str):
-                timer_data['fechaInicio'] = parse_iso_datetime(fi)
-
-            # fechaFin
-            ff = timer_data.get('fechaFin')
-            if not ff:
-                minutos = int(timer_data.get('tiempoInicialMinutos', 0) or 0)
-                base = timer_data['fechaInicio'] if isinstance(timer_data['fechaInicio'], datetime) else now
-                timer_data['fechaFin'] = base + timedelta(minutes=minutos)
-            elif isinstance(ff, str):
-                timer_data['fechaFin'] = parse_iso_datetime(ff)
-
-            # tiempoRestanteSegundos
-            restante = max(0, int((timer_data['fechaFin'] - now).total_seconds()))
-            if not isinstance(timer_data.get('tiempoRestanteSegundos'), int):
-                timer_data['tiempoRestanteSegundos'] = restante
-
-            # Flags
-            completado = bool(timer_data.get('completado', False)) or timer_data['tiempoRestanteSegundos'] == 0
-            activo = bool(timer_data.get('activo', True)) and not completado
-            timer_data['completado'] = completado
-            timer_data['activo'] = activo
+            self.normalize_new_timer(timer_data, get_utc_now())
         except Exception as e:
             timer_logger.error(f"Error normalizando CREATE_TIMER: {e}")
             raise
 
-        timer = Timer(**timer_data)
+        timer = timer_from_input(timer_data)
+        self.stamp_new(timer)
         self.timers[timer.id] = timer
+        self.sync_schedule(timer)
         
-        # Guardar en archivo
-        self.save_timers_to_file()
+        # Registrar en el diario
+        self.persist_timer(timer)
         
         timer_logger.info(f"Timer creado: {timer.nombre} ({timer.id})")
         
         # Broadcast a todos los clientes excepto el que envió
         server_ts = self.get_server_timestamp()
-        await self.broadcast({
+        await self.publish_change({
             "type": "TIMER_CREATED",
             "data": {"timer": {**timer.to_dict(), "server_timestamp": server_ts}}
-        }, exclude=websocket)
+        }, self.timer_tenant(timer), exclude=websocket)
 
         # Publicar a otras instancias (fanout)
         try:
@@ -450,6 +904,63 @@ class TimerManager:
             })
         except Exception as e:
             timer_logger.error(f"MQ publish TIMER_CREATED error: {e}")
+
+    def _create_in_place(self, timer_data: Dict, now: datetime) -> Optional[Timer]:
+        """Crear un timer en memoria y encolar su persistencia, sin emitir nada (None si ya
+        existía o no es válido)."""
+        timer_id = timer_data.get('id')
+        if timer_id and timer_id in self.timers:
+            timer_logger.info(f"Timer ya existía en lote (omitido): {timer_id}")
+            return None
+        try:
+            timer = timer_from_input(self.normalize_new_timer(dict(timer_data), now))
+        except Exception as e:
+            timer_logger.error(f"Error creando timer en lote: {e}")
+            return None
+        self.stamp_new(timer)
+        self.timers[timer.id] = timer
+        self.sync_schedule(timer)
+        self.persist_timer(timer)
+        return timer
+
+    async def create_timers_batch(self, timers_data: List[Dict]) -> List[Timer]:
+        """Crear varios timers de una vez: un frame TIMERS_CREATED_BATCH por sala de tenant y un
+        único evento TIMERS_CREATED_BATCH en el fanout de MQ (en lugar de uno por timer).
+
+        Los ids que ya existen se omiten. La persistencia va por la cola del store, que agrupa
+        todo el lote en la misma escritura.
+        """
+        now = get_utc_now()
+        server_ts = self.get_server_timestamp()
+        creados: List[Timer] = []
+        por_tenant: Dict[str, List[Dict[str, Any]]] = {}
+        for timer_data in timers_data:
+            timer = self._create_in_place(timer_data, now)
+            if timer is None:
+                continue
+            creados.append(timer)
+            por_tenant.setdefault(self.timer_tenant(timer), []).append({**timer.to_dict(), "server_timestamp": server_ts})
+
+        if not creados:
+            return creados
+        timer_logger.info(f"Lote de timers creado: {len(creados)} timers")
+
+        for tenant, timers in por_tenant.items():
+            await self.publish_change({
+                "type": "TIMERS_CREATED_BATCH",
+                "data": {"timers": timers, "server_timestamp": server_ts}
+            }, tenant)
+
+        try:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_CREATED_BATCH",
+                "origin": self.instance_id,
+                "timers": [t.to_dict() for t in creados],
+                "server_timestamp": server_ts
+            })
+        except Exception as e:
+            timer_logger.error(f"MQ publish TIMERS_CREATED_BATCH error: {e}")
+        return creados
         
     async def update_timer(self, timer_id: str, updates: Dict, websocket: Optional[WebSocket] = None):
         """Actualizar temporizador existente"""
@@ -459,20 +970,22 @@ class TimerManager:
             
         timer = self.timers[timer_id]
         for key, value in updates.items():
-            if hasattr(timer, key):
+            if key != "version" and hasattr(timer, key):
                 setattr(timer, key, value)
+        timer.version = self.clock.next(timer.version)
+        self.sync_schedule(timer)
         
-        # Guardar en archivo
-        self.save_timers_to_file()
+        # Registrar en el diario
+        self.persist_timer(timer)
                 
         timer_logger.info(f"Timer actualizado: {timer.nombre} ({timer_id})")
         
         # Broadcast a todos los clientes excepto el que envió
         server_ts = self.get_server_timestamp()
-        await self.broadcast({
+        await self.publish_change({
             "type": "TIMER_UPDATED",
             "data": {"timer": {**timer.to_dict(), "server_timestamp": server_ts}}
-        }, exclude=websocket)
+        }, self.timer_tenant(timer), exclude=websocket)
 
         # Publicar a otras instancias
         try:
@@ -488,27 +1001,33 @@ class TimerManager:
         return True
         
     async def delete_timer(self, timer_id: str, websocket: Optional[WebSocket] = None):
-        """Eliminar temporizador"""
+        """Eliminar temporizador (o quitar un miembro de su timer de grupo)"""
+        if timer_id not in self.timers and self.timers.group_of(timer_id):
+            return await self.remove_members(self.timers.group_of(timer_id), [timer_id])
         if timer_id in self.timers:
             timer = self.timers.pop(timer_id)
+            self.scheduler.cancel(timer_id)
+            version = self.clock.next(timer.version)
+            self.tombstones.add(timer_id, version)
             
-            # Guardar en archivo
-            self.save_timers_to_file()
+            # Registrar en el diario
+            self.persist_delete(timer)
             
             timer_logger.info(f"Timer eliminado: {timer.nombre} ({timer_id})")
             
             # Broadcast a todos los clientes excepto el que envió
-            await self.broadcast({
+            await self.publish_change({
                 "type": "TIMER_DELETED",
                 "data": {"timerId": timer_id}
-            }, exclude=websocket)
+            }, self.timer_tenant(timer), exclude=websocket)
 
             # Publicar a otras instancias
             try:
                 await message_queue.publish_fanout("timers.events", {
                     "event": "TIMER_DELETED",
                     "origin": self.instance_id,
-                    "timerId": timer_id
+                    "timerId": timer_id,
+                    "version": version
                 })
             except Exception as e:
                 timer_logger.error(f"MQ publish TIMER_DELETED error: {e}")
@@ -517,8 +1036,11 @@ class TimerManager:
         return False
         
     async def pause_timer(self, timer_id: str, websocket: Optional[WebSocket] = None):
-        """Pausar temporizador: congelar tiempo restante tomando como referencia fechaFin."""
-        if timer_id not in self.timers:
+        """Pausar temporizador: congelar tiempo restante tomando como referencia fechaFin.
+
+        Un miembro de un timer de grupo en curso se separa antes como timer individual.
+        """
+        if timer_id not in self.timers and not await self.detach_for(timer_id, "pause"):
             return False
         timer = self.timers[timer_id]
         # Calcular restante respecto a ahora
@@ -531,8 +1053,11 @@ class TimerManager:
         return await self.update_timer(timer_id, updates, websocket)
         
     async def resume_timer(self, timer_id: str, websocket: Optional[WebSocket] = None):
-        """Reanudar temporizador: re-calcular fechaFin desde ahora al tiempo restante almacenado."""
-        if timer_id not in self.timers:
+        """Reanudar temporizador: re-calcular fechaFin desde ahora al tiempo restante almacenado.
+
+        Un miembro de un timer de grupo pausado se separa antes como timer individual.
+        """
+        if timer_id not in self.timers and not await self.detach_for(timer_id, "resume"):
             return False
         timer = self.timers[timer_id]
         if timer.completado:
@@ -542,71 +1067,442 @@ class TimerManager:
         updates = {"activo": True, "fechaFin": nueva_fin}
         return await self.update_timer(timer_id, updates, websocket)
         
+    # ---- Operaciones por lote (pausa / reanudación / eliminación) ----
+    #
+    # Un lote se aplica entero en memoria sin ceder el bucle de eventos (los métodos *_in_place
+    # no esperan nada) y solo después se emite: un TIMERS_CHANGED_BATCH por sala y un único
+    # evento en MQ. Ningún otro mensaje ni cliente ve el lote a medias. `upserts` acumula los
+    # timers creados o modificados y `deleted` los eliminados (id -> (tenant, versión)).
+
+    def _update_in_place(self, timer: Timer, updates: Dict[str, Any], upserts: Dict[str, Timer]):
+        for key, value in updates.items():
+            if key != "version" and hasattr(timer, key):
+                setattr(timer, key, value)
+        timer.version = self.clock.next(timer.version)
+        self.sync_schedule(timer)
+        self.persist_timer(timer)
+        upserts[timer.id] = timer
+
+    def _delete_in_place(self, timer_id: str, upserts: Dict[str, Timer], deleted: Dict[str, Tuple[str, int]]) -> bool:
+        timer = self.timers.pop(timer_id, None)
+        if timer is None:
+            return False
+        self.scheduler.cancel(timer_id)
+        self.reported_remaining.pop(timer_id, None)
+        version = self.clock.next(timer.version)
+        self.tombstones.add(timer_id, version)
+        self.persist_delete(timer)
+        upserts.pop(timer_id, None)
+        deleted[timer_id] = (self.timer_tenant(timer), version)
+        return True
+
+    async def publish_timer_changes(self, upserts: Dict[str, Timer], deleted: Dict[str, Tuple[str, int]]):
+        """Emitir un lote ya aplicado: un TIMERS_CHANGED_BATCH por sala y un único evento en MQ
+        (las demás instancias lo fusionan por versión con `merge_remote`)."""
+        if not upserts and not deleted:
+            return
+        server_ts = self.get_server_timestamp()
+        await self.broadcast_timer_changes(
+            list(upserts.values()), {timer_id: tenant for timer_id, (tenant, _) in deleted.items()}, server_ts
+        )
+        try:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_CHANGED_BATCH",
+                "origin": self.instance_id,
+                "timers": [t.to_dict() for t in upserts.values()],
+                "tombstones": {timer_id: version for timer_id, (_, version) in deleted.items()},
+                "server_timestamp": server_ts
+            })
+        except Exception as e:
+            timer_logger.error(f"MQ publish TIMERS_CHANGED_BATCH error: {e}")
+
+    async def broadcast_timer_changes(self, timers: List[Timer], deleted: Dict[str, str], server_ts: int):
+        """Un frame TIMERS_CHANGED_BATCH por sala con los timers creados/modificados y los ids
+        eliminados (`deleted`: id -> tenant); el cliente aplica ambos de una vez."""
+        por_tenant: Dict[str, Dict[str, List[Any]]] = {}
+        for timer in timers:
+            por_tenant.setdefault(self.timer_tenant(timer), {"timers": [], "timerIds": []})["timers"].append(
+                {**timer.to_dict(), "server_timestamp": server_ts}
+            )
+        for timer_id, tenant in deleted.items():
+            por_tenant.setdefault(tenant, {"timers": [], "timerIds": []})["timerIds"].append(timer_id)
+        for tenant, data in por_tenant.items():
+            await self.publish_change({
+                "type": "TIMERS_CHANGED_BATCH",
+                "data": {**data, "server_timestamp": server_ts}
+            }, tenant)
+
+    async def control_timers_batch(self, action: str, timer_ids: List[str]) -> List[str]:
+        """Aplicar "pause" / "resume" / "delete" a todos los timers de una vez y devolver los
+        ids afectados. Los timers ya pausados (o en curso, al reanudar) se omiten.
+
+        Los ids de miembros de timers de grupo se resuelven dentro del mismo lote (ver
+        `_resolve_group_members`): la separación de miembros sale en el mismo frame.
+        """
+        if action not in ("pause", "resume", "delete"):
+            raise ValueError(f"Acción de lote desconocida: {action}")
+        upserts: Dict[str, Timer] = {}
+        deleted: Dict[str, Tuple[str, int]] = {}
+        now = get_utc_now()
+        aplicados: List[str] = []
+        for timer_id in self._resolve_group_members(timer_ids, action, upserts, deleted):
+            timer = self.timers.get(timer_id)
+            if timer is None:
+                # Miembro ya quitado de su grupo al resolver ("delete")
+                aplicados.append(timer_id)
+                continue
+            if action == "delete":
+                self._delete_in_place(timer_id, upserts, deleted)
+            elif action == "pause" and timer.activo and not timer.completado:
+                restante = max(0, int((timer.fechaFin - now).total_seconds()))
+                self._update_in_place(timer, {"activo": False, "tiempoRestanteSegundos": restante}, upserts)
+            elif action == "resume" and not timer.activo and not timer.completado:
+                restante = max(0, int(timer.tiempoRestanteSegundos or 0))
+                self._update_in_place(timer, {"activo": True, "fechaFin": now + timedelta(seconds=restante)}, upserts)
+            else:
+                continue
+            aplicados.append(timer_id)
+        if upserts or deleted:
+            timer_logger.info(
+                f"Lote de timers ({action}): {len(aplicados)} aplicados, "
+                f"{len(upserts)} creados/modificados, {len(deleted)} eliminados"
+            )
+        await self.publish_timer_changes(upserts, deleted)
+        return aplicados
+        
+    # ---- Timers de grupo (un timer por lote con sus TICs como miembros) ----
+
+    @staticmethod
+    def group_accepts(group: Timer, action: str) -> bool:
+        """True si la acción tiene efecto sobre los miembros del grupo en su estado actual."""
+        if group.completado:
+            return action == "delete"
+        if action == "pause":
+            return group.activo
+        if action == "resume":
+            return not group.activo
+        return True
+
+    def _detach_in_place(self, group_id: str, member_ids: List[str], upserts: Dict[str, Timer],
+                         deleted: Dict[str, Tuple[str, int]]) -> List[Timer]:
+        """Separar miembros de un timer de grupo como timers individuales con el mismo estado
+        (mismas fechas, tiempo restante y flags), para operarlos por separado. El grupo se
+        queda con el resto de miembros, o se elimina si no queda ninguno."""
+        group = self.timers.get(group_id)
+        if group is None or not group.miembros:
+            return []
+        ids = set(member_ids)
+        separados = [m for m in group.miembros if m.get("id") in ids]
+        if not separados:
+            return []
+        base = {k: v for k, v in group.to_dict().items() if k not in ("miembros", "version")}
+        base.update(fechaInicio=group.fechaInicio, fechaFin=group.fechaFin)
+        now = get_utc_now()
+        # Quitar primero los miembros del grupo: los individuales reutilizan sus ids
+        self._remove_members_in_place(group_id, [m["id"] for m in separados], upserts, deleted)
+        creados: List[Timer] = []
+        for m in separados:
+            timer = self._create_in_place({
+                **base,
+                "id": m["id"],
+                "nombre": m.get("nombre") or m.get("rfid") or group.nombre,
+                "rfid": m.get("rfid"),
+                "inventario_id": m.get("inventario_id"),
+            }, now)
+            if timer is not None:
+                upserts[timer.id] = timer
+                creados.append(timer)
+        return creados
+
+    def _remove_members_in_place(self, group_id: str, member_ids: List[str], upserts: Dict[str, Timer],
+                                 deleted: Dict[str, Tuple[str, int]]) -> bool:
+        """Quitar miembros de un timer de grupo (el grupo se elimina si se queda vacío)."""
+        group = self.timers.get(group_id)
+        if group is None or not group.miembros:
+            return False
+        ids = set(member_ids)
+        quedan = [m for m in group.miembros if m.get("id") not in ids]
+        if len(quedan) == len(group.miembros):
+            return False
+        if not quedan:
+            return self._delete_in_place(group_id, upserts, deleted)
+        self._update_in_place(group, {"miembros": quedan}, upserts)
+        return True
+
+    async def detach_members(self, group_id: str, member_ids: List[str]) -> List[Timer]:
+        """Separar miembros de un grupo como timers individuales y emitirlo en un solo frame."""
+        upserts: Dict[str, Timer] = {}
+        deleted: Dict[str, Tuple[str, int]] = {}
+        creados = self._detach_in_place(group_id, member_ids, upserts, deleted)
+        await self.publish_timer_changes(upserts, deleted)
+        return creados
+
+    async def remove_members(self, group_id: str, member_ids: List[str]) -> bool:
+        """Quitar miembros de un grupo y emitirlo en un solo frame."""
+        upserts: Dict[str, Timer] = {}
+        deleted: Dict[str, Tuple[str, int]] = {}
+        removed = self._remove_members_in_place(group_id, member_ids, upserts, deleted)
+        await self.publish_timer_changes(upserts, deleted)
+        return removed
+
+    async def detach_for(self, member_id: str, action: str) -> bool:
+        """Separar el miembro `member_id` de su grupo si `action` tiene efecto sobre él."""
+        group_id = self.timers.group_of(member_id)
+        group = self.timers.get(group_id) if group_id else None
+        if group is None or not self.group_accepts(group, action):
+            return False
+        return bool(await self.detach_members(group_id, [member_id]))
+
+    def _resolve_group_members(self, timer_ids: List[str], action: str, upserts: Dict[str, Timer],
+                               deleted: Dict[str, Tuple[str, int]]) -> List[str]:
+        """Traducir ids de miembros de timers de grupo a ids operables para `action`.
+
+        Si se seleccionan todos los miembros de un grupo se opera el grupo entero; si solo
+        algunos, se quitan del grupo ("delete") o se separan como timers individuales.
+        """
+        result: List[str] = []
+        by_group: Dict[str, List[str]] = {}
+        for timer_id in dict.fromkeys(timer_ids):
+            if timer_id in self.timers:
+                result.append(timer_id)
+                continue
+            group_id = self.timers.group_of(timer_id)
+            if group_id is not None:
+                by_group.setdefault(group_id, []).append(timer_id)
+        for group_id, member_ids in by_group.items():
+            group = self.timers.get(group_id)
+            if group is None or group_id in result or not self.group_accepts(group, action):
+                continue
+            if len(member_ids) == len(group.miembros):
+                result.append(group_id)
+            elif action == "delete":
+                if self._remove_members_in_place(group_id, member_ids, upserts, deleted):
+                    result.extend(member_ids)
+            else:
+                result.extend(t.id for t in self._detach_in_place(group_id, member_ids, upserts, deleted))
+        return result
+
+    def collect_tick_updates(self, current_time: datetime, scan: bool = True) -> List[Dict[str, Any]]:
+        """Completar los timers vencidos y devolver las actualizaciones del tick.
+
+        La completación sale del min-heap del planificador (O(log n) por evento). En modo
+        "batch" se añaden los timers activos a los que les toca reporte según la cadencia de
+        su tenant (p. ej. cada 60 s con más de una hora restante), en "per_timer" todos los
+        activos, y en "local" solo las completaciones. Con `scan=False` (despertar anticipado
+        por una completación) solo se procesan las completaciones.
+        """
+        updated_timers = []
+        for timer_id in self.scheduler.pop_due(current_time):
+            timer = self.timers.get(timer_id)
+            if timer is None or timer.completado:
+                continue
+            timer.tiempoRestanteSegundos = 0
+            timer.completado = True
+            timer.activo = False
+            timer.version = self.clock.next(timer.version)
+            self.timers.reindex(timer)
+            timer_logger.info(f"Timer completado: {timer.nombre} ({timer_id})")
+            self.persist_timer(timer)
+            # La completación es un cambio de estado: queda en el registro para la reanudación delta
+            seq = self.changelog.record(self.timer_tenant(timer), {
+                "type": "TIMER_UPDATED",
+                "data": {"timer": timer.to_dict()}
+            })
+            self.sync_cache.touch(self.timer_tenant(timer))
+            self.reported_remaining.pop(timer_id, None)
+            completed = {**timer.to_dict(), "tenant": self.timer_tenant(timer), "timestamp": current_time.isoformat()}
+            if TIMER_COMPLETED_PUBLISH:
+                self.completions.add(completed)
+            self.transitions.add(completed["tenant"], completed)
+            # La versión viaja con la completación para que las demás instancias la adopten
+            updated_timers.append({**self._tick_update(timer), "version": timer.version, "seq": seq})
+
+        if TIMER_TICK_MODE == "local" or not scan:
+            return updated_timers
+
+        # Solo se recorren los timers activos (los completados ya no están en el planificador)
+        now_ms = int(current_time.timestamp() * 1000)
+        for timer_id in self.scheduler.active_ids():
+            timer = self.timers.get(timer_id)
+            if timer is None:
+                self.scheduler.cancel(timer_id)
+                continue
+
+            # Calcular tiempo restante basado en fecha fin
+            nuevo_tiempo_restante = max(0, (timer.fin_ms - now_ms) // 1000)
+            changed = nuevo_tiempo_restante != timer.tiempoRestanteSegundos
+            if changed:
+                timer.tiempoRestanteSegundos = nuevo_tiempo_restante
+
+            if TIMER_TICK_MODE == "per_timer":
+                updated_timers.append(self._tick_update(timer))
+            elif changed and self.cadence.should_report(
+                self.reported_remaining.get(timer_id), nuevo_tiempo_restante, self.timer_tenant(timer)
+            ):
+                self.reported_remaining[timer_id] = nuevo_tiempo_restante
+                updated_timers.append(self._tick_update(timer))
+        return updated_timers
+
+    def tick_delay(self, now_ts: float, next_scan_ts: float) -> float:
+        """Segundos hasta el próximo despertar del tick: el siguiente recorrido completo o la
+        próxima completación propia, lo que llegue antes (la completación no espera al tick)."""
+        wake = next_scan_ts
+        deadline = self.scheduler.next_deadline()
+        if deadline is not None and deadline < wake:
+            wake = deadline
+        return max(TIMER_TICK_MIN_SLEEP_SECONDS, wake - now_ts)
+
+    def _tick_update(self, timer: Timer) -> Dict[str, Any]:
+        return {
+            "timerId": timer.id,
+            "tiempoRestanteSegundos": timer.tiempoRestanteSegundos,
+            "completado": timer.completado,
+            "activo": timer.activo
+        }
+
+    async def broadcast_tick_updates(self, updated_timers: List[Dict[str, Any]], server_ts: int):
+        """Emitir las actualizaciones de un tick según TIMER_TICK_MODE, un frame por sala de tenant."""
+        by_tenant: Dict[str, List[Dict[str, Any]]] = {}
+        for update in updated_timers:
+            timer = self.timers.get(update["timerId"])
+            tenant = self.timer_tenant(timer) if timer is not None else DEFAULT_TENANT_SCHEMA
+            if tenant in self.rooms:
+                by_tenant.setdefault(tenant, []).append(update)
+
+        for tenant, updates in by_tenant.items():
+            if TIMER_TICK_MODE == "per_timer":
+                for update in updates:
+                    message = {
+                        "type": "TIMER_TIME_UPDATE",
+                        "data": {**update, "server_timestamp": server_ts}
+                    }
+                    if "seq" in update:
+                        message["seq"] = update["seq"]
+                    await self.broadcast(message, tenant=tenant)
+                continue
+            # Un solo frame delta por tick (mismo formato que timer_service); en modo "local"
+            # solo contiene completaciones. Si lleva completaciones, el frame se marca con su seq
+            # más alto y deja de ser reemplazable en la cola de salida.
+            local = self.local_countdown_connections(tenant) if TIMER_TICK_MODE != "local" else set()
+            if not local:
+                await self.broadcast(self._tick_frame(updates, server_ts), tenant=tenant)
+                continue
+            # Las conexiones con cuenta atrás local solo reciben las completaciones
+            remote = self.rooms[tenant] - local
+            if remote:
+                await self.broadcast(self._tick_frame(updates, server_ts), connections=remote)
+            completions = [u for u in updates if u.get("completado")]
+            if completions:
+                await self.broadcast(self._tick_frame(completions, server_ts), connections=local)
+
+    def _tick_frame(self, updates: List[Dict[str, Any]], server_ts: int) -> Dict[str, Any]:
+        message = {
+            "type": "TIMER_BATCH_UPDATE",
+            "data": {"updates": updates, "server_timestamp": server_ts}
+        }
+        seqs = [u["seq"] for u in updates if "seq" in u]
+        if seqs:
+            message["seq"] = max(seqs)
+        return message
+
+    async def publish_tick(self, updated_timers: List[Dict[str, Any]], server_ts: int):
+        """Publicar el tick de los timers propios para que las demás instancias lo retransmitan."""
+        if not self.membership.enabled or len(self.membership.members) < 2:
+            return
+        try:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_TICK",
+                "origin": self.instance_id,
+                # Los seq son locales de cada instancia: el receptor asigna los suyos
+                "updates": [{k: v for k, v in u.items() if k != "seq"} for u in updated_timers],
+                "server_timestamp": server_ts
+            }, persistent=False)
+        except Exception as e:
+            timer_logger.error(f"MQ publish TIMERS_TICK error: {e}")
+
+    async def apply_remote_tick(self, updates: List[Dict[str, Any]], server_ts: int):
+        """Aplicar el tick publicado por la instancia dueña y retransmitirlo a las salas locales."""
+        local_updates = []
+        for update in updates:
+            timer = self.timers.get(update.get("timerId"))
+            if timer is None:
+                continue
+            timer.tiempoRestanteSegundos = update.get("tiempoRestanteSegundos", timer.tiempoRestanteSegundos)
+            if update.get("completado") and not timer.completado:
+                timer.completado = True
+                timer.activo = False
+                if isinstance(update.get("version"), int):
+                    timer.version = max(timer.version, update["version"])
+                self.timers.reindex(timer)
+                self.scheduler.cancel(timer.id)
+                self.persist_remote(timer)
+                seq = self.changelog.record(self.timer_tenant(timer), {
+                    "type": "TIMER_UPDATED",
+                    "data": {"timer": timer.to_dict()}
+                })
+                self.sync_cache.touch(self.timer_tenant(timer))
+                local_updates.append({**update, "seq": seq})
+            else:
+                local_updates.append(update)
+        if local_updates:
+            await self.broadcast_tick_updates(local_updates, server_ts)
+
+    async def apply_completion_transitions(self):
+        """Aplicar la transición de inventario de los timers completados y avisar a cada sala
+        con un único inventory_updated (los clientes ya no parchean el estado uno a uno)"""
+        changed = await self.transitions.flush()
+        for tenant, items in changed.items():
+            if not items:
+                continue
+            timer_logger.info(f"Transición automática de {len(items)} items por timers completados (tenant={tenant})")
+            await self.broadcast({
+                "type": "inventory_updated",
+                "data": {"origen": "timer_completed", "items": items, "timestamp": get_utc_now().isoformat()}
+            }, tenant=tenant)
+
     async def tick_timers(self):
-        """Actualizar todos los timers activos cada segundo"""
-        save_counter = 0
+        """Recorrer los timers activos cada segundo y despertar además en cada completación propia"""
         log_counter = 0
-        timer_logger.info("tick_timers iniciado - comenzando loop de actualización")
+        next_scan_ts = 0.0
+        timer_logger.info(
+            f"tick_timers iniciado - comenzando loop de actualización (modo={TIMER_TICK_MODE}, "
+            f"cadencia={self.cadence.describe()})"
+        )
         while self.running:
             try:
                 current_time = get_utc_now()  # Usar get_utc_now() para consistencia de timezone
-                updated_timers = []
-                timers_changed = False
+                now_ts = current_time.timestamp()
+                scan = now_ts >= next_scan_ts
+                if scan:
+                    # Paso fijo de 1 s sin acumular la deriva del procesamiento
+                    next_scan_ts = next_scan_ts + 1 if now_ts - next_scan_ts < 1 else now_ts + 1
+                updated_timers = self.collect_tick_updates(current_time, scan=scan)
                 
-                for timer_id, timer in self.timers.items():
-                    if not timer.activo or timer.completado:
-                        continue
-                        
-                    # Calcular tiempo restante basado en fecha fin
-                    tiempo_restante_ms = (timer.fechaFin - current_time).total_seconds()
-                    nuevo_tiempo_restante = max(0, int(tiempo_restante_ms))
-                    
-                    # Actualizar timer si hay cambio
-                    if nuevo_tiempo_restante != timer.tiempoRestanteSegundos:
-                        timer.tiempoRestanteSegundos = nuevo_tiempo_restante
-                        timers_changed = True
-                        
-                        # Verificar si se completó
-                        if nuevo_tiempo_restante == 0 and not timer.completado:
-                            timer.completado = True
-                            timer.activo = False
-                            timer_logger.info(f"Timer completado: {timer.nombre} ({timer_id})")
-                    
-                    # SIEMPRE enviar actualización para timers activos
-                    # Esto garantiza que el frontend se mantenga sincronizado
-                    updated_timers.append({
-                        "timerId": timer_id,
-                        "tiempoRestanteSegundos": timer.tiempoRestanteSegundos,
-                        "completado": timer.completado,
-                        "activo": timer.activo
-                    })
-                
-                # Enviar actualizaciones para todos los timers activos
+                # Enviar actualizaciones de los timers activos
                 if updated_timers:
                     # Solo log cada 10 segundos para evitar spam
                     if log_counter % 10 == 0:
                         timer_logger.info(f"Enviando {len(updated_timers)} actualizaciones de timer a {len(self.connections)} clientes")
                     
                     server_ts = self.get_server_timestamp()
-                    for update in updated_timers:
-                        await self.broadcast({
-                            "type": "TIMER_TIME_UPDATE",
-                            "data": {**update, "server_timestamp": server_ts}
-                        })
-                
-                # Guardar en archivo cada 30 segundos si hay cambios
-                save_counter += 1
-                if timers_changed and save_counter >= 30:
-                    self.save_timers_to_file()
-                    save_counter = 0
+                    await self.broadcast_tick_updates(updated_timers, server_ts)
+                    await self.publish_tick(updated_timers, server_ts)
+                    # Las completaciones van a alerts_service por la cola timer_completed
+                    self.completions.schedule_flush()
+                if self.transitions.due(now_ts):
+                    asyncio.create_task(self.apply_completion_transitions())
                 
                 # Log periódico cada 30 segundos para reducir spam
-                log_counter += 1
-                if log_counter % 30 == 0:
+                if scan:
+                    log_counter += 1
+                if scan and log_counter % 30 == 0:
                     timer_logger.info(f"tick_timers activo - {len(self.timers)} timers, {len(self.connections)} conexiones")
+                    self.tombstones.prune()
+                    for timer_id in [tid for tid in self.reported_remaining if tid not in self.scheduler]:
+                        del self.reported_remaining[timer_id]
                     log_counter = 0
                 
-                await asyncio.sleep(1)  # Actualizar cada segundo
+                await asyncio.sleep(self.tick_delay(get_utc_now().timestamp(), next_scan_ts))
                 
             except Exception as e:
                 timer_logger.error(f"Error en tick_timers: {e}")
@@ -632,6 +1528,13 @@ async def ensure_timer_task_running():
 @app.on_event("startup")
 async def timers_mq_startup():
     """Conectar a RabbitMQ y replicar eventos de timers."""
+    # Cargar timers persistidos antes de anunciar el digest a otras instancias
+    try:
+        await timer_manager.start_persistence()
+    except Exception as e:
+        timer_logger.error(f"Error iniciando persistencia de timers: {e}")
+    asyncio.create_task(timer_manager.run_retention())
+
     try:
         await message_queue.connect()
         timer_logger.info("MQ conectado para timers (API gateway)")
@@ -643,82 +1546,177 @@ async def timers_mq_startup():
                 evt = msg.get("event")
                 if evt == "TIMER_CREATED":
                     data = msg.get("timer")
-                    if data:
+                    if data and timer_manager.accepts_remote(data.get("id"), data.get("version")):
                         # parse dates
                         if isinstance(data.get("fechaInicio"), str):
                             data["fechaInicio"] = parse_iso_datetime(data["fechaInicio"])
                         if isinstance(data.get("fechaFin"), str):
                             data["fechaFin"] = parse_iso_datetime(data["fechaFin"])
-                        t = Timer(**data)
+                        t = timer_from_record(data)
                         timer_manager.timers[t.id] = t
-                        await timer_manager.broadcast({
+                        timer_manager.sync_schedule(t)
+                        timer_manager.persist_remote(t)
+                        await timer_manager.publish_change({
                             "type": "TIMER_CREATED",
                             "data": {"timer": {**t.to_dict(), "server_timestamp": msg.get("server_timestamp")}}
-                        })
+                        }, timer_manager.timer_tenant(t))
+                elif evt == "TIMERS_CREATED_BATCH":
+                    por_tenant: Dict[str, List[Dict[str, Any]]] = {}
+                    for data in msg.get("timers", []):
+                        if not timer_manager.accepts_remote(data.get("id"), data.get("version")):
+                            continue
+                        for date_field in ("fechaInicio", "fechaFin"):
+                            if isinstance(data.get(date_field), str):
+                                data[date_field] = parse_iso_datetime(data[date_field])
+                        t = timer_from_record(data)
+                        timer_manager.timers[t.id] = t
+                        timer_manager.sync_schedule(t)
+                        timer_manager.persist_remote(t)
+                        por_tenant.setdefault(timer_manager.timer_tenant(t), []).append(
+                            {**t.to_dict(), "server_timestamp": msg.get("server_timestamp")}
+                        )
+                    for tenant, timers in por_tenant.items():
+                        await timer_manager.publish_change({
+                            "type": "TIMERS_CREATED_BATCH",
+                            "data": {"timers": timers, "server_timestamp": msg.get("server_timestamp")}
+                        }, tenant)
                 elif evt == "TIMER_UPDATED":
                     data = msg.get("timer")
-                    if data and data.get("id") in timer_manager.timers:
+                    if (data and data.get("id") in timer_manager.timers
+                            and timer_manager.accepts_remote(data["id"], data.get("version"))):
                         tid = data["id"]
                         for k, v in data.items():
                             if k in ("fechaInicio", "fechaFin") and isinstance(v, str):
                                 v = parse_iso_datetime(v)
                             setattr(timer_manager.timers[tid], k, v)
-                        await timer_manager.broadcast({
+                        timer_manager.sync_schedule(timer_manager.timers[tid])
+                        timer_manager.persist_remote(timer_manager.timers[tid])
+                        await timer_manager.publish_change({
                             "type": "TIMER_UPDATED",
                             "data": {"timer": {**timer_manager.timers[tid].to_dict(), "server_timestamp": msg.get("server_timestamp")}}
-                        })
+                        }, timer_manager.timer_tenant(timer_manager.timers[tid]))
                 elif evt == "TIMER_DELETED":
                     tid = msg.get("timerId")
-                    if tid and tid in timer_manager.timers:
-                        timer_manager.timers.pop(tid, None)
-                        await timer_manager.broadcast({
+                    if tid and isinstance(msg.get("version"), int):
+                        timer_manager.tombstones.add(tid, msg["version"])
+                    if tid and tid in timer_manager.timers and timer_manager.accepts_delete(tid, msg.get("version")):
+                        t = timer_manager.timers.pop(tid)
+                        timer_manager.scheduler.cancel(tid)
+                        timer_manager.reported_remaining.pop(tid, None)
+                        timer_manager.persist_remote_delete(t)
+                        await timer_manager.publish_change({
                             "type": "TIMER_DELETED",
                             "data": {"timerId": tid}
-                        })
+                        }, timer_manager.timer_tenant(t))
+                elif evt == "TIMERS_UPDATED_BATCH":
+                    por_tenant: Dict[str, List[Dict[str, Any]]] = {}
+                    for data in msg.get("timers", []):
+                        t = timer_manager.timers.get(data.get("id"))
+                        if t is None or not timer_manager.accepts_remote(t.id, data.get("version")):
+                            continue
+                        for k, v in data.items():
+                            if k in ("fechaInicio", "fechaFin") and isinstance(v, str):
+                                v = parse_iso_datetime(v)
+                            if hasattr(t, k):
+                                setattr(t, k, v)
+                        timer_manager.sync_schedule(t)
+                        timer_manager.persist_remote(t)
+                        por_tenant.setdefault(timer_manager.timer_tenant(t), []).append(
+                            {**t.to_dict(), "server_timestamp": msg.get("server_timestamp")}
+                        )
+                    for tenant, timers in por_tenant.items():
+                        await timer_manager.publish_change({
+                            "type": "TIMERS_UPDATED_BATCH",
+                            "data": {"timers": timers, "server_timestamp": msg.get("server_timestamp")}
+                        }, tenant)
+                elif evt == "TIMERS_DELETED_BATCH":
+                    por_tenant_ids: Dict[str, List[str]] = {}
+                    versiones = msg.get("versions") or {}
+                    for tid in msg.get("timerIds", []):
+                        if isinstance(versiones.get(tid), int):
+                            timer_manager.tombstones.add(tid, versiones[tid])
+                        t = timer_manager.timers.get(tid)
+                        if t is None or not timer_manager.accepts_delete(tid, versiones.get(tid)):
+                            continue
+                        del timer_manager.timers[tid]
+                        timer_manager.scheduler.cancel(tid)
+                        timer_manager.reported_remaining.pop(tid, None)
+                        timer_manager.persist_remote_delete(t)
+                        por_tenant_ids.setdefault(timer_manager.timer_tenant(t), []).append(tid)
+                    for tenant, ids in por_tenant_ids.items():
+                        await timer_manager.publish_change({
+                            "type": "TIMERS_DELETED_BATCH",
+                            "data": {"timerIds": ids}
+                        }, tenant)
+                elif evt == "TIMERS_CHANGED_BATCH":
+                    # Lote de pausa/reanudación/eliminación: timers y lápidas con su versión
+                    await timer_manager.merge_remote(msg.get("timers", []), msg.get("tombstones") or {})
+                elif evt == "TIMERS_TICK":
+                    await timer_manager.apply_remote_tick(msg.get("updates", []), msg.get("server_timestamp"))
+                elif evt == "TIMERS_DIGEST":
+                    await timer_manager.handle_digest(msg)
+                elif evt == "TIMERS_MERGE":
+                    await timer_manager.handle_merge(msg)
                 elif evt == "TIMERS_SNAPSHOT":
-                    timers = msg.get("timers", [])
-                    new_map = {}
-                    for data in timers:
-                        if isinstance(data.get("fechaInicio"), str):
-                            data["fechaInicio"] = parse_iso_datetime(data["fechaInicio"])
-                        if isinstance(data.get("fechaFin"), str):
-                            data["fechaFin"] = parse_iso_datetime(data["fechaFin"])
-                        t = Timer(**data)
-                        new_map[t.id] = t
-                    timer_manager.timers = new_map
-                    server_ts = timer_manager.get_server_timestamp()
-                    payload = [{**t.to_dict(), "server_timestamp": server_ts} for t in timer_manager.timers.values()]
-                    await timer_manager.broadcast({
-                        "type": "TIMER_SYNC",
-                        "data": {"timers": payload, "server_timestamp": server_ts}
-                    })
+                    # Instancias anteriores (despliegue escalonado): se fusiona en lugar de reemplazar
+                    await timer_manager.merge_remote(msg.get("timers", []), {})
             except Exception as e:
                 timer_logger.error(f"Error procesando evento MQ (API GW): {e}")
 
         await message_queue.consume_fanout("timers.events", on_event)
         timer_logger.info("Suscrito a fanout timers.events (API gateway)")
 
-        # Emitir snapshot inicial
-        await message_queue.publish_fanout("timers.events", {
-            "event": "TIMERS_SNAPSHOT",
-            "origin": timer_manager.instance_id,
-            "timers": [t.to_dict() for t in timer_manager.timers.values()]
-        })
+        # Latidos de pertenencia: reparto de timers entre instancias vivas
+        try:
+            await timer_manager.membership.start()
+        except Exception as e:
+            timer_logger.error(f"No se pudo iniciar el reparto de timers (cada instancia gestiona todos): {e}")
+
+        # Anunciar el digest (id -> versión): las demás instancias responden solo con lo que difiere
+        await message_queue.publish_fanout("timers.events", timer_manager.build_digest_message())
     except Exception as e:
         timer_logger.error(f"No se pudo inicializar MQ (API gateway): {e}")
 
 
+def _ws_tenant_from_token(websocket: WebSocket) -> Optional[str]:
+    """Tenant del JWT de la conexión (query ?token= o cabecera Authorization: Bearer).
+
+    Devuelve None si no hay token válido.
+    """
+    token = websocket.query_params.get("token")
+    if not token:
+        auth = websocket.headers.get("authorization", "")
+        if auth.lower().startswith("bearer "):
+            token = auth[7:].strip()
+    if not token:
+        return None
+    try:
+        current_user = get_current_user_from_token(token)
+    except HTTPException:
+        return None
+    return _get_tenant_schema_from_user(current_user)
+
+
 @app.websocket("/ws/timers")
 async def websocket_endpoint(websocket: WebSocket):
-    """Endpoint principal de WebSocket para timers"""
+    """Endpoint principal de WebSocket para timers (una sala por tenant)"""
     timer_logger.info("Nueva conexión WebSocket intentando conectarse")
+    tenant = _ws_tenant_from_token(websocket)
+    if tenant is None:
+        if WS_TIMERS_REQUIRE_AUTH:
+            timer_logger.warning("Conexión WebSocket rechazada: token ausente o inválido")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        tenant = DEFAULT_TENANT_SCHEMA
     await websocket.accept()
-    timer_logger.info("Conexión WebSocket aceptada")
+    timer_logger.info(f"Conexión WebSocket aceptada (tenant={tenant})")
     
     # Asegurar que el background task esté ejecutándose
     await ensure_timer_task_running()
     
-    await timer_manager.add_connection(websocket)
+    # ?sync=request: el cliente pedirá su propio REQUEST_SYNC (con since_seq) en lugar del snapshot inicial
+    send_sync = websocket.query_params.get("sync") != "request"
+    await timer_manager.add_connection(websocket, tenant, send_sync=send_sync)
     
     try:
         while True:
@@ -731,55 +1729,50 @@ async def websocket_endpoint(websocket: WebSocket):
             message_type = message.get("type")
             message_data = message.get("data", {})
             
-            if message_type == "REQUEST_SYNC":
-                # Cliente solicita sincronización completa
-                server_ts = timer_manager.get_server_timestamp()
-                await timer_manager.send_to_client(websocket, {
-                    "type": "TIMER_SYNC",
-                    "data": {
-                        "timers": [{**t.to_dict(), "server_timestamp": server_ts} for t in timer_manager.timers.values()],
-                        "server_timestamp": server_ts
-                    }
-                })
-            elif message_type == "SYNC_REQUEST":
-                # Compatibilidad con clientes que envían SYNC_REQUEST
-                server_ts = timer_manager.get_server_timestamp()
-                await timer_manager.send_to_client(websocket, {
-                    "type": "TIMER_SYNC",
-                    "data": {
-                        "timers": [{**t.to_dict(), "server_timestamp": server_ts} for t in timer_manager.timers.values()],
-                        "server_timestamp": server_ts
-                    }
-                })
+            if message_type in ("REQUEST_SYNC", "SYNC_REQUEST"):
+                # Cliente solicita sincronización: delta desde since_seq si es posible, si no completa
+                # (SYNC_REQUEST se mantiene por compatibilidad)
+                await timer_manager.send_resync(
+                    websocket, tenant, message_data.get("since_seq"), message_data.get("epoch")
+                )
                 
             elif message_type == "CREATE_TIMER":
                 timer_data = message_data.get("timer")
                 if timer_data:
-                    await timer_manager.create_timer(timer_data, websocket)
+                    # El timer pertenece siempre al tenant de la conexión
+                    timer_data["tenant"] = tenant
+                    if timer_data.get("id") in timer_manager.timers and not timer_manager.belongs_to(timer_data["id"], tenant):
+                        timer_logger.warning(f"CREATE_TIMER ignorado: timer {timer_data['id']} de otro tenant")
+                    else:
+                        await timer_manager.create_timer(timer_data, websocket)
                     
             elif message_type == "PAUSE_TIMER":
                 timer_id = message_data.get("timerId")
-                if timer_id:
+                if timer_id and timer_manager.belongs_to(timer_id, tenant):
                     await timer_manager.pause_timer(timer_id, websocket)
                     
             elif message_type == "RESUME_TIMER":
                 timer_id = message_data.get("timerId")
-                if timer_id:
+                if timer_id and timer_manager.belongs_to(timer_id, tenant):
                     await timer_manager.resume_timer(timer_id, websocket)
                     
             elif message_type == "DELETE_TIMER":
                 timer_id = message_data.get("timerId")
-                if timer_id:
+                if timer_id and timer_manager.belongs_to(timer_id, tenant):
                     await timer_manager.delete_timer(timer_id, websocket)
+                    
+            elif message_type in BATCH_ACTIONS:
+                # Pausar / reanudar / eliminar por lista de ids, inventario_ids, rfids o lote
+                timer_ids = await select_timers_batch(tenant, message_data)
+                if timer_ids:
+                    await timer_manager.control_timers_batch(BATCH_ACTIONS[message_type], timer_ids)
+                    
             elif message_type == "FORCE_BROADCAST_SYNC":
-                server_ts = timer_manager.get_server_timestamp()
-                await timer_manager.broadcast({
-                    "type": "TIMER_SYNC",
-                    "data": {
-                        "timers": [{**t.to_dict(), "server_timestamp": server_ts} for t in timer_manager.timers.values()],
-                        "server_timestamp": server_ts
-                    }
-                })
+                await timer_manager.broadcast_sync(tenant)
+                
+            elif message_type == "PING":
+                # Sincronización de reloj estilo NTP (y keepalive)
+                await timer_manager.handle_ping(websocket, message_data)
                     
             else:
                 timer_logger.warning(f"Tipo de mensaje no reconocido: {message_type}")
@@ -795,14 +1788,37 @@ async def websocket_endpoint(websocket: WebSocket):
         await timer_manager.remove_connection(websocket)
 
 
-async def send_ws_notification(message_type: str, data: Dict):
-    await timer_manager.broadcast({"type": message_type, "data": data})
+def _inventario_ids_por_lote(tenant_schema: str, lotes: List[str]) -> List[int]:
+    """Ids de inventario de los lotes indicados (los timers se vinculan al item, no al lote)."""
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            text(f"SELECT id FROM {tenant_schema}.inventario_credocubes WHERE lote = ANY(:lotes)"),
+            {"lotes": lotes},
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+async def select_timers_batch(tenant: str, data: Dict[str, Any]) -> List[str]:
+    """Ids de los timers del tenant que selecciona un mensaje / cuerpo de operación por lote."""
+    selector = TimerSelector.from_message(data)
+    if selector.lotes:
+        try:
+            selector.add_inventario_ids(await asyncio.to_thread(_inventario_ids_por_lote, tenant, selector.lotes))
+        except Exception as e:
+            timer_logger.error(f"No se pudieron resolver los lotes {selector.lotes}: {e}")
+    return selector.select(timer_manager.timers, tenant, timer_manager.timer_tenant)
+
+
+async def send_ws_notification(message_type: str, data: Dict, tenant: Optional[str] = None):
+    await timer_manager.broadcast({"type": message_type, "data": data}, tenant=tenant)
 
 
 @app.post("/api/alerts/timer-completed")
 async def handle_timer_completed(event: TimerCompletedEvent):
     try:
-        await send_ws_notification("timer_completed", event.model_dump())
+        timer = timer_manager.timers.get(event.timer.id)
+        tenant = timer_manager.timer_tenant(timer) if timer is not None else None
+        await send_ws_notification("timer_completed", event.model_dump(), tenant=tenant)
         print(f"✅ Evento timer-completed procesado para: {event.timer.nombre}")
         return {"status": "success"}
     except Exception as e:
@@ -1051,28 +2067,13 @@ def api_reports_metrics(
 
 @app.get("/api/inventory/dashboard/metrics")
 def api_inventory_dashboard_metrics(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     """Métricas del dashboard (unificado)."""
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        query = text(
-            f"""
-            SELECT 
-                COUNT(*) as total_items,
-                COUNT(CASE WHEN LOWER(estado) = 'en bodega' THEN 1 END) as en_bodega,
-                COUNT(CASE WHEN LOWER(estado) IN ('en operacion','en operación') THEN 1 END) as en_operacion,
-                COUNT(CASE WHEN LOWER(estado) = 'en limpieza' THEN 1 END) as en_limpieza,
-                COUNT(CASE WHEN LOWER(estado) IN ('en devolucion','en devolución') THEN 1 END) as en_devolucion,
-                COUNT(CASE WHEN LOWER(estado) NOT IN ('en bodega','en operacion','en operación','en limpieza','en devolucion','en devolución') THEN 1 END) as otros_estados,
-                COUNT(CASE WHEN validacion_limpieza IS NULL OR validacion_goteo IS NULL OR validacion_desinfeccion IS NULL THEN 1 END) as por_validar,
-                COUNT(CASE WHEN validacion_limpieza IS NOT NULL AND validacion_goteo IS NOT NULL AND validacion_desinfeccion IS NOT NULL THEN 1 END) as validados
-            FROM {tenant_schema}.inventario_credocubes 
-            WHERE activo = true
-            """
-        )
-        row = db.execute(query).fetchone()
+        row = db.execute(consulta("dashboard.metricas")).fetchone()
         if row:
             return DashboardMetrics(**dict(row._mapping))
         return DashboardMetrics(
@@ -1092,34 +2093,12 @@ def api_inventory_dashboard_metrics(
 
 @app.get("/api/inventory/dashboard/processing-data")
 def api_inventory_processing_data(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        query = text(
-            f"""
-            WITH monthly_data AS (
-                SELECT 
-                    TO_CHAR(fecha_ingreso, 'Mon') as mes,
-                    COUNT(CASE WHEN LOWER(estado) IN ('recepcion','recepción') THEN 1 END) as recepcion,
-                    COUNT(CASE WHEN LOWER(estado) IN ('inspeccion','inspección') THEN 1 END) as inspeccion,
-                    COUNT(CASE WHEN LOWER(estado) = 'en limpieza' THEN 1 END) as limpieza,
-                    COUNT(CASE WHEN LOWER(estado) IN ('en operacion','en operación') THEN 1 END) as operacion
-                FROM {tenant_schema}.inventario_credocubes 
-                WHERE activo = true AND fecha_ingreso >= NOW() - INTERVAL '12 months'
-                GROUP BY DATE_TRUNC('month', fecha_ingreso), TO_CHAR(fecha_ingreso, 'Mon')
-                ORDER BY DATE_TRUNC('month', fecha_ingreso)
-            )
-            SELECT mes,
-                   COALESCE(recepcion,0) as recepcion,
-                   COALESCE(inspeccion,0) as inspeccion,
-                   COALESCE(limpieza,0) as limpieza,
-                   COALESCE(operacion,0) as operacion
-            FROM monthly_data
-            """
-        )
-        result = db.execute(query)
+        result = db.execute(consulta("dashboard.procesamiento"))
         return [ProcessingData(**dict(r._mapping)) for r in result]
     except Exception as e:
         print(f"Error obteniendo processing-data ({tenant_schema}): {e}")
@@ -1128,22 +2107,12 @@ def api_inventory_processing_data(
 
 @app.get("/api/inventory/dashboard/recent-activity")
 def api_inventory_recent_activity(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        query = text(
-            f"""
-            SELECT a.id, a.inventario_id, a.descripcion, a.timestamp,
-                   i.nombre_unidad, i.rfid, a.estado_nuevo
-            FROM {tenant_schema}.actividades_operacion a
-            LEFT JOIN {tenant_schema}.inventario_credocubes i ON a.inventario_id = i.id
-            ORDER BY a.timestamp DESC
-            LIMIT 10
-            """
-        )
-        result = db.execute(query)
+        result = db.execute(consulta("dashboard.actividad_reciente"))
         return [ActivityItem(**dict(r._mapping)) for r in result]
     except Exception as e:
         print(f"Error obteniendo recent-activity ({tenant_schema}): {e}")
@@ -1172,22 +2141,14 @@ def api_alerts_list(
     resuelta: Optional[bool] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
-    base = f"SELECT id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion FROM {tenant_schema}.alertas WHERE 1=1"
-    params: Dict[str, any] = {}
-    if inventario_id is not None:
-        base += " AND inventario_id = :inventario_id"
-        params["inventario_id"] = inventario_id
-    if resuelta is not None:
-        base += " AND resuelta = :resuelta"
-        params["resuelta"] = resuelta
-    base += " ORDER BY fecha_creacion DESC OFFSET :skip LIMIT :limit"
-    params.update({"skip": skip, "limit": limit})
+    # Filtros opcionales: None = sin filtro (misma sentencia para cualquier combinación)
+    params = {"inventario_id": inventario_id, "resuelta": resuelta, "skip": skip, "limit": limit}
     try:
-        rows = db.execute(text(base), params).fetchall()
+        rows = db.execute(consulta("alertas.listado"), params).fetchall()
         return [
             {
                 "id": r[0],
@@ -1208,15 +2169,12 @@ def api_alerts_list(
 @app.get("/api/alerts/alertas/{alerta_id}")
 def api_alerts_get(
     alerta_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        q = text(
-            f"SELECT id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion FROM {tenant_schema}.alertas WHERE id = :id"
-        )
-        r = db.execute(q, {"id": alerta_id}).fetchone()
+        r = db.execute(consulta("alertas.por_id"), {"id": alerta_id}).fetchone()
         if not r:
             raise HTTPException(status_code=404, detail="Alerta no encontrada")
         return {
@@ -1238,20 +2196,13 @@ def api_alerts_get(
 @app.post("/api/alerts/alertas/")
 def api_alerts_create(
     alerta: AlertaCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        q = text(
-            f"""
-            INSERT INTO {tenant_schema}.alertas (inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta)
-            VALUES (:inventario_id, :tipo_alerta, :descripcion, NOW(), false)
-            RETURNING id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion
-            """
-        )
         r = db.execute(
-            q,
+            consulta("alertas.insertar"),
             {
                 "inventario_id": alerta.inventario_id,
                 "tipo_alerta": alerta.tipo_alerta,
@@ -1278,15 +2229,13 @@ def api_alerts_create(
 def api_alerts_update(
     alerta_id: int,
     alerta: AlertaUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
         # verificar existencia
-        exists = db.execute(
-            text(f"SELECT id FROM {tenant_schema}.alertas WHERE id = :id"), {"id": alerta_id}
-        ).fetchone()
+        exists = db.execute(consulta("alertas.existe"), {"id": alerta_id}).fetchone()
         if not exists:
             raise HTTPException(status_code=404, detail="Alerta no encontrada")
 
@@ -1302,14 +2251,11 @@ def api_alerts_update(
             params["descripcion"] = alerta.descripcion
 
         if not update_fields:
-            q = text(
-                f"SELECT id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion FROM {tenant_schema}.alertas WHERE id = :id"
-            )
-            r = db.execute(q, {"id": alerta_id}).fetchone()
+            r = db.execute(consulta("alertas.por_id"), {"id": alerta_id}).fetchone()
         else:
             q = text(
                 f"""
-                UPDATE {tenant_schema}.alertas 
+                UPDATE alertas 
                 SET {', '.join(update_fields)}
                 WHERE id = :id
                 RETURNING id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion
@@ -1338,13 +2284,12 @@ def api_alerts_update(
 @app.delete("/api/alerts/alertas/{alerta_id}", status_code=204)
 def api_alerts_delete(
     alerta_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        q = text(f"DELETE FROM {tenant_schema}.alertas WHERE id = :id RETURNING id")
-        r = db.execute(q, {"id": alerta_id}).fetchone()
+        r = db.execute(consulta("alertas.eliminar"), {"id": alerta_id}).fetchone()
         if not r:
             raise HTTPException(status_code=404, detail="Alerta no encontrada")
         db.commit()
@@ -1427,23 +2372,12 @@ class EstadoUpdate(BaseModel):
 def api_inventory_modelos(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        q = text(
-            f"""
-            SELECT modelo_id, nombre_modelo, volumen_litros, descripcion,
-                   dim_ext_frente, dim_ext_profundo, dim_ext_alto,
-                   dim_int_frente, dim_int_profundo, dim_int_alto,
-                   tic_frente, tic_alto, peso_total_kg, tipo
-            FROM {tenant_schema}.modelos
-            ORDER BY nombre_modelo
-            OFFSET :skip LIMIT :limit
-            """
-        )
-        rows = db.execute(q, {"skip": skip, "limit": limit})
+        rows = db.execute(consulta("modelos.listado"), {"skip": skip, "limit": limit})
         return [ModeloResponse(**dict(r._mapping)) for r in rows]
     except Exception as e:
         print(f"Error listando modelos ({tenant_schema}): {e}")
@@ -1465,19 +2399,11 @@ def api_inventory_verificar_rfid(rfid: str, db: Session = Depends(get_db)):
 
 # ===== Inventario CRUD y utilidades usadas por Operación =====
 
-def _generar_lote_automatico(db: Session, tenant_schema: str) -> str:
+def _generar_lote_automatico(db: Session) -> str:
     """Genera lote YYYYMMDDXXX incrementando el último del día."""
     try:
         fecha_actual = datetime.now().strftime("%Y%m%d")
-        q = text(
-            f"""
-            SELECT lote FROM {tenant_schema}.inventario_credocubes
-            WHERE lote LIKE :prefijo
-            ORDER BY lote DESC
-            LIMIT 1
-            """
-        )
-        ultimo = db.execute(q, {"prefijo": f"{fecha_actual}%"}).fetchone()
+        ultimo = db.execute(consulta("inventario.ultimo_lote_del_dia"), {"prefijo": f"{fecha_actual}%"}).fetchone()
         sec = 1
         if ultimo and ultimo[0] and isinstance(ultimo[0], str) and len(ultimo[0]) >= 11:
             try:
@@ -1494,26 +2420,13 @@ def _generar_lote_automatico(db: Session, tenant_schema: str) -> str:
 def api_inventory_list(
     skip: int = 0,
     limit: int = 1000,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     """Lista completa del inventario activo, unida con modelos."""
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        q = text(
-            f"""
-            SELECT i.id, i.modelo_id, m.nombre_modelo, i.nombre_unidad, i.rfid,
-                   i.lote, i.estado, i.sub_estado, i.validacion_limpieza,
-                   i.validacion_goteo, i.validacion_desinfeccion, i.categoria,
-                   i.fecha_ingreso, i.ultima_actualizacion, i.fecha_vencimiento, i.activo
-            FROM {tenant_schema}.inventario_credocubes i
-            LEFT JOIN {tenant_schema}.modelos m ON i.modelo_id = m.modelo_id
-            WHERE i.activo = true
-            ORDER BY i.ultima_actualizacion DESC, i.fecha_ingreso DESC
-            OFFSET :skip LIMIT :limit
-            """
-        )
-        rows = db.execute(q, {"skip": skip, "limit": limit})
+        rows = db.execute(consulta("inventario.listado"), {"skip": skip, "limit": limit})
         return [InventarioResponse(**dict(r._mapping)) for r in rows]
     except Exception as e:
         print(f"Error listando inventario ({tenant_schema}): {e}")
@@ -1523,32 +2436,18 @@ def api_inventory_list(
 @app.post("/api/inventory/inventario/")
 def api_inventory_create(
     item: InventarioCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
         # evitar duplicados de RFID activos
-        exists = db.execute(
-            text(f"SELECT id FROM {tenant_schema}.inventario_credocubes WHERE rfid = :rfid AND activo = true"),
-            {"rfid": item.rfid},
-        ).fetchone()
+        exists = db.execute(consulta("inventario.rfid_activo"), {"rfid": item.rfid}).fetchone()
         if exists:
             raise HTTPException(status_code=400, detail=f"Ya existe un credcube con RFID {item.rfid}")
 
-        q = text(
-            f"""
-            INSERT INTO {tenant_schema}.inventario_credocubes
-            (modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
-             validacion_limpieza, validacion_goteo, validacion_desinfeccion, categoria,
-             fecha_ingreso, ultima_actualizacion, activo)
-            VALUES (:modelo_id, :nombre_unidad, :rfid, :lote, :estado, :sub_estado,
-                    :validacion_limpieza, :validacion_goteo, :validacion_desinfeccion, :categoria,
-                    NOW(), NOW(), true)
-            RETURNING id
-            """
-        )
-        new_id = db.execute(q, item.model_dump()).fetchone()[0]
+        params = {**item.model_dump(), "fecha_ingreso": None, "ultima_actualizacion": None}
+        new_id = db.execute(consulta("inventario.insertar"), params).fetchone()[0]
         db.commit()
         return {"id": new_id}
     except HTTPException:
@@ -1563,26 +2462,18 @@ def api_inventory_create(
 def api_inventory_update(
     inventario_id: int,
     inventario: InventarioUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        exists = db.execute(
-            text(f"SELECT id FROM {tenant_schema}.inventario_credocubes WHERE id = :id"),
-            {"id": inventario_id},
-        ).fetchone()
+        exists = db.execute(consulta("inventario.existe"), {"id": inventario_id}).fetchone()
         if not exists:
             raise HTTPException(status_code=404, detail="Inventario no encontrado")
 
         # Verificar RFID único si se cambia
         if inventario.rfid is not None:
-            r = db.execute(
-                text(
-                    f"SELECT id FROM {tenant_schema}.inventario_credocubes WHERE rfid = :rfid AND id != :id"
-                ),
-                {"rfid": inventario.rfid, "id": inventario_id},
-            ).fetchone()
+            r = db.execute(consulta("inventario.rfid_en_otro"), {"rfid": inventario.rfid, "id": inventario_id}).fetchone()
             if r:
                 raise HTTPException(status_code=400, detail=f"Ya existe un credcube con RFID {inventario.rfid}")
 
@@ -1596,10 +2487,10 @@ def api_inventory_update(
         fields.append("ultima_actualizacion = CURRENT_TIMESTAMP")
         q = text(
             f"""
-            UPDATE {tenant_schema}.inventario_credocubes
+            UPDATE inventario_credocubes
             SET {', '.join(fields)}
             WHERE id = :id
-            RETURNING id, modelo_id, (SELECT nombre_modelo FROM {tenant_schema}.modelos m WHERE m.modelo_id = {tenant_schema}.inventario_credocubes.modelo_id) as nombre_modelo,
+            RETURNING id, modelo_id, (SELECT nombre_modelo FROM modelos m WHERE m.modelo_id = inventario_credocubes.modelo_id) as nombre_modelo,
                       nombre_unidad, rfid, lote, estado, sub_estado,
                       validacion_limpieza, validacion_goteo, validacion_desinfeccion,
                       categoria, fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
@@ -1620,15 +2511,12 @@ def api_inventory_update(
 def api_inventory_update_estado(
     inventario_id: int,
     estado_update: EstadoUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
-        exists = db.execute(
-            text(f"SELECT id FROM {tenant_schema}.inventario_credocubes WHERE id = :id"),
-            {"id": inventario_id},
-        ).fetchone()
+        exists = db.execute(consulta("inventario.existe"), {"id": inventario_id}).fetchone()
         if not exists:
             raise HTTPException(status_code=404, detail="Inventario no encontrado")
 
@@ -1638,28 +2526,13 @@ def api_inventory_update_estado(
             sub = estado_update.sub_estado.strip().lower() if estado_update.sub_estado else ""
             if est in ["Pre acondicionamiento", "preacondicionamiento"] and sub in ["Congelamiento", "congelacion", "atemperamiento"]:
                 # Si no tiene lote, asignar automático
-                lote_row = db.execute(
-                    text(f"SELECT lote FROM {tenant_schema}.inventario_credocubes WHERE id = :id"),
-                    {"id": inventario_id},
-                ).fetchone()
+                lote_row = db.execute(consulta("inventario.lote"), {"id": inventario_id}).fetchone()
                 if not lote_row or not lote_row[0]:
-                    set_lote = _generar_lote_automatico(db, tenant_schema)
+                    set_lote = _generar_lote_automatico(db)
 
         if set_lote:
-            q = text(
-                f"""
-                UPDATE {tenant_schema}.inventario_credocubes
-                SET estado = :estado, sub_estado = :sub_estado, lote = :lote,
-                    ultima_actualizacion = CURRENT_TIMESTAMP
-                WHERE id = :id
-                RETURNING id, modelo_id, (SELECT nombre_modelo FROM {tenant_schema}.modelos m WHERE m.modelo_id = {tenant_schema}.inventario_credocubes.modelo_id) as nombre_modelo,
-                          nombre_unidad, rfid, lote, estado, sub_estado,
-                          validacion_limpieza, validacion_goteo, validacion_desinfeccion,
-                          categoria, fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
-                """
-            )
             row = db.execute(
-                q,
+                consulta("inventario.actualizar_estado_y_lote"),
                 {
                     "id": inventario_id,
                     "estado": estado_update.estado,
@@ -1668,20 +2541,8 @@ def api_inventory_update_estado(
                 },
             ).fetchone()
         else:
-            q = text(
-                f"""
-                UPDATE {tenant_schema}.inventario_credocubes
-                SET estado = :estado, sub_estado = :sub_estado,
-                    ultima_actualizacion = CURRENT_TIMESTAMP
-                WHERE id = :id
-                RETURNING id, modelo_id, (SELECT nombre_modelo FROM {tenant_schema}.modelos m WHERE m.modelo_id = {tenant_schema}.inventario_credocubes.modelo_id) as nombre_modelo,
-                          nombre_unidad, rfid, lote, estado, sub_estado,
-                          validacion_limpieza, validacion_goteo, validacion_desinfeccion,
-                          categoria, fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
-                """
-            )
             row = db.execute(
-                q,
+                consulta("inventario.actualizar_estado"),
                 {"id": inventario_id, "estado": estado_update.estado, "sub_estado": estado_update.sub_estado},
             ).fetchone()
         db.commit()
@@ -1697,15 +2558,13 @@ def api_inventory_update_estado(
 @app.delete("/api/inventory/inventario/{inventario_id}", status_code=status.HTTP_200_OK)
 def api_inventory_delete_inventario(
     inventario_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     """Eliminar un item del inventario (soft delete)"""
-    tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
         # Verificar que el inventario existe
-        check_query = text(f"SELECT id, rfid FROM {tenant_schema}.inventario_credocubes WHERE id = :id AND activo = true")
-        existing = db.execute(check_query, {"id": inventario_id}).fetchone()
+        existing = db.execute(consulta("inventario.activo_por_id"), {"id": inventario_id}).fetchone()
         
         if not existing:
             raise HTTPException(
@@ -1714,14 +2573,7 @@ def api_inventory_delete_inventario(
             )
         
         # Realizar soft delete (marcar como inactivo)
-        delete_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
-            SET activo = false,
-                ultima_actualizacion = CURRENT_TIMESTAMP
-            WHERE id = :id
-        """)
-        
-        db.execute(delete_query, {"id": inventario_id})
+        db.execute(consulta("inventario.baja"), {"id": inventario_id})
         db.commit()
         
         return {
@@ -1748,31 +2600,25 @@ class AsignarLoteAutomaticoRequest(BaseModel):
 @app.patch("/api/inventory/inventario/asignar-lote-automatico")
 def api_inventory_asignar_lote_automatico(
     req: AsignarLoteAutomaticoRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     current_user: dict = Depends(get_current_user_from_token),
 ):
     tenant_schema = _get_tenant_schema_from_user(current_user)
     try:
         if not req.rfids:
             raise HTTPException(status_code=400, detail="Debe proporcionar RFIDs")
-        lote = _generar_lote_automatico(db, tenant_schema)
-        q = text(
-            f"""
-            UPDATE {tenant_schema}.inventario_credocubes
-            SET lote = :lote, estado = :estado, sub_estado = :sub_estado,
-                ultima_actualizacion = CURRENT_TIMESTAMP
-            WHERE rfid = ANY(:rfids) AND activo = true
-            RETURNING id, nombre_unidad, rfid, lote, estado, sub_estado
-            """
-        )
-        rows = db.execute(q, {"lote": lote, "estado": req.estado, "sub_estado": req.sub_estado, "rfids": req.rfids}).fetchall()
+        lote = _generar_lote_automatico(db)
+        rows = db.execute(
+            consulta("inventario.asignar_lote_y_estado"),
+            {"lote": lote, "estado": req.estado, "sub_estado": req.sub_estado, "rfids": req.rfids},
+        ).fetchall()
         db.commit()
         return {
             "message": f"Lote automático '{lote}' asignado",
             "lote_generado": lote,
             "items_actualizados": len(rows),
             "items": [
-                {"id": r[0], "nombre_unidad": r[1], "rfid": r[2], "lote": r[3], "estado": r[4], "sub_estado": r[5]}
+                {"id": r.id, "nombre_unidad": r.nombre_unidad, "rfid": r.rfid, "lote": r.lote, "estado": r.estado, "sub_estado": r.sub_estado}
                 for r in rows
             ],
         }
@@ -2029,7 +2875,7 @@ def api_activities_create(
         db.commit()
         # Notificar a clientes por WS (best-effort)
         try:
-            asyncio.create_task(send_ws_notification("inventory_update", {"actividad_id": new_id}))
+            asyncio.create_task(send_ws_notification("inventory_update", {"actividad_id": new_id}, tenant=tenant_schema))
         except Exception:
             pass
         return {"id": new_id}
@@ -2883,6 +3729,36 @@ async def startup_event():
         timer_logger.error(f"Error en startup event: {e}")
         # No propagamos el error para permitir que la app arranque
 
+
+@app.on_event("shutdown")
+async def timers_shutdown_event():
+    """Persistir los cambios de timers pendientes antes de apagar"""
+    # Avisar a las demás instancias para que se repartan nuestros timers sin esperar al timeout
+    try:
+        await timer_manager.membership.stop()
+    except Exception as e:
+        timer_logger.error(f"Error saliendo del reparto de timers: {e}")
+    try:
+        await timer_manager.store.stop()
+    except Exception as e:
+        timer_logger.error(f"Error cerrando persistencia de timers: {e}")
+
+@app.on_event("startup")
+async def db_pool_prewarm():
+    """Abrir DB_POOL_PREWARM conexiones antes de recibir tráfico"""
+    try:
+        await asyncio.to_thread(prewarm_pool)
+    except Exception as e:
+        timer_logger.error(f"No se pudo precalentar el pool de DB: {e}")
+
+
+@app.get("/api/metrics/db-pool")
+def db_pool_metrics(formato: str = Query("json", description="json | prometheus")):
+    """Estado y telemetría del pool de conexiones a la base de datos"""
+    if formato == "prometheus":
+        return PlainTextResponse(pool_metrics_text("api_gateway"))
+    return pool_status()
+
 # Health check endpoint for timers
 @app.get("/api/timers/health")
 async def timer_health_check():
@@ -2891,23 +3767,98 @@ async def timer_health_check():
         "status": "healthy",
         "timers_count": len(timer_manager.timers),
         "connections_count": len(timer_manager.connections),
+        "fanout": timer_manager.fanout.latency_stats(),
+        "cluster": {**timer_manager.membership.stats(), "owned_active_timers": len(timer_manager.scheduler)},
+        "sync_cache": timer_manager.sync_cache.stats(),
+        "indexes": timer_manager.timers.stats(),
+        "retention": timer_manager.retention_stats(),
+        "completions": timer_manager.completions.stats(),
+        "transitions": timer_manager.transitions.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
 # REST API endpoint for timers
 @app.get("/api/timers")
-async def get_timers():
-    """Obtener todos los timers (REST API)"""
+async def get_timers(
+    rfid: Optional[str] = None,
+    inventario_id: Optional[int] = None,
+    tipo: Optional[str] = None,
+    estado: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(TIMER_QUERY_PAGE_SIZE, ge=1, le=TIMER_QUERY_MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user_from_token),
+):
+    """Consultar los timers del tenant del token por rfid, inventario_id, tipo de operación y
+    estado (activo / pausado / completado), paginados por id: `next_cursor` se pasa como
+    `cursor` para la siguiente página."""
+    tenant = _get_tenant_schema_from_user(current_user)
+    if estado is not None and estado not in ESTADOS:
+        raise HTTPException(status_code=400, detail=f"estado debe ser uno de: {', '.join(ESTADOS)}")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    timers, next_after, total = timer_manager.timers.page(
+        limit, after, rfid=rfid, inventario_id=inventario_id, tipo=tipo, estado=estado, tenant=tenant
+    )
     return {
-        "timers": [timer.dict() for timer in timer_manager.timers.values()],
-        "count": len(timer_manager.timers)
+        "timers": [timer.to_dict() for timer in timers],
+        "count": len(timers),
+        "total": total,
+        "next_cursor": encode_cursor(next_after) if next_after is not None else None,
+    }
+
+@app.get("/api/timers/archivo")
+async def get_archived_timers(
+    rfid: Optional[str] = None,
+    inventario_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=TIMER_QUERY_MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user_from_token),
+):
+    """Historial de timers completados del tenant del token que la retención sacó de memoria
+    (los más recientes primero)."""
+    tenant = _get_tenant_schema_from_user(current_user)
+    try:
+        timers = await asyncio.to_thread(timer_manager.archive.query, tenant, rfid, inventario_id, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"timers": timers, "count": len(timers)}
+
+@app.post("/api/timers/lookup")
+async def lookup_timers(request: dict, current_user: dict = Depends(get_current_user_from_token)):
+    """Buscar los timers del tenant del token de una lista de RFIDs en una sola petición
+    (opcionalmente por estado).
+
+    Devuelve los timers encontrados y los RFIDs sin timer.
+    """
+    tenant = _get_tenant_schema_from_user(current_user)
+    rfids = [str(r).strip() for r in request.get("rfids", []) if r and str(r).strip()]
+    if not rfids:
+        raise HTTPException(status_code=400, detail="Debe proporcionar rfids")
+    if len(rfids) > TIMER_QUERY_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo {TIMER_QUERY_MAX_PAGE_SIZE} rfids por consulta")
+    estado = request.get("estado")
+    if estado is not None and estado not in ESTADOS:
+        raise HTTPException(status_code=400, detail=f"estado debe ser uno de: {', '.join(ESTADOS)}")
+    timers = []
+    missing = []
+    for rfid in dict.fromkeys(rfids):
+        ids = timer_manager.timers.ids_matching(rfid=rfid, tenant=tenant, estado=estado)
+        if not ids:
+            missing.append(rfid)
+        timers.extend(timer_manager.timers[timer_id].to_dict() for timer_id in sorted(ids))
+    return {
+        "timers": timers,
+        "count": len(timers),
+        "missing": missing,
     }
 
 # REST API endpoint para crear timer
 @app.post("/api/timers")
-async def create_timer(timer_data: dict):
-    """Crear un timer via REST API"""
+async def create_timer(timer_data: dict, current_user: dict = Depends(get_current_user_from_token)):
+    """Crear un timer via REST API en el tenant del usuario"""
     try:
+        tenant_schema = _get_tenant_schema_from_user(current_user)
         # Validar datos mínimos
         if not timer_data.get("nombre"):
             raise HTTPException(status_code=400, detail="nombre es requerido")
@@ -2930,7 +3881,8 @@ async def create_timer(timer_data: dict):
             "fechaInicio": now,
             "fechaFin": now + timedelta(minutes=tiempo_inicial_minutos),
             "activo": True,
-            "completado": False
+            "completado": False,
+            "tenant": tenant_schema
         }
             
         # Crear timer usando el timer_manager
@@ -2945,6 +3897,35 @@ async def create_timer(timer_data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creando timer: {str(e)}")
 
+async def _control_timers_batch_endpoint(message_type: str, request: dict, current_user: dict) -> Dict[str, Any]:
+    tenant_schema = _get_tenant_schema_from_user(current_user)
+    if TimerSelector.from_message(request).is_empty():
+        raise HTTPException(status_code=400, detail="Debe proporcionar timerIds, inventario_ids, rfids o lote")
+    timer_ids = await select_timers_batch(tenant_schema, request)
+    aplicados = await timer_manager.control_timers_batch(BATCH_ACTIONS[message_type], timer_ids) if timer_ids else []
+    return {
+        "action": BATCH_ACTIONS[message_type],
+        "timerIds": aplicados,
+        "count": len(aplicados),
+        "seleccionados": len(timer_ids),
+    }
+
+# REST API: operaciones por lote (mismo selector que los mensajes *_TIMERS_BATCH del WebSocket)
+@app.post("/api/timers/pause-batch")
+async def pause_timers_batch(request: dict, current_user: dict = Depends(get_current_user_from_token)):
+    """Pausar los timers seleccionados por timerIds, inventario_ids, rfids o lote"""
+    return await _control_timers_batch_endpoint("PAUSE_TIMERS_BATCH", request, current_user)
+
+@app.post("/api/timers/resume-batch")
+async def resume_timers_batch(request: dict, current_user: dict = Depends(get_current_user_from_token)):
+    """Reanudar los timers seleccionados por timerIds, inventario_ids, rfids o lote"""
+    return await _control_timers_batch_endpoint("RESUME_TIMERS_BATCH", request, current_user)
+
+@app.post("/api/timers/delete-batch")
+async def delete_timers_batch(request: dict, current_user: dict = Depends(get_current_user_from_token)):
+    """Eliminar los timers seleccionados por timerIds, inventario_ids, rfids o lote"""
+    return await _control_timers_batch_endpoint("DELETE_TIMERS_BATCH", request, current_user)
+
 # Endpoint para iniciar timers masivos desde inventario
 @app.post("/api/inventory/iniciar-timers-masivo")
 async def iniciar_timers_masivo(
@@ -2985,28 +3966,20 @@ async def iniciar_timers_masivo(
         if not ids_int and not rfids:
             raise HTTPException(status_code=400, detail="items_ids no contiene IDs válidos ni RFIDs")
 
-        # Construir consulta dinámica segura usando IN con parámetros nombrados
+        # Un parámetro de tipo array por columna (= ANY): mismo texto SQL sea cual sea el tamaño del lote
         conditions = []
         params: Dict[str, Any] = {}
         if ids_int:
-            id_placeholders = []
-            for idx, val in enumerate(ids_int):
-                key = f"id_{idx}"
-                params[key] = val
-                id_placeholders.append(f":{key}")
-            conditions.append(f"id IN ({', '.join(id_placeholders)})")
+            params["ids"] = ids_int
+            conditions.append("id = ANY(:ids)")
         if rfids:
-            rf_placeholders = []
-            for idx, val in enumerate(rfids):
-                key = f"rfid_{idx}"
-                params[key] = val
-                rf_placeholders.append(f":{key}")
-            conditions.append(f"rfid IN ({', '.join(rf_placeholders)})")
+            params["rfids"] = rfids
+            conditions.append("rfid = ANY(:rfids)")
 
         where_clause = " OR ".join(conditions)
         query = text(
             f"""
-            SELECT id, rfid, nombre_unidad
+            SELECT id, rfid, nombre_unidad, lote
             FROM {tenant_schema}.inventario_credocubes
             WHERE ({where_clause}) AND activo = true
             """
@@ -3016,11 +3989,50 @@ async def iniciar_timers_masivo(
         if not items:
             raise HTTPException(status_code=404, detail="No se encontraron items válidos")
             
-        # Crear timers para cada item
+        # Construir los timers de todos los items y crearlos en un único lote. Los items de un
+        # mismo lote comparten inicio, duración y tipo: un único timer de grupo con un miembro
+        # por TIC (se descuenta, persiste y difunde una vez por lote).
         timers_creados = []
         now = get_utc_now()
-        
+        por_lote: Dict[str, List[Any]] = {}
+        individuales = []
         for row in items:
+            lote = row._mapping.get("lote")
+            if TIMER_GROUPS_ENABLED and lote:
+                por_lote.setdefault(lote, []).append(row)
+            else:
+                individuales.append(row)
+        grupos = 0
+        for lote, rows in por_lote.items():
+            if len(rows) < TIMER_GROUP_MIN_MEMBERS:
+                individuales.extend(rows)
+                continue
+            grupos += 1
+            timers_creados.append({
+                "id": str(uuid.uuid4()),
+                "nombre": lote,
+                "tipoOperacion": tipo_operacion,
+                "tiempoInicialMinutos": tiempo_minutos,
+                "tiempoRestanteSegundos": tiempo_minutos * 60,
+                "fechaInicio": now,
+                "fechaFin": now + timedelta(minutes=tiempo_minutos),
+                "activo": True,
+                "completado": False,
+                "tenant": tenant_schema,
+                # Cada miembro conserva un id propio: el frontend lo trata como un timer más
+                # (nombre = RFID) y puede pausarlo o eliminarlo por separado
+                "miembros": [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "rfid": r._mapping["rfid"],
+                        "inventario_id": r._mapping["id"],
+                        "nombre": r._mapping["rfid"],
+                    }
+                    for r in rows
+                ],
+            })
+        
+        for row in individuales:
             m = row._mapping
             timer_data = {
                 "id": str(uuid.uuid4()),
@@ -3034,27 +4046,18 @@ async def iniciar_timers_masivo(
                 "activo": True,
                 "completado": False,
                 "inventario_id": m["id"],  # Vincular con el item del inventario
-                "rfid": m["rfid"]
+                "rfid": m["rfid"],
+                "tenant": tenant_schema
             }
-            
-            # Crear timer usando el timer_manager
-            await timer_manager.create_timer(timer_data, websocket=None)
             timers_creados.append(timer_data)
         
-        # Forzar una sincronización completa inmediata para todos los clientes
-        try:
-            server_ts = timer_manager.get_server_timestamp()
-            snapshot = [{**t.to_dict(), "server_timestamp": server_ts} for t in timer_manager.timers.values()]
-            await timer_manager.broadcast({
-                "type": "TIMER_SYNC",
-                "data": {"timers": snapshot, "server_timestamp": server_ts}
-            })
-        except Exception as _e:
-            timer_logger.warning(f"No se pudo emitir TIMER_SYNC post-masivo: {_e}")
+        # Un solo frame TIMERS_CREATED_BATCH y un solo evento MQ para todo el lote
+        await timer_manager.create_timers_batch(timers_creados)
 
         return {
-            "message": f"Timers iniciados para {len(timers_creados)} items",
+            "message": f"Timers iniciados para {len(items)} items",
             "timers_creados": len(timers_creados),
+            "grupos": grupos,
             "timers_activos_total": len(timer_manager.timers),
             "items": [
                 {"id": r._mapping["id"], "rfid": r._mapping["rfid"], "nombre": r._mapping.get("nombre_unidad")}
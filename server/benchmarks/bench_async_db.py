@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark de throughput concurrente: sesión síncrona vs. AsyncSession (asyncpg).
+
+Reproduce en una app FastAPI mínima los tres patrones de acceso a la DB:
+
+  antes_async_def   `async def` + Session síncrona (inventory_service antes de
+                    get_async_db: cada consulta bloquea el event loop)
+  antes_threadpool  `def` + Session síncrona (alerts_service antes: cada petición
+                    ocupa un hilo del threadpool de Starlette)
+  despues           `async def` + AsyncSession vía get_async_db
+
+y mide peticiones/seg y latencias p50/p95/p99 para varios niveles de concurrencia,
+sin red HTTP de por medio (httpx + ASGITransport), contra la DB configurada en el
+entorno (DATABASE_URL o DB_HOST/DB_USER/DB_PASSWORD/DB_NAME).
+
+Por defecto cada petición ejecuta `SELECT pg_sleep(latencia)` para simular la ida y
+vuelta a una DB remota; con --tenant ejecuta la consulta del listado de inventario.
+
+Uso (desde server/):
+    python -m benchmarks.bench_async_db --concurrencia 1 10 50 100 --peticiones 500
+    python -m benchmarks.bench_async_db --tenant tenant_brandon --latencia-ms 0
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODOS = ("antes_async_def", "antes_threadpool", "despues")
+
+_CONSULTA_INVENTARIO = """
+    SELECT i.id, i.rfid, i.estado, i.sub_estado, m.nombre_modelo
+    FROM {schema}.inventario_credocubes i
+    LEFT JOIN {schema}.modelos m ON i.modelo_id = m.modelo_id
+    WHERE i.activo = true
+    ORDER BY i.ultima_actualizacion DESC
+    LIMIT 100
+"""
+
+
+def build_app(consulta: str, params: Dict):
+    from fastapi import Depends, FastAPI
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import Session
+
+    from shared.database import get_async_db, get_db
+
+    app = FastAPI()
+    query = text(consulta)
+
+    @app.get("/antes_async_def")
+    async def antes_async_def(db: Session = Depends(get_db)):
+        return {"filas": len(db.execute(query, params).fetchall())}
+
+    @app.get("/antes_threadpool")
+    def antes_threadpool(db: Session = Depends(get_db)):
+        return {"filas": len(db.execute(query, params).fetchall())}
+
+    @app.get("/despues")
+    async def despues(db: AsyncSession = Depends(get_async_db)):
+        return {"filas": len((await db.execute(query, params)).fetchall())}
+
+    return app
+
+
+async def run_load(client, path: str, concurrencia: int, peticiones: int) -> Dict[str, float]:
+    latencias: List[float] = []
+    errores = 0
+    restantes = peticiones
+
+    async def worker():
+        nonlocal restantes, errores
+        while restantes > 0:
+            restantes -= 1
+            start = time.perf_counter()
+            resp = await client.get(path)
+            latencias.append((time.perf_counter() - start) * 1000)
+            if resp.status_code != 200:
+                errores += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrencia)))
+    elapsed = time.perf_counter() - start
+    latencias.sort()
+
+    def pct(p: float) -> float:
+        return latencias[min(len(latencias) - 1, int(len(latencias) * p))]
+
+    return {
+        "rps": len(latencias) / elapsed,
+        "p50": statistics.median(latencias),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "errores": errores,
+    }
+
+
+async def main_async(args):
+    import httpx
+
+    from shared import database
+    from shared.timer_store import _safe_schema
+
+    try:
+        database.get_engine()
+        database.get_async_engine()
+    except RuntimeError as e:
+        print(f"Sin base de datos configurada: {e}")
+        return 1
+
+    if args.tenant:
+        consulta = _CONSULTA_INVENTARIO.format(schema=_safe_schema(args.tenant))
+        params: Dict = {}
+    else:
+        consulta = "SELECT pg_sleep(:latencia)"
+        params = {"latencia": args.latencia_ms / 1000}
+
+    # Conexiones abiertas de antemano en ambos pools: se mide la consulta, no el handshake
+    database.prewarm_pool(database.DB_POOL_SIZE)
+    await database.prewarm_async_pool(database.DB_ASYNC_POOL_SIZE)
+
+    app = build_app(consulta, params)
+    transport = httpx.ASGITransport(app=app)
+    print(
+        f"Pool síncrono {database.DB_POOL_SIZE}+{database.DB_MAX_OVERFLOW}, "
+        f"asíncrono {database.DB_ASYNC_POOL_SIZE}+{database.DB_ASYNC_MAX_OVERFLOW}; "
+        f"{'inventario de ' + args.tenant if args.tenant else f'pg_sleep de {args.latencia_ms} ms'}"
+    )
+    print(f"{'modo':<18}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errores':>9}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrencia in args.concurrencia:
+            for modo in args.modos:
+                await run_load(client, f"/{modo}", min(concurrencia, 5), min(concurrencia, 5) * 2)  # calentamiento
+                r = await run_load(client, f"/{modo}", concurrencia, args.peticiones)
+                print(
+                    f"{modo:<18}{concurrencia:>6}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}"
+                    f"{r['p99']:>10.1f}{r['errores']:>9}"
+                )
+            print()
+
+    status = database.pool_status()
+    print(f"Esperas por conexión (sync):  media {status['wait_avg_ms']} ms, máx {status['wait_max_ms']} ms, timeouts {status['timeouts']}")
+    a = status.get("async", {})
+    print(f"Esperas por conexión (async): media {a.get('wait_avg_ms')} ms, máx {a.get('wait_max_ms')} ms, timeouts {a.get('timeouts')}")
+    await database.dispose_async_engine()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--peticiones", type=int, default=500, help="Peticiones por modo y nivel de concurrencia")
+    parser.add_argument("--latencia-ms", type=float, default=5, help="pg_sleep por petición (sin --tenant)")
+    parser.add_argument("--tenant", default=None, help="Consultar el inventario de este tenant en lugar de pg_sleep")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
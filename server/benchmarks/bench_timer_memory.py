@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memoria y snapshot de timers del API gateway.
+
+Compara la representación en memoria con modelos Pydantic (`Timer`) y la compacta
+(`CompactTimer`, TIMER_COMPACT_STORE=true) midiendo, para cada tamaño:
+  - bytes por timer (tracemalloc, incluye los strings propios del timer),
+  - tiempo de construcción del TIMER_SYNC completo y del snapshot de persistencia,
+  - CPU de un tick en modo "batch" (recálculo del tiempo restante de los activos).
+
+Uso (desde server/):
+    python -m benchmarks.bench_timer_memory --tamanos 10000 100000 500000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_record(i: int, base_time) -> dict:
+    """Registro de timer tal como llega del store o de MQ (fechas ISO, fines escalonados)."""
+    inicio = base_time - timedelta(seconds=i % 3600)
+    return {
+        "id": f"timer-{i}",
+        "nombre": f"RFID{i:06d}",
+        "tipoOperacion": "congelamiento",
+        "tiempoInicialMinutos": 600,
+        "tiempoRestanteSegundos": 600 * 60,
+        "fechaInicio": inicio.isoformat(),
+        "fechaFin": (inicio + timedelta(minutes=600)).isoformat(),
+        "activo": True,
+        "completado": False,
+        "tenant": "tenant_base",
+        "rfid": f"RFID{i:06d}",
+        "inventario_id": i,
+        "version": 0,
+    }
+
+
+def run(gw, compact: bool, n_timers: int) -> dict:
+    gw.TIMER_COMPACT_STORE = compact
+    gw.TIMER_TICK_MODE = "batch"
+    base_time = gw.get_utc_now()
+    manager = gw.TimerManager()
+
+    gc.collect()
+    tracemalloc.start()
+    timers = {}
+    for i in range(n_timers):
+        timer = gw.timer_from_record(make_record(i, base_time))
+        timers[timer.id] = timer
+    gc.collect()
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    manager.timers.update(timers)
+    manager.rebuild_schedule()
+
+    start = time.perf_counter()
+    sync = manager.build_sync_message(None)
+    sync_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    snapshot = manager.snapshot_for_persistence()
+    snapshot_ms = (time.perf_counter() - start) * 1000
+
+    start = time.process_time()
+    manager.collect_tick_updates(base_time + timedelta(seconds=1))
+    tick_ms = (time.process_time() - start) * 1000
+
+    assert len(sync["data"]["timers"]) == len(snapshot) == n_timers
+    return {
+        "repr": "compacta" if compact else "pydantic",
+        "bytes_por_timer": memoria / n_timers,
+        "sync_ms": sync_ms,
+        "snapshot_ms": snapshot_ms,
+        "tick_ms": tick_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10000, 100000, 500000])
+    args = parser.parse_args()
+
+    # Importar el gateway desde un directorio temporal para no tocar timers_data.json
+    os.chdir(tempfile.mkdtemp(prefix="bench_timers_"))
+    import api_gateway.main as gw
+
+    print(f"{'timers':>8} {'repr':<9} {'bytes/timer':>12} {'TIMER_SYNC ms':>14} {'snapshot ms':>12} {'tick ms':>9}")
+    for n_timers in args.tamanos:
+        for compact in (False, True):
+            r = run(gw, compact, n_timers)
+            print(
+                f"{n_timers:>8} {r['repr']:<9} {r['bytes_por_timer']:>12.0f} {r['sync_ms']:>14.1f} "
+                f"{r['snapshot_ms']:>12.1f} {r['tick_ms']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark del tick de timers del API gateway.
+
+Compara el modo legado "per_timer" (un TIMER_TIME_UPDATE por timer y tick),
+el modo "batch" con cadencia de un segundo ("batch_1s"), el modo "batch" con la
+cadencia adaptativa de TIMER_CADENCE y el modo "local" (solo cambios de estado)
+midiendo frames/seg, bytes/seg y CPU por tick con conexiones WebSocket simuladas.
+
+Uso (desde server/):
+    python -m benchmarks.bench_timer_tick --timers 300 --conexiones 40 --ticks 30
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeWebSocket:
+    """WebSocket simulado que solo cuenta frames y bytes enviados."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, data: str):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def close(self):
+        pass
+
+
+async def drain(manager):
+    """Esperar a que las tareas escritoras vacíen las colas de salida."""
+    while any(o.frames for o in manager.fanout.outboxes.values()):
+        await asyncio.sleep(0)
+    # Dejar que terminen los envíos en curso (wait_for corre en su propia tarea)
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def build_manager(gw, n_timers: int, n_conexiones: int, base_time):
+    manager = gw.TimerManager()
+    manager.timers.clear()
+    for i in range(n_timers):
+        timer = gw.Timer(
+            id=f"timer-{i}",
+            nombre=f"RFID{i:06d}",
+            tipoOperacion="congelamiento",
+            tiempoInicialMinutos=600,
+            tiempoRestanteSegundos=600 * 60,
+            fechaInicio=base_time,
+            fechaFin=base_time + timedelta(minutes=600),
+        )
+        manager.timers[timer.id] = timer
+        manager.sync_schedule(timer)
+    # Todas las conexiones en la sala del tenant por defecto (el de los timers sin tenant)
+    manager.connections = {FakeWebSocket() for _ in range(n_conexiones)}
+    manager.rooms = {gw.DEFAULT_TENANT_SCHEMA: set(manager.connections)}
+    return manager
+
+
+async def run_mode(gw, mode: str, n_timers: int, n_conexiones: int, n_ticks: int):
+    from shared.timer_cadence import CadencePolicy
+
+    gw.TIMER_TICK_MODE = "batch" if mode == "batch_1s" else mode
+    base_time = gw.get_utc_now()
+    manager = build_manager(gw, n_timers, n_conexiones, base_time)
+    if mode == "batch_1s":
+        manager.cadence = CadencePolicy("0:1", {})
+
+    cpu_start = time.process_time()
+    for tick in range(1, n_ticks + 1):
+        now = base_time + timedelta(seconds=tick)
+        updates = manager.collect_tick_updates(now)
+        if updates:
+            await manager.broadcast_tick_updates(updates, int(now.timestamp() * 1000))
+            await drain(manager)
+    cpu_total = time.process_time() - cpu_start
+    for ws in list(manager.connections):
+        manager.fanout.unregister(ws)
+
+    frames = sum(ws.frames for ws in manager.connections)
+    total_bytes = sum(ws.bytes for ws in manager.connections)
+    return {
+        "modo": mode,
+        "frames_por_seg": frames / n_ticks,
+        "kb_por_seg": total_bytes / n_ticks / 1024,
+        "cpu_ms_por_tick": cpu_total * 1000 / n_ticks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timers", type=int, default=300)
+    parser.add_argument("--conexiones", type=int, default=40)
+    parser.add_argument("--ticks", type=int, default=30)
+    args = parser.parse_args()
+
+    # Importar el gateway desde un directorio temporal para no tocar timers_data.json
+    os.chdir(tempfile.mkdtemp(prefix="bench_timers_"))
+    import api_gateway.main as gw
+    import shared.ws_fanout as ws_fanout
+
+    # Sin tope efectivo en la cola de salida para medir el volumen completo de cada modo
+    ws_fanout.WS_OUTBOX_MAX_FRAMES = args.timers * 2
+
+    print(f"timers={args.timers} conexiones={args.conexiones} ticks={args.ticks} (1 tick = 1 s)")
+    print(f"{'modo':<10} {'frames/s':>10} {'KB/s':>10} {'CPU ms/tick':>12}")
+    for mode in ("per_timer", "batch_1s", "batch", "local"):
+        r = asyncio.run(run_mode(gw, mode, args.timers, args.conexiones, args.ticks))
+        print(f"{r['modo']:<10} {r['frames_por_seg']:>10.0f} {r['kb_por_seg']:>10.1f} {r['cpu_ms_por_tick']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Informe de tolerancia de la cuenta atrás local frente a la deriva del reloj del cliente.
+
+Simula un congelamiento de 12 h que el navegador descuenta en local (sin frames por
+segundo) con el reloj del cliente desviado un desfase inicial y una deriva en ppm, sobre
+redes con distinta latencia y jitter. Compara la estimación del desfase con el
+server_timestamp del snapshot (sin corregir la latencia ni volver a medir) contra la
+sincronización PING/PONG estilo NTP (filtro de mínimo RTT sobre las últimas muestras) con
+distintos periodos de PING. Para cada escenario muestra el error máximo de la hora de
+servidor estimada, el error al completar y si el servidor permitiría la cuenta atrás local
+(CLOCK_SYNC_MAX_RTT_MS). La UI muestra segundos: un error por debajo de 1000 ms no se ve.
+
+Uso (desde server/):
+    python -m benchmarks.clock_drift_report --horas 12 --paso 10
+"""
+
+import argparse
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.clock_sync import CLOCK_SYNC_MAX_RTT_MS, CLOCK_SYNC_WINDOW, estimate_offset
+
+# (nombre, latencia base de ida en ms, jitter de ida en ms)
+REDES = [("lan", 5, 5), ("4g", 60, 80), ("degradada", 300, 600)]
+# Deriva del reloj del cliente (ppm): cristal típico, malo y un portátil suspendido/ajustado
+DERIVAS_PPM = [0, 50, 100, 500]
+# Periodo de PING (s); None = solo el server_timestamp del snapshot inicial
+PERIODOS_PING = [None, 300, 30]
+# Desfase inicial del reloj del cliente (ms)
+DESFASE_INICIAL_MS = 2500
+# Tiempo de proceso del PING en el servidor (ms)
+PROCESO_MS = 1
+
+
+class Escenario:
+    """Reloj del cliente desviado y red con latencia aleatoria (hora del servidor = referencia)."""
+
+    def __init__(self, ppm: float, base_ms: float, jitter_ms: float, rng: random.Random):
+        self.ppm = ppm
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+        self.rng = rng
+
+    def reloj_cliente(self, t_ms: float) -> float:
+        return t_ms + DESFASE_INICIAL_MS + t_ms * self.ppm / 1e6
+
+    def latencia(self) -> float:
+        return self.base_ms + self.rng.random() * self.jitter_ms
+
+
+def simular(esc: Escenario, duracion_s: int, paso_s: int, periodo_ping):
+    """Devuelve (error máximo ms, error al completar ms, RTT mínimo ms o None)."""
+    # Snapshot inicial: el cliente toma server_timestamp al recibirlo (ignora la latencia)
+    llegada = esc.latencia()
+    desfase = 0 - esc.reloj_cliente(llegada)
+    muestras = deque(maxlen=CLOCK_SYNC_WINDOW)
+    # Ráfaga de 3 PING al conectar (como el cliente) y luego uno por periodo
+    pings = []
+    if periodo_ping:
+        pings = [0, 1, 2] + list(range(periodo_ping, duracion_s + 1, periodo_ping))
+    siguiente = 0
+
+    error_max = 0.0
+    error = 0.0
+    for t_s in range(0, duracion_s + 1, paso_s):
+        t_ms = t_s * 1000.0
+        while siguiente < len(pings) and pings[siguiente] * 1000.0 <= t_ms:
+            envio = pings[siguiente] * 1000.0
+            t0 = esc.reloj_cliente(envio)
+            t1 = envio + esc.latencia()
+            t2 = t1 + PROCESO_MS
+            t3 = esc.reloj_cliente(t2 + esc.latencia())
+            offset, rtt = estimate_offset(t0, t1, t2, t3)
+            muestras.append((rtt, offset))
+            desfase = min(muestras)[1]
+            siguiente += 1
+        error = esc.reloj_cliente(t_ms) + desfase - t_ms
+        error_max = max(error_max, abs(error))
+    rtt_min = min(muestras)[0] if muestras else None
+    return error_max, error, rtt_min
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--horas", type=float, default=12, help="Duración del congelamiento")
+    parser.add_argument("--paso", type=int, default=10, help="Segundos entre evaluaciones del error")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    duracion_s = int(args.horas * 3600)
+    rng = random.Random(args.seed)
+    print(f"Congelamiento de {args.horas:g} h, desfase inicial {DESFASE_INICIAL_MS} ms, "
+          f"ventana {CLOCK_SYNC_WINDOW} muestras, RTT máximo {CLOCK_SYNC_MAX_RTT_MS} ms")
+    print(f"{'red':<10} {'ppm':>5} {'ping':>8} {'err_max_ms':>11} {'err_fin_ms':>11} {'rtt_min':>8} "
+          f"{'local':>6} {'<1s':>4}")
+    for nombre, base, jitter in REDES:
+        for ppm in DERIVAS_PPM:
+            for periodo in PERIODOS_PING:
+                esc = Escenario(ppm, base, jitter, rng)
+                error_max, error_fin, rtt_min = simular(esc, duracion_s, args.paso, periodo)
+                # Con PING hay al menos las CLOCK_SYNC_MIN_SAMPLES de la ráfaga inicial
+                permitido = rtt_min is not None and rtt_min <= CLOCK_SYNC_MAX_RTT_MS
+                print(
+                    f"{nombre:<10} {ppm:>5} {(f'{periodo}s' if periodo else 'no'):>8} "
+                    f"{error_max:>11.0f} {error_fin:>11.0f} "
+                    f"{(f'{rtt_min:.0f}' if rtt_min is not None else '-'):>8} "
+                    f"{('sí' if permitido else 'no'):>6} {('sí' if error_max < 1000 else 'no'):>4}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone
@@ -10,7 +11,9 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from shared.database import get_db
+from shared.database import dispose_async_engine, get_async_db, pool_metrics_text, pool_status, prewarm_async_pool
+from shared.queries import consulta
+from shared.tenant_db import get_async_tenant_db
 from shared.utils import get_current_user_from_token
 
 # Utils: ensure datetimes are timezone-aware (UTC)
@@ -65,7 +68,7 @@ def _ensure_utc(dt: Optional[datetime]) -> Optional[datetime]:
         return dt
 
 # Función para generar lotes automáticos
-def generar_lote_automatico(db: Session, tenant_schema: str) -> str:
+async def generar_lote_automatico(db: AsyncSession) -> str:
     """
     Genera un lote automático basado en la fecha actual y un contador secuencial
     Formato: YYYYMMDDXXX (donde XXX es un contador de 3 dígitos)
@@ -74,14 +77,7 @@ def generar_lote_automatico(db: Session, tenant_schema: str) -> str:
     fecha_actual = datetime.now().strftime("%Y%m%d")
     
     # Buscar el último lote creado hoy (que empiece con la fecha de hoy)
-    query = text(f"""
-        SELECT lote FROM {tenant_schema}.inventario_credocubes 
-        WHERE lote LIKE '{fecha_actual}%' 
-        ORDER BY lote DESC 
-        LIMIT 1
-    """)
-    
-    resultado = db.execute(query).fetchone()
+    resultado = (await db.execute(consulta("inventario.ultimo_lote_del_dia"), {"prefijo": f"{fecha_actual}%"})).fetchone()
     
     if resultado:
         # Extraer el número del último lote y incrementar
@@ -222,6 +218,25 @@ def get_tenant_schema(current_user: Dict[str, Any]) -> str:
 async def health_check():
     return {"status": "ok", "service": "inventory_service"}
 
+@app.on_event("startup")
+async def db_pool_prewarm():
+    """Abrir DB_POOL_PREWARM conexiones antes de recibir tráfico"""
+    try:
+        await prewarm_async_pool()
+    except Exception as e:
+        print(f"⚠️ No se pudo precalentar el pool de DB: {e}")
+
+@app.on_event("shutdown")
+async def db_pool_dispose():
+    await dispose_async_engine()
+
+# Estado del pool de conexiones a la base de datos
+@app.get("/metrics/db-pool")
+def db_pool_metrics(formato: str = Query("json", description="json | prometheus")):
+    if formato == "prometheus":
+        return PlainTextResponse(pool_metrics_text("inventory_service"))
+    return pool_status()
+
 # Debug endpoint para listar todas las rutas
 @app.get("/debug/routes")
 async def debug_routes():
@@ -235,12 +250,12 @@ async def debug_routes():
     return {"routes": routes}
 
 @app.get("/verificar-rfid-sin-auth/{rfid}")
-async def verificar_rfid_sin_auth(rfid: str, db: Session = Depends(get_db)):
+async def verificar_rfid_sin_auth(rfid: str, db: AsyncSession = Depends(get_async_db)):
     """Verificar RFID sin autenticación para el proceso de registro"""
     try:
         tenant_schema = "tenant_brandon"  # Usar tenant fijo
         query = text("SELECT COUNT(*) FROM tenant_brandon.inventario_credocubes WHERE rfid = :rfid")
-        result = db.execute(query, {"rfid": rfid})
+        result = await db.execute(query, {"rfid": rfid})
         count = result.scalar()
         return {"rfid": rfid, "existe": count > 0, "count": count}
     except Exception as e:
@@ -252,23 +267,12 @@ async def verificar_rfid_sin_auth(rfid: str, db: Session = Depends(get_db)):
 async def get_modelos(
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Obtener lista de modelos de credcubes"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        query = text(f"""
-            SELECT modelo_id, nombre_modelo, volumen_litros, descripcion,
-                   dim_ext_frente, dim_ext_profundo, dim_ext_alto,
-                   dim_int_frente, dim_int_profundo, dim_int_alto,
-                   tic_frente, tic_alto, peso_total_kg, tipo
-            FROM {tenant_schema}.modelos
-            ORDER BY nombre_modelo
-            OFFSET :skip LIMIT :limit
-        """)
-        
-        result = db.execute(query, {"skip": skip, "limit": limit})
+        result = await db.execute(consulta("modelos.listado"), {"skip": skip, "limit": limit})
         modelos = []
         for row in result:
             modelo_dict = dict(row._mapping)
@@ -283,7 +287,7 @@ async def get_modelos(
 async def get_inventario(
     skip: int = 0, 
     limit: int = 1000, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Obtener inventario completo con información de modelos"""
@@ -292,19 +296,7 @@ async def get_inventario(
         
         print(f"DEBUG: Datos de inventario para {tenant_schema}:")
         
-        query = text(f"""
-            SELECT i.id, i.modelo_id, m.nombre_modelo, i.nombre_unidad, i.rfid, 
-                   i.lote, i.estado, i.sub_estado, i.validacion_limpieza, 
-                   i.validacion_goteo, i.validacion_desinfeccion, i.categoria,
-                   i.fecha_ingreso, i.ultima_actualizacion, i.fecha_vencimiento, i.activo
-            FROM {tenant_schema}.inventario_credocubes i
-            LEFT JOIN {tenant_schema}.modelos m ON i.modelo_id = m.modelo_id
-            WHERE i.activo = true
-            ORDER BY i.ultima_actualizacion DESC, i.fecha_ingreso DESC
-            OFFSET :skip LIMIT :limit
-        """)
-        
-        result = db.execute(query, {"skip": skip, "limit": limit})
+        result = await db.execute(consulta("inventario.listado"), {"skip": skip, "limit": limit})
         inventario = []
         for row in result:
             item_dict = dict(row._mapping)
@@ -322,19 +314,13 @@ async def get_inventario(
 @app.post("/inventario/", response_model=InventarioResponse)
 async def create_inventario(
     inventario: InventarioCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Crear nuevo item en el inventario"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         # Verificar si el RFID ya existe
-        check_query = text(f"""
-            SELECT id FROM {tenant_schema}.inventario_credocubes 
-            WHERE rfid = :rfid AND activo = true
-        """)
-        existing = db.execute(check_query, {"rfid": inventario.rfid}).fetchone()
+        existing = (await db.execute(consulta("inventario.rfid_activo"), {"rfid": inventario.rfid})).fetchone()
         if existing:
             raise HTTPException(
                 status_code=400, 
@@ -342,22 +328,9 @@ async def create_inventario(
             )
 
         # Crear nuevo item usando timestamps del cliente si vienen, de lo contrario NOW()
-        insert_query = text(f"""
-            INSERT INTO {tenant_schema}.inventario_credocubes 
-            (modelo_id, nombre_unidad, rfid, lote, estado, sub_estado, 
-             validacion_limpieza, validacion_goteo, validacion_desinfeccion, categoria,
-             fecha_ingreso, ultima_actualizacion, activo)
-            VALUES (:modelo_id, :nombre_unidad, :rfid, :lote, :estado, :sub_estado,
-                    :validacion_limpieza, :validacion_goteo, :validacion_desinfeccion, :categoria,
-                    COALESCE(:fecha_ingreso, NOW()), COALESCE(:ultima_actualizacion, NOW()), true)
-            RETURNING id, modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
-                      validacion_limpieza, validacion_goteo, validacion_desinfeccion, categoria,
-                      fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
-        """)
-
         params = inventario.dict()
-        result = db.execute(insert_query, params)
-        db.commit()
+        result = await db.execute(consulta("inventario.insertar"), params)
+        await db.commit()
 
         nuevo_item = result.fetchone()
         if nuevo_item:
@@ -371,23 +344,20 @@ async def create_inventario(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creando inventario: {str(e)}")
 
 @app.put("/inventario/{inventario_id}", response_model=InventarioResponse)
 async def update_inventario(
     inventario_id: int,
     inventario: InventarioUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Actualizar item del inventario completo"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         # Verificar que el inventario existe
-        check_query = text(f"SELECT id FROM {tenant_schema}.inventario_credocubes WHERE id = :id")
-        existing = db.execute(check_query, {"id": inventario_id}).fetchone()
+        existing = (await db.execute(consulta("inventario.existe"), {"id": inventario_id})).fetchone()
         
         if not existing:
             raise HTTPException(
@@ -397,14 +367,10 @@ async def update_inventario(
         
         # Verificar que el RFID no exista en otro registro si se está actualizando
         if inventario.rfid:
-            check_rfid_query = text(f"""
-                SELECT id FROM {tenant_schema}.inventario_credocubes 
-                WHERE rfid = :rfid AND id != :id
-            """)
-            existing_rfid = db.execute(check_rfid_query, {
+            existing_rfid = (await db.execute(consulta("inventario.rfid_en_otro"), {
                 "rfid": inventario.rfid, 
                 "id": inventario_id
-            }).fetchone()
+            })).fetchone()
             
             if existing_rfid:
                 raise HTTPException(
@@ -430,8 +396,9 @@ async def update_inventario(
         # Siempre actualizar timestamp
         update_fields.append("ultima_actualizacion = CURRENT_TIMESTAMP")
         
+        # Campos variables: el texto depende de los campos, no del tenant (search_path de la sesión)
         update_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
+            UPDATE inventario_credocubes 
             SET {', '.join(update_fields)}
             WHERE id = :id
             RETURNING id, modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
@@ -439,8 +406,8 @@ async def update_inventario(
                       categoria, fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
         """)
         
-        result = db.execute(update_query, params)
-        db.commit()
+        result = await db.execute(update_query, params)
+        await db.commit()
         
         row = result.fetchone()
         if row:
@@ -454,23 +421,20 @@ async def update_inventario(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error actualizando inventario: {str(e)}")
 
 @app.patch("/inventario/{inventario_id}/estado", response_model=InventarioResponse)
 async def update_inventario_estado(
     inventario_id: int,
     estado_update: EstadoUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Actualizar solo el estado de un item del inventario"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         # Verificar que el inventario existe
-        check_query = text(f"SELECT id FROM {tenant_schema}.inventario_credocubes WHERE id = :id")
-        existing = db.execute(check_query, {"id": inventario_id}).fetchone()
+        existing = (await db.execute(consulta("inventario.existe"), {"id": inventario_id})).fetchone()
         
         if not existing:
             raise HTTPException(
@@ -486,51 +450,27 @@ async def update_inventario_estado(
             estado_update.sub_estado.lower() in ['Congelamiento', 'congelacion', 'atemperamiento']):
             
             # Verificar si el item ya tiene lote
-            check_lote_query = text(f"SELECT lote FROM {tenant_schema}.inventario_credocubes WHERE id = :id")
-            lote_actual = db.execute(check_lote_query, {"id": inventario_id}).fetchone()
+            lote_actual = (await db.execute(consulta("inventario.lote"), {"id": inventario_id})).fetchone()
             
             if not lote_actual or not lote_actual[0]:
-                lote_automatico = generar_lote_automatico(db, tenant_schema)
+                lote_automatico = await generar_lote_automatico(db)
 
         # Actualizar estado, sub_estado, lote (si aplica) y ultima_actualizacion
         if lote_automatico:
-            update_query = text(f"""
-                UPDATE {tenant_schema}.inventario_credocubes 
-                SET estado = :estado, 
-                    sub_estado = :sub_estado,
-                    lote = :lote,
-                    ultima_actualizacion = CURRENT_TIMESTAMP
-                WHERE id = :id
-                RETURNING id, modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
-                          validacion_limpieza, validacion_goteo, validacion_desinfeccion,
-                          categoria, fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
-            """)
-            
-            result = db.execute(update_query, {
+            result = await db.execute(consulta("inventario.actualizar_estado_y_lote"), {
                 "id": inventario_id,
                 "estado": estado_update.estado,
                 "sub_estado": estado_update.sub_estado,
                 "lote": lote_automatico
             })
         else:
-            update_query = text(f"""
-                UPDATE {tenant_schema}.inventario_credocubes 
-                SET estado = :estado, 
-                    sub_estado = :sub_estado,
-                    ultima_actualizacion = CURRENT_TIMESTAMP
-                WHERE id = :id
-                RETURNING id, modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
-                          validacion_limpieza, validacion_goteo, validacion_desinfeccion,
-                          categoria, fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
-            """)
-            
-            result = db.execute(update_query, {
+            result = await db.execute(consulta("inventario.actualizar_estado"), {
                 "id": inventario_id,
                 "estado": estado_update.estado,
                 "sub_estado": estado_update.sub_estado
             })
         
-        db.commit()
+        await db.commit()
         row = result.fetchone()
         
         if row:
@@ -544,34 +484,18 @@ async def update_inventario_estado(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error actualizando estado: {str(e)}")
 
 # Dashboard endpoints
 @app.get("/dashboard/metrics", response_model=DashboardMetrics)
 async def get_dashboard_metrics(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Obtener métricas del dashboard"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
-        query = text(f"""
-            SELECT 
-                COUNT(*) as total_items,
-                COUNT(CASE WHEN LOWER(estado) = 'en bodega' THEN 1 END) as en_bodega,
-                COUNT(CASE WHEN LOWER(estado) = 'en operacion' OR LOWER(estado) = 'en operación' THEN 1 END) as en_operacion,
-                COUNT(CASE WHEN LOWER(estado) = 'en limpieza' THEN 1 END) as en_limpieza,
-                COUNT(CASE WHEN LOWER(estado) = 'en devolucion' OR LOWER(estado) = 'en devolución' THEN 1 END) as en_devolucion,
-                COUNT(CASE WHEN LOWER(estado) NOT IN ('en bodega', 'en operacion', 'en operación', 'en limpieza', 'en devolucion', 'en devolución') THEN 1 END) as otros_estados,
-                COUNT(CASE WHEN validacion_limpieza IS NULL OR validacion_goteo IS NULL OR validacion_desinfeccion IS NULL THEN 1 END) as por_validar,
-                COUNT(CASE WHEN validacion_limpieza IS NOT NULL AND validacion_goteo IS NOT NULL AND validacion_desinfeccion IS NOT NULL THEN 1 END) as validados
-            FROM {tenant_schema}.inventario_credocubes 
-            WHERE activo = true
-        """)
-        
-        result = db.execute(query).fetchone()
+        result = (await db.execute(consulta("dashboard.metricas"))).fetchone()
         
         if result:
             return DashboardMetrics(**dict(result._mapping))
@@ -587,36 +511,12 @@ async def get_dashboard_metrics(
 
 @app.get("/dashboard/processing-data", response_model=List[ProcessingData])
 async def get_processing_data(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Obtener datos de procesamiento por mes"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
-        query = text(f"""
-            WITH monthly_data AS (
-                SELECT 
-                    TO_CHAR(fecha_ingreso, 'Mon') as mes,
-                    COUNT(CASE WHEN LOWER(estado) = 'recepcion' OR LOWER(estado) = 'recepción' THEN 1 END) as recepcion,
-                    COUNT(CASE WHEN LOWER(estado) = 'inspeccion' OR LOWER(estado) = 'inspección' THEN 1 END) as inspeccion,
-                    COUNT(CASE WHEN LOWER(estado) = 'en limpieza' THEN 1 END) as limpieza,
-                    COUNT(CASE WHEN LOWER(estado) = 'en operacion' OR LOWER(estado) = 'en operación' THEN 1 END) as operacion
-                FROM {tenant_schema}.inventario_credocubes 
-                WHERE activo = true 
-                    AND fecha_ingreso >= NOW() - INTERVAL '12 months'
-                GROUP BY DATE_TRUNC('month', fecha_ingreso), TO_CHAR(fecha_ingreso, 'Mon')
-                ORDER BY DATE_TRUNC('month', fecha_ingreso)
-            )
-            SELECT mes, 
-                   COALESCE(recepcion, 0) as recepcion,
-                   COALESCE(inspeccion, 0) as inspeccion, 
-                   COALESCE(limpieza, 0) as limpieza,
-                   COALESCE(operacion, 0) as operacion
-            FROM monthly_data
-        """)
-        
-        result = db.execute(query)
+        result = await db.execute(consulta("dashboard.procesamiento"))
         data = [ProcessingData(**dict(row._mapping)) for row in result]
         
         print(f"DEBUG: Resultados de procesamiento: {[(d.mes, d.recepcion, d.inspeccion, d.limpieza, d.operacion) for d in data]}")
@@ -629,23 +529,14 @@ async def get_processing_data(
 
 @app.get("/dashboard/recent-activity", response_model=List[ActivityItem])
 async def get_recent_activity(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Obtener actividad reciente"""
     try:
         tenant_schema = get_tenant_schema(current_user)
         
-        query = text(f"""
-            SELECT a.id, a.inventario_id, a.descripcion, a.timestamp, 
-                   i.nombre_unidad, i.rfid, a.estado_nuevo
-            FROM {tenant_schema}.actividades_operacion a
-            LEFT JOIN {tenant_schema}.inventario_credocubes i ON a.inventario_id = i.id
-            ORDER BY a.timestamp DESC
-            LIMIT 10
-        """)
-        
-        result = db.execute(query)
+        result = await db.execute(consulta("dashboard.actividad_reciente"))
         actividades = [ActivityItem(**dict(row._mapping)) for row in result]
         
         print(f"DEBUG: Datos de inventario para {tenant_schema}:")
@@ -666,7 +557,7 @@ class AsignarLoteRequest(BaseModel):
 @app.patch("/inventario/asignar-lote")
 async def asignar_lote_multiple(
     request: AsignarLoteRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Asignar lote a múltiples items de inventario por sus RFIDs"""
     try:
@@ -684,13 +575,13 @@ async def asignar_lote_multiple(
             RETURNING id, nombre_unidad, rfid, lote
         """)
         
-        result = db.execute(query, {
+        result = await db.execute(query, {
             "lote": request.lote.strip(),
             "rfids": request.rfids
         })
         
         items_actualizados = result.fetchall()
-        db.commit()
+        await db.commit()
         
         if not items_actualizados:
             raise HTTPException(status_code=404, detail="No se encontraron items con los RFIDs proporcionados")
@@ -710,7 +601,7 @@ async def asignar_lote_multiple(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error asignando lote: {e}")
         raise HTTPException(status_code=500, detail=f"Error asignando lote: {str(e)}")
 
@@ -723,32 +614,19 @@ class AsignarLoteAutomaticoRequest(BaseModel):
 @app.patch("/inventario/asignar-lote-automatico")
 async def asignar_lote_automatico_multiple(
     request: AsignarLoteAutomaticoRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Asignar lote automático a múltiples items y actualizar su estado"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         if not request.rfids:
             raise HTTPException(status_code=400, detail="Debe proporcionar al menos un RFID")
         
         # Generar un lote automático único para este grupo
-        lote_automatico = generar_lote_automatico(db, tenant_schema)
+        lote_automatico = await generar_lote_automatico(db)
         
         # Actualizar todos los RFIDs con el mismo lote automático, estado y sub_estado
-        update_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
-            SET lote = :lote,
-                estado = :estado,
-                sub_estado = :sub_estado,
-                ultima_actualizacion = CURRENT_TIMESTAMP
-            WHERE rfid = ANY(:rfids) AND activo = true
-            RETURNING id, modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
-                      categoria, fecha_ingreso, ultima_actualizacion
-        """)
-        
-        result = db.execute(update_query, {
+        result = await db.execute(consulta("inventario.asignar_lote_y_estado"), {
             "lote": lote_automatico,
             "estado": request.estado,
             "sub_estado": request.sub_estado,
@@ -756,7 +634,7 @@ async def asignar_lote_automatico_multiple(
         })
         
         items_actualizados = result.fetchall()
-        db.commit()
+        await db.commit()
         
         if not items_actualizados:
             raise HTTPException(
@@ -784,7 +662,7 @@ async def asignar_lote_automatico_multiple(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error asignando lote automático: {e}")
         raise HTTPException(status_code=500, detail=f"Error asignando lote automático: {str(e)}")
 
@@ -792,16 +670,13 @@ async def asignar_lote_automatico_multiple(
 @app.delete("/inventario/{inventario_id}", status_code=status.HTTP_200_OK)
 async def delete_inventario(
     inventario_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Eliminar un item del inventario (soft delete)"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         # Verificar que el inventario existe
-        check_query = text(f"SELECT id, rfid FROM {tenant_schema}.inventario_credocubes WHERE id = :id AND activo = true")
-        existing = db.execute(check_query, {"id": inventario_id}).fetchone()
+        existing = (await db.execute(consulta("inventario.activo_por_id"), {"id": inventario_id})).fetchone()
         
         if not existing:
             raise HTTPException(
@@ -810,15 +685,8 @@ async def delete_inventario(
             )
         
         # Realizar soft delete (marcar como inactivo)
-        delete_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
-            SET activo = false,
-                ultima_actualizacion = CURRENT_TIMESTAMP
-            WHERE id = :id
-        """)
-        
-        db.execute(delete_query, {"id": inventario_id})
-        db.commit()
+        await db.execute(consulta("inventario.baja"), {"id": inventario_id})
+        await db.commit()
         
         return {
             "message": f"Item del inventario eliminado exitosamente",
@@ -829,7 +697,7 @@ async def delete_inventario(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error eliminando inventario: {e}")
         raise HTTPException(status_code=500, detail=f"Error eliminando inventario: {str(e)}")
 
@@ -843,13 +711,11 @@ class IniciarEnvioRequest(BaseModel):
 @app.post("/inventario/iniciar-envio", status_code=status.HTTP_200_OK)
 async def iniciar_envio(
     request: IniciarEnvioRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Iniciar proceso de envío para los items seleccionados"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         if not request.items_ids:
             raise HTTPException(
                 status_code=400,
@@ -857,13 +723,13 @@ async def iniciar_envio(
             )
         
         # Verificar que todos los items existen y están disponibles para envío
-        check_query = text(f"""
+        check_query = text("""
             SELECT id, rfid, estado, lote 
-            FROM {tenant_schema}.inventario_credocubes 
+            FROM inventario_credocubes 
             WHERE id = ANY(:item_ids) AND activo = true
         """)
         
-        existing_items = db.execute(check_query, {"item_ids": request.items_ids}).fetchall()
+        existing_items = (await db.execute(check_query, {"item_ids": request.items_ids})).fetchall()
         
         if len(existing_items) != len(request.items_ids):
             raise HTTPException(
@@ -872,8 +738,8 @@ async def iniciar_envio(
             )
         
         # Actualizar estado de los items a "operación/En transito" para envío
-        update_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
+        update_query = text("""
+            UPDATE inventario_credocubes 
             SET estado = 'operación',
                 sub_estado = 'En transito',
                 ultima_actualizacion = CURRENT_TIMESTAMP
@@ -881,8 +747,8 @@ async def iniciar_envio(
             RETURNING id, rfid, estado, sub_estado, lote
         """)
         
-        updated_items = db.execute(update_query, {"item_ids": request.items_ids}).fetchall()
-        db.commit()
+        updated_items = (await db.execute(update_query, {"item_ids": request.items_ids})).fetchall()
+        await db.commit()
         
         items_info = [
             {
@@ -906,7 +772,7 @@ async def iniciar_envio(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error iniciando envío: {e}")
         raise HTTPException(status_code=500, detail=f"Error iniciando envío: {str(e)}")
 
@@ -914,21 +780,19 @@ async def iniciar_envio(
 @app.patch("/inventario/{item_id}/completar-envio", status_code=status.HTTP_200_OK)
 async def completar_envio(
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Completar el proceso de envío de un item"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         # Verificar que el item existe y está en envío
-        check_query = text(f"""
+        check_query = text("""
             SELECT id, rfid, estado 
-            FROM {tenant_schema}.inventario_credocubes 
+            FROM inventario_credocubes 
             WHERE id = :item_id AND activo = true
         """)
         
-        existing_item = db.execute(check_query, {"item_id": item_id}).fetchone()
+        existing_item = (await db.execute(check_query, {"item_id": item_id})).fetchone()
         
         if not existing_item:
             raise HTTPException(
@@ -937,8 +801,8 @@ async def completar_envio(
             )
         
         # Actualizar estado a "operación/entregado"
-        update_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
+        update_query = text("""
+            UPDATE inventario_credocubes 
             SET estado = 'operación',
                 sub_estado = 'entregado',
                 ultima_actualizacion = CURRENT_TIMESTAMP
@@ -946,8 +810,8 @@ async def completar_envio(
             RETURNING id, rfid, estado, sub_estado, lote
         """)
         
-        updated_item = db.execute(update_query, {"item_id": item_id}).fetchone()
-        db.commit()
+        updated_item = (await db.execute(update_query, {"item_id": item_id})).fetchone()
+        await db.commit()
         
         return {
             "message": "Envío completado exitosamente",
@@ -963,7 +827,7 @@ async def completar_envio(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error completando envío: {e}")
         raise HTTPException(status_code=500, detail=f"Error completando envío: {str(e)}")
 
@@ -976,21 +840,19 @@ class CancelarEnvioRequest(BaseModel):
 async def cancelar_envio(
     item_id: int,
     request: CancelarEnvioRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Cancelar el proceso de envío de un item"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         # Verificar que el item existe
-        check_query = text(f"""
+        check_query = text("""
             SELECT id, rfid, estado 
-            FROM {tenant_schema}.inventario_credocubes 
+            FROM inventario_credocubes 
             WHERE id = :item_id AND activo = true
         """)
         
-        existing_item = db.execute(check_query, {"item_id": item_id}).fetchone()
+        existing_item = (await db.execute(check_query, {"item_id": item_id})).fetchone()
         
         if not existing_item:
             raise HTTPException(
@@ -999,8 +861,8 @@ async def cancelar_envio(
             )
         
         # Revertir estado al anterior (típicamente "En bodega" o "Acondicionamiento")
-        update_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
+        update_query = text("""
+            UPDATE inventario_credocubes 
             SET estado = 'En bodega',
                 sub_estado = 'Disponible',
                 ultima_actualizacion = CURRENT_TIMESTAMP
@@ -1008,8 +870,8 @@ async def cancelar_envio(
             RETURNING id, rfid, estado, sub_estado, lote
         """)
         
-        updated_item = db.execute(update_query, {"item_id": item_id}).fetchone()
-        db.commit()
+        updated_item = (await db.execute(update_query, {"item_id": item_id})).fetchone()
+        await db.commit()
         
         return {
             "message": f"Envío cancelado: {request.motivo}",
@@ -1025,7 +887,7 @@ async def cancelar_envio(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error cancelando envío: {e}")
         raise HTTPException(status_code=500, detail=f"Error cancelando envío: {str(e)}")
 
@@ -1043,13 +905,11 @@ class BulkStateChangeRequest(BaseModel):
 @app.post("/inventario/bulk-update", status_code=status.HTTP_200_OK)
 async def bulk_update(
     request: BulkUpdateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Actualización masiva de items del inventario"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         if not request.updates:
             raise HTTPException(
                 status_code=400,
@@ -1073,15 +933,15 @@ async def bulk_update(
             if set_clauses:
                 set_clauses.append("ultima_actualizacion = CURRENT_TIMESTAMP")
                 update_query = text(f"""
-                    UPDATE {tenant_schema}.inventario_credocubes 
+                    UPDATE inventario_credocubes 
                     SET {', '.join(set_clauses)}
                     WHERE id = :id AND activo = true
                 """)
                 
-                result = db.execute(update_query, params)
+                result = await db.execute(update_query, params)
                 updated_count += result.rowcount
         
-        db.commit()
+        await db.commit()
         
         return {
             "message": f"Actualización masiva completada",
@@ -1091,7 +951,7 @@ async def bulk_update(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error en actualización masiva: {e}")
         raise HTTPException(status_code=500, detail=f"Error en actualización masiva: {str(e)}")
 
@@ -1099,7 +959,7 @@ async def bulk_update(
 @app.post("/inventario/bulk-activities", status_code=status.HTTP_200_OK)
 async def bulk_activities(
     request: BulkActivitiesRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Procesar actividades masivas"""
@@ -1119,13 +979,11 @@ async def bulk_activities(
 @app.post("/inventario/bulk-state-change", status_code=status.HTTP_200_OK)
 async def bulk_state_change(
     request: BulkStateChangeRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Cambio de estado masivo de items del inventario"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         if not request.updates:
             raise HTTPException(
                 status_code=400,
@@ -1137,15 +995,7 @@ async def bulk_state_change(
             if 'id' not in update or 'estado' not in update:
                 continue
                 
-            update_query = text(f"""
-                UPDATE {tenant_schema}.inventario_credocubes 
-                SET estado = :estado,
-                    sub_estado = :sub_estado,
-                    ultima_actualizacion = CURRENT_TIMESTAMP
-                WHERE id = :id AND activo = true
-            """)
-            
-            result = db.execute(update_query, {
+            result = await db.execute(consulta("inventario.cambiar_estado_activo"), {
                 "id": update['id'],
                 "estado": update['estado'],
                 "sub_estado": update.get('sub_estado', None)
@@ -1153,7 +1003,7 @@ async def bulk_state_change(
             
             updated_count += result.rowcount
         
-        db.commit()
+        await db.commit()
         
         return {
             "message": f"Cambio de estado masivo completado",
@@ -1163,23 +1013,21 @@ async def bulk_state_change(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error en cambio de estado masivo: {e}")
         raise HTTPException(status_code=500, detail=f"Error en cambio de estado masivo: {str(e)}")
 
 # Endpoint de debug para corregir estados de envío
 @app.patch("/debug/corregir-estados-envio", status_code=status.HTTP_200_OK)
 async def corregir_estados_envio(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_tenant_db),
     current_user: Dict[str, Any] = Depends(get_current_user_from_token)
 ):
     """Corregir items que tienen estados incorrectos de envío"""
     try:
-        tenant_schema = get_tenant_schema(current_user)
-        
         # Actualizar items que tienen "En Envío/Preparando" a "operación/En transito"
-        update_query = text(f"""
-            UPDATE {tenant_schema}.inventario_credocubes 
+        update_query = text("""
+            UPDATE inventario_credocubes 
             SET estado = 'operación',
                 sub_estado = 'En transito',
                 ultima_actualizacion = CURRENT_TIMESTAMP
@@ -1187,8 +1035,8 @@ async def corregir_estados_envio(
             RETURNING id, rfid, estado, sub_estado, lote
         """)
         
-        updated_items = db.execute(update_query).fetchall()
-        db.commit()
+        updated_items = (await db.execute(update_query)).fetchall()
+        await db.commit()
         
         return {
             "message": f"Estados corregidos para {len(updated_items)} items",
@@ -1205,7 +1053,7 @@ async def corregir_estados_envio(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error corrigiendo estados: {e}")
         raise HTTPException(status_code=500, detail=f"Error corrigiendo estados: {str(e)}")
 
@@ -0,0 +1,71 @@
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+# RTT máximo (ms) de la mejor muestra para permitir la cuenta atrás local: el error del desfase
+# estimado está acotado por RTT/2, por debajo del segundo que muestra la UI
+CLOCK_SYNC_MAX_RTT_MS = int(os.getenv("CLOCK_SYNC_MAX_RTT_MS", "1000"))
+# Muestras mínimas antes de permitirla
+CLOCK_SYNC_MIN_SAMPLES = int(os.getenv("CLOCK_SYNC_MIN_SAMPLES", "3"))
+# Antigüedad máxima de la última muestra: si el cliente deja de enviar PING vuelve a recibir los ticks
+CLOCK_SYNC_MAX_AGE_SECONDS = int(os.getenv("CLOCK_SYNC_MAX_AGE_SECONDS", "120"))
+# Muestras que se conservan por conexión (filtro de mínimo RTT, como NTP)
+CLOCK_SYNC_WINDOW = int(os.getenv("CLOCK_SYNC_WINDOW", "8"))
+
+
+def estimate_offset(t0: float, t1: float, t2: float, t3: float) -> Tuple[float, float]:
+    """Desfase (reloj servidor - reloj cliente) y RTT de un intercambio PING/PONG, estilo NTP.
+
+    t0: envío del PING (cliente), t1: recepción (servidor), t2: envío del PONG (servidor),
+    t3: recepción del PONG (cliente). El tiempo de proceso en el servidor no cuenta en el RTT.
+    """
+    offset = ((t1 - t0) + (t2 - t3)) / 2
+    rtt = (t3 - t0) - (t2 - t1)
+    return offset, rtt
+
+
+class ClockSyncState:
+    """Muestras de sincronización de reloj que reporta un cliente en sus PING.
+
+    El cliente calcula desfase y RTT con `estimate_offset` al recibir cada PONG y los envía en
+    el PING siguiente; el servidor se queda con las últimas CLOCK_SYNC_WINDOW y decide si la
+    conexión puede descontar en local (sin frames por segundo) con la de menor RTT.
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=window or CLOCK_SYNC_WINDOW)
+        self.last_sample_at: Optional[float] = None
+
+    def record(self, data: Dict[str, Any]):
+        rtt, offset = data.get("rtt"), data.get("offset")
+        if not isinstance(rtt, (int, float)) or not isinstance(offset, (int, float)) or rtt < 0:
+            return
+        self.samples.append((float(rtt), float(offset)))
+        self.last_sample_at = time.monotonic()
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        """(rtt, offset) de la muestra con menor RTT."""
+        return min(self.samples) if self.samples else None
+
+    def local_countdown_allowed(self) -> bool:
+        best = self.best()
+        return (
+            best is not None
+            and len(self.samples) >= CLOCK_SYNC_MIN_SAMPLES
+            and best[0] <= CLOCK_SYNC_MAX_RTT_MS
+            and time.monotonic() - self.last_sample_at <= CLOCK_SYNC_MAX_AGE_SECONDS
+        )
+
+    def pong(self, data: Dict[str, Any], received_ms: int, now_ms: int) -> Dict[str, Any]:
+        """Datos del PONG para un PING con `t0`; `timestamp` se mantiene por compatibilidad."""
+        self.record(data)
+        best = self.best()
+        return {
+            "t0": data.get("t0"),
+            "t1": received_ms,
+            "t2": now_ms,
+            "timestamp": now_ms,
+            "local_countdown": self.local_countdown_allowed(),
+            "rtt_ms": round(best[0], 1) if best else None,
+        }
@@ -1,8 +1,19 @@
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from dotenv import load_dotenv
+from typing import Any, AsyncIterator, Dict, Optional
+import asyncio
+import logging
 import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 # Cargar variables de entorno (si existe .env local)
 load_dotenv()
@@ -20,9 +31,116 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 # Soporte opcional de SSL: DB_SSLMODE=require|prefer|disable (se aplicará al crear el engine)
 sslmode = os.getenv("DB_SSLMODE")
 
+# Pool de conexiones (por proceso): tamaño fijo, desborde, espera máxima por una conexión (s),
+# reciclado (s) y comprobación previa al uso (descarta conexiones cortadas por el servidor o un proxy)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").strip().lower() in ("1", "true", "yes", "y")
+# Conexiones que se abren al arrancar (0 = ninguna); como máximo DB_POOL_SIZE
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "0"))
+# Zona horaria y statement_timeout (ms, 0 = sin límite) de cada sesión, vía `options` de conexión
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "UTC")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Esperas por una conexión del pool a partir de las que se registra un aviso (ms)
+DB_POOL_SLOW_WAIT_MS = float(os.getenv("DB_POOL_SLOW_WAIT_MS", "500"))
+# Pool del engine asíncrono (asyncpg), independiente del síncrono; por defecto los mismos tamaños
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+# Sentencias preparadas que asyncpg guarda por conexión (0 = ninguna, p. ej. detrás de
+# PgBouncer en modo transacción); el catálogo de shared.queries cabe entero con el valor por defecto
+DB_ASYNC_STATEMENT_CACHE_SIZE = int(os.getenv("DB_ASYNC_STATEMENT_CACHE_SIZE", "100"))
+
+
+class PoolStats:
+    """Telemetría del pool: esperas por conexión, timeouts, aperturas e invalidaciones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.slow_waits = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.prewarmed = 0
+
+    def record_wait(self, elapsed_ms: float, timed_out: bool = False):
+        with self._lock:
+            self.waits += 1
+            self.wait_total_ms += elapsed_ms
+            if elapsed_ms > self.wait_max_ms:
+                self.wait_max_ms = elapsed_ms
+            if elapsed_ms >= DB_POOL_SLOW_WAIT_MS:
+                self.slow_waits += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "waits": self.waits,
+                "wait_avg_ms": round(self.wait_total_ms / self.waits, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 3),
+                "slow_waits": self.slow_waits,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "prewarmed": self.prewarmed,
+            }
+
+
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout (incluida la apertura de la conexión si
+    hace falta) y cuenta los que agotan DB_POOL_TIMEOUT."""
+
+    stats = pool_stats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record_wait((time.perf_counter() - start) * 1000, timed_out=True)
+            logger.error(
+                f"Pool de DB agotado: {self.checkedout()} conexiones en uso, desborde {self.overflow()} "
+                f"(pool_size={self.size()}, max_overflow={self._max_overflow})"
+            )
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats.record_wait(elapsed_ms)
+        if elapsed_ms >= DB_POOL_SLOW_WAIT_MS:
+            logger.warning(f"Espera de {elapsed_ms:.0f} ms por una conexión del pool ({self.checkedout()} en uso)")
+        return record
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """Misma telemetría para el pool del engine asíncrono (cola compatible con asyncio)."""
+
+    stats = async_pool_stats
+
+
+def _connect_options() -> str:
+    """`options` de libpq: parámetros de sesión aplicados en el arranque de la conexión, sin
+    una consulta SET adicional por conexión."""
+    options = []
+    if DB_TIMEZONE:
+        options.append(f"-c timezone={DB_TIMEZONE}")
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        options.append(f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}")
+    return " ".join(options)
+
 # Engine/Session se crean en demanda para evitar fallos en import si faltan variables
 engine = None
 SessionLocal = None
+async_engine = None
+AsyncSessionLocal = None
 
 def _build_database_url() -> str:
     """Construye DATABASE_URL desde variables separadas si no existe una directa."""
@@ -60,22 +178,216 @@ def get_engine():
     if sm and "sslmode=" not in db_url:
         sep = "&" if "?" in db_url else "?"
         db_url = f"{db_url}{sep}sslmode={sm}"
-    engine = create_engine(db_url)
+    # La zona horaria de la sesión (UTC por defecto) evita desfases al convertir timestamptz ->
+    # timestamp y al usar NOW()/CURRENT_TIMESTAMP; va en el arranque de la conexión con `options`
+    connect_args = {}
+    options = _connect_options()
+    if options and db_url.startswith("postgres"):
+        connect_args["options"] = options
+    engine = create_engine(
+        db_url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
 
-    # Asegurar que la zona horaria de la sesión de PostgreSQL sea UTC en cada conexión.
-    # Esto evita desfases cuando se convierten timestamptz -> timestamp y al usar NOW()/CURRENT_TIMESTAMP.
     @event.listens_for(engine, "connect")
-    def set_session_timezone(dbapi_connection, connection_record):
-        try:
-            cursor = dbapi_connection.cursor()
-            cursor.execute("SET TIME ZONE 'UTC'")
-            cursor.close()
-        except Exception:
-            # No bloquear la creación del engine por fallos al ajustar la TZ de sesión
-            pass
+    def count_connect(dbapi_connection, connection_record):
+        pool_stats.connects += 1
+
+    @event.listens_for(engine, "invalidate")
+    def count_invalidate(dbapi_connection, connection_record, exception):
+        pool_stats.invalidations += 1
+
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     return engine
 
+
+def _build_async_database_url():
+    """URL `postgresql+asyncpg://` equivalente a la del engine síncrono y sus connect_args.
+
+    asyncpg no entiende `sslmode` ni `options` de libpq: el modo SSL va en `ssl` y los
+    parámetros de sesión en `server_settings`.
+    """
+    db_url = _build_database_url()
+    if not db_url:
+        raise RuntimeError("Variables de entorno de DB no configuradas (DATABASE_URL o DB_HOST/USER/PASSWORD/NAME)")
+    url = make_url(db_url)
+    query = dict(url.query)
+    sm = query.pop("sslmode", None) or os.getenv("DB_SSLMODE") or sslmode
+    url = url.set(drivername="postgresql+asyncpg", query=query)
+    server_settings = {}
+    if DB_TIMEZONE:
+        server_settings["timezone"] = DB_TIMEZONE
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    connect_args: Dict[str, Any] = {
+        "server_settings": server_settings,
+        "prepared_statement_cache_size": DB_ASYNC_STATEMENT_CACHE_SIZE,
+    }
+    if sm and sm != "disable":
+        connect_args["ssl"] = sm
+    return url, connect_args
+
+
+def get_async_engine():
+    """Devuelve el engine asíncrono (asyncpg), creándolo si es necesario."""
+    global async_engine, AsyncSessionLocal
+    if async_engine is not None:
+        return async_engine
+    url, connect_args = _build_async_database_url()
+    async_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=DB_ASYNC_POOL_SIZE,
+        max_overflow=DB_ASYNC_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def count_connect(dbapi_connection, connection_record):
+        async_pool_stats.connects += 1
+
+    @event.listens_for(async_engine.sync_engine, "invalidate")
+    def count_invalidate(dbapi_connection, connection_record, exception):
+        async_pool_stats.invalidations += 1
+
+    # expire_on_commit=False: las filas siguen legibles tras el commit sin otra ida a la DB
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    return async_engine
+
+
+async def dispose_async_engine():
+    """Cerrar las conexiones del engine asíncrono (en el shutdown del servicio)."""
+    global async_engine, AsyncSessionLocal
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+        AsyncSessionLocal = None
+
+
+def prewarm_pool(count: Optional[int] = None) -> int:
+    """Abrir `count` conexiones (DB_POOL_PREWARM por defecto, como máximo DB_POOL_SIZE) y
+    devolverlas al pool, para que las primeras peticiones no paguen la conexión."""
+    count = min(DB_POOL_PREWARM if count is None else count, DB_POOL_SIZE)
+    if count <= 0:
+        return 0
+    eng = get_engine()
+    conns = []
+    try:
+        for _ in range(count):
+            conns.append(eng.connect())
+    finally:
+        for conn in conns:
+            conn.close()
+    pool_stats.prewarmed += len(conns)
+    logger.info(f"Pool de DB precalentado con {len(conns)} conexiones")
+    return len(conns)
+
+
+async def prewarm_async_pool(count: Optional[int] = None) -> int:
+    """Como `prewarm_pool`, para el pool asíncrono (como máximo DB_ASYNC_POOL_SIZE)."""
+    count = min(DB_POOL_PREWARM if count is None else count, DB_ASYNC_POOL_SIZE)
+    if count <= 0:
+        return 0
+    eng = get_async_engine()
+    conns = []
+    try:
+        # Abrir en paralelo: el handshake con la DB no bloquea el event loop
+        results = await asyncio.gather(*(eng.connect().start() for _ in range(count)), return_exceptions=True)
+        conns = [c for c in results if not isinstance(c, BaseException)]
+        errors = [e for e in results if isinstance(e, BaseException)]
+        if errors:
+            raise errors[0]
+    finally:
+        for conn in conns:
+            await conn.close()
+    async_pool_stats.prewarmed += len(conns)
+    logger.info(f"Pool asíncrono de DB precalentado con {len(conns)} conexiones")
+    return len(conns)
+
+
+def pool_status() -> Dict[str, Any]:
+    """Estado del pool (conexiones en uso, libres, desborde) y telemetría acumulada."""
+    report: Dict[str, Any] = {
+        "config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout_s": DB_POOL_TIMEOUT,
+            "recycle_s": DB_POOL_RECYCLE,
+            "pre_ping": DB_POOL_PRE_PING,
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+        },
+        **pool_stats.snapshot(),
+    }
+    if engine is not None:
+        report.update(_pool_gauges(engine.pool))
+    if async_engine is not None:
+        report["async"] = {
+            "config": {
+                "pool_size": DB_ASYNC_POOL_SIZE,
+                "max_overflow": DB_ASYNC_MAX_OVERFLOW,
+                "statement_cache_size": DB_ASYNC_STATEMENT_CACHE_SIZE,
+            },
+            **async_pool_stats.snapshot(),
+            **_pool_gauges(async_engine.pool),
+        }
+    return report
+
+
+def _pool_gauges(pool) -> Dict[str, int]:
+    return {
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "size": pool.size(),
+    }
+
+
+def pool_metrics_text(service: str = "") -> str:
+    """Estado del pool en formato de exposición de Prometheus."""
+    status = pool_status()
+    labels = f'{{service="{service}"}}' if service else ""
+    metrics = [
+        ("db_pool_size", "gauge", status["config"]["pool_size"]),
+        ("db_pool_max_overflow", "gauge", status["config"]["max_overflow"]),
+        ("db_pool_checked_out", "gauge", status.get("checked_out", 0)),
+        ("db_pool_checked_in", "gauge", status.get("checked_in", 0)),
+        ("db_pool_overflow", "gauge", status.get("overflow", 0)),
+        ("db_pool_waits_total", "counter", status["waits"]),
+        ("db_pool_wait_avg_ms", "gauge", status["wait_avg_ms"]),
+        ("db_pool_wait_max_ms", "gauge", status["wait_max_ms"]),
+        ("db_pool_slow_waits_total", "counter", status["slow_waits"]),
+        ("db_pool_timeouts_total", "counter", status["timeouts"]),
+        ("db_pool_connects_total", "counter", status["connects"]),
+        ("db_pool_invalidations_total", "counter", status["invalidations"]),
+    ]
+    if "async" in status:
+        a = status["async"]
+        metrics += [
+            ("db_async_pool_size", "gauge", a["config"]["pool_size"]),
+            ("db_async_pool_checked_out", "gauge", a["checked_out"]),
+            ("db_async_pool_checked_in", "gauge", a["checked_in"]),
+            ("db_async_pool_overflow", "gauge", a["overflow"]),
+            ("db_async_pool_waits_total", "counter", a["waits"]),
+            ("db_async_pool_wait_avg_ms", "gauge", a["wait_avg_ms"]),
+            ("db_async_pool_wait_max_ms", "gauge", a["wait_max_ms"]),
+            ("db_async_pool_timeouts_total", "counter", a["timeouts"]),
+            ("db_async_pool_connects_total", "counter", a["connects"]),
+        ]
+    lines = []
+    for name, kind, value in metrics:
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
 # Crear base para modelos
 Base = declarative_base()
 
@@ -88,3 +400,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Sesión asíncrona (asyncpg): los endpoints `async def` esperan a la DB sin bloquear el event loop
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -8,10 +8,18 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Reintentos de un mensaje cuyo callback falla (consume_messages con requeue) antes de
+# apartarlo en la cola "<cola>.fallidos"
+MQ_MAX_REINTENTOS = int(os.getenv("MQ_MAX_REINTENTOS", "5"))
+# Espera máxima entre reintentos (crece 1, 2, 4... segundos hasta este tope)
+MQ_REINTENTO_MAX_ESPERA = float(os.getenv("MQ_REINTENTO_MAX_ESPERA", "30"))
+
 class MessageQueue:
     def __init__(self):
         self.connection: Optional[aio_pika.RobustConnection] = None
         self.channel: Optional[aio_pika.Channel] = None
+        # Exchanges fanout ya declarados en el canal actual (evita un declare por publicación)
+        self._fanout_exchanges: Dict[str, Any] = {}
         self.rabbitmq_url = self._get_rabbitmq_url()
         
     def _get_rabbitmq_url(self) -> str:
@@ -32,6 +40,7 @@ class MessageQueue:
                     loop=asyncio.get_event_loop()
                 )
                 self.channel = await self.connection.channel()
+                self._fanout_exchanges = {}
                 await self.channel.set_qos(prefetch_count=10)
                 logger.info("✅ Conectado a RabbitMQ exitosamente")
                 return
@@ -87,37 +96,71 @@ class MessageQueue:
             logger.error(f"❌ Error publicando mensaje: {e}")
             raise
 
-    async def publish_fanout(self, exchange_name: str, message: Dict[Any, Any]):
-        """Publicar un mensaje en un exchange fanout (broadcast a todos los consumidores)."""
+    async def _fanout_exchange(self, exchange_name: str):
+        exchange = self._fanout_exchanges.get(exchange_name)
+        if exchange is None:
+            exchange = await self.channel.declare_exchange(exchange_name, ExchangeType.FANOUT, durable=True)
+            self._fanout_exchanges[exchange_name] = exchange
+        return exchange
+
+    async def publish_fanout(self, exchange_name: str, message: Dict[Any, Any], persistent: bool = True):
+        """Publicar un mensaje en un exchange fanout (broadcast a todos los consumidores).
+
+        `persistent=False` para mensajes efímeros de alta frecuencia (latidos, ticks).
+        """
         try:
             if not self.channel:
                 await self.connect()
 
-            # Declarar exchange fanout
-            exchange = await self.channel.declare_exchange(exchange_name, ExchangeType.FANOUT, durable=True)
+            # Declarar exchange fanout (una vez por canal)
+            exchange = await self._fanout_exchange(exchange_name)
             message_body = json.dumps(message, default=str)
             await exchange.publish(
-                Message(message_body.encode(), delivery_mode=DeliveryMode.PERSISTENT),
+                Message(
+                    message_body.encode(),
+                    delivery_mode=DeliveryMode.PERSISTENT if persistent else DeliveryMode.NOT_PERSISTENT,
+                ),
                 routing_key=""
             )
-            logger.info(f"📣 Fanout '{exchange_name}' publicado: {message}")
+            # Solo el tipo de evento: los payloads (lotes, ticks) pueden ser grandes y frecuentes
+            logger.debug(f"📣 Fanout '{exchange_name}' publicado: {message.get('event')}")
         except Exception as e:
             logger.error(f"❌ Error publicando en fanout '{exchange_name}': {e}")
             raise
     
-    async def consume_messages(self, queue_name: str, callback: Callable):
-        """Consumir mensajes de una cola"""
+    async def consume_messages(
+        self,
+        queue_name: str,
+        callback: Callable,
+        prefetch_count: Optional[int] = None,
+        requeue: bool = False,
+    ):
+        """Consumir mensajes de una cola.
+
+        `prefetch_count` ajusta cuántos mensajes sin confirmar entrega el broker al canal (los
+        consumidores por micro-lotes necesitan al menos el tamaño del lote). Con `requeue` un
+        mensaje cuyo callback falla se vuelve a publicar al final de la cola con la cabecera
+        `x-reintentos` incrementada, hasta MQ_MAX_REINTENTOS; después se aparta en
+        "<cola>.fallidos" para que un error permanente no bloquee la cola.
+        """
         try:
             if not self.channel:
                 await self.connect()
+            if prefetch_count:
+                await self.channel.set_qos(prefetch_count=prefetch_count)
             
             queue = await self.declare_queue(queue_name)
             
             async def process_message(message: aio_pika.IncomingMessage):
-                async with message.process():
+                async with message.process(requeue=requeue):
                     try:
                         # Decodificar mensaje JSON
                         message_data = json.loads(message.body.decode())
+                    except ValueError as e:
+                        # Un mensaje malformado nunca se podrá procesar: no reencolarlo
+                        logger.error(f"❌ Mensaje inválido en cola '{queue_name}': {e}")
+                        return
+                    try:
                         logger.info(f"📥 Mensaje recibido de cola '{queue_name}': {message_data}")
                         
                         # Ejecutar callback
@@ -125,7 +168,10 @@ class MessageQueue:
                         
                     except Exception as e:
                         logger.error(f"❌ Error procesando mensaje: {e}")
-                        raise
+                        if not requeue:
+                            raise
+                        # Si el reenvío falla, la excepción devuelve el original a la cola
+                        await self._retry_later(queue_name, message)
             
             # Consumir mensajes
             await queue.consume(process_message)
@@ -135,6 +181,24 @@ class MessageQueue:
             logger.error(f"❌ Error consumiendo mensajes: {e}")
             raise
 
+    async def _retry_later(self, queue_name: str, message: aio_pika.IncomingMessage):
+        """Volver a publicar un mensaje fallido con un reintento más, o apartarlo si ya agotó
+        MQ_MAX_REINTENTOS (el original se confirma en ambos casos)."""
+        headers = dict(message.headers or {})
+        reintentos = int(headers.get("x-reintentos", 0))
+        if reintentos >= MQ_MAX_REINTENTOS:
+            destino = f"{queue_name}.fallidos"
+            await self.declare_queue(destino)
+            logger.error(f"❌ Mensaje de '{queue_name}' apartado en '{destino}' tras {reintentos} reintentos")
+        else:
+            destino = queue_name
+            await asyncio.sleep(min(2 ** reintentos, MQ_REINTENTO_MAX_ESPERA))
+        headers["x-reintentos"] = reintentos + 1
+        await self.channel.default_exchange.publish(
+            Message(message.body, headers=headers, delivery_mode=DeliveryMode.PERSISTENT),
+            routing_key=destino,
+        )
+
     async def consume_fanout(self, exchange_name: str, callback: Callable):
         """Consumir mensajes de un exchange fanout con una cola exclusiva por instancia."""
         try:
@@ -142,7 +206,7 @@ class MessageQueue:
                 await self.connect()
 
             # Declarar exchange fanout
-            exchange = await self.channel.declare_exchange(exchange_name, ExchangeType.FANOUT, durable=True)
+            exchange = await self._fanout_exchange(exchange_name)
             # Crear cola exclusiva y auto-borrable por instancia
             queue = await self.channel.declare_queue(exclusive=True, auto_delete=True)
             await queue.bind(exchange)
@@ -151,7 +215,7 @@ class MessageQueue:
                 async with message.process():
                     try:
                         data = json.loads(message.body.decode())
-                        logger.info(f"📥 Fanout '{exchange_name}' recibido: {data}")
+                        logger.debug(f"📥 Fanout '{exchange_name}' recibido: {data.get('event')}")
                         await callback(data)
                     except Exception as e:
                         logger.error(f"❌ Error procesando fanout '{exchange_name}': {e}")
@@ -0,0 +1,175 @@
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+# Catálogo de consultas con nombre de las rutas calientes (inventario, dashboard, alertas).
+#
+# Las tablas van sin schema: se resuelven con el search_path que fija la sesión de tenant
+# (shared.tenant_db), así que el texto SQL es el mismo para todos los tenants. SQLAlchemy
+# compila cada sentencia una sola vez y asyncpg la prepara una vez por conexión y la
+# reutiliza para cualquier tenant. Usar siempre con get_tenant_db / get_async_tenant_db.
+
+_COLUMNAS_INVENTARIO = """
+    id, modelo_id,
+    (SELECT nombre_modelo FROM modelos m WHERE m.modelo_id = inventario_credocubes.modelo_id) AS nombre_modelo,
+    nombre_unidad, rfid, lote, estado, sub_estado,
+    validacion_limpieza, validacion_goteo, validacion_desinfeccion,
+    categoria, fecha_ingreso, ultima_actualizacion, fecha_vencimiento, activo
+"""
+
+_COLUMNAS_ALERTA = "id, inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta, fecha_resolucion"
+
+_SQL: Dict[str, str] = {
+    # --- Modelos ---
+    "modelos.listado": """
+        SELECT modelo_id, nombre_modelo, volumen_litros, descripcion,
+               dim_ext_frente, dim_ext_profundo, dim_ext_alto,
+               dim_int_frente, dim_int_profundo, dim_int_alto,
+               tic_frente, tic_alto, peso_total_kg, tipo
+        FROM modelos
+        ORDER BY nombre_modelo
+        OFFSET :skip LIMIT :limit
+    """,
+    # --- Inventario ---
+    "inventario.listado": """
+        SELECT i.id, i.modelo_id, m.nombre_modelo, i.nombre_unidad, i.rfid,
+               i.lote, i.estado, i.sub_estado, i.validacion_limpieza,
+               i.validacion_goteo, i.validacion_desinfeccion, i.categoria,
+               i.fecha_ingreso, i.ultima_actualizacion, i.fecha_vencimiento, i.activo
+        FROM inventario_credocubes i
+        LEFT JOIN modelos m ON i.modelo_id = m.modelo_id
+        WHERE i.activo = true
+        ORDER BY i.ultima_actualizacion DESC, i.fecha_ingreso DESC
+        OFFSET :skip LIMIT :limit
+    """,
+    "inventario.existe": "SELECT id FROM inventario_credocubes WHERE id = :id",
+    "inventario.activo_por_id": "SELECT id, rfid FROM inventario_credocubes WHERE id = :id AND activo = true",
+    "inventario.rfid_activo": "SELECT id FROM inventario_credocubes WHERE rfid = :rfid AND activo = true",
+    "inventario.rfid_en_otro": "SELECT id FROM inventario_credocubes WHERE rfid = :rfid AND id != :id",
+    "inventario.lote": "SELECT lote FROM inventario_credocubes WHERE id = :id",
+    "inventario.ultimo_lote_del_dia": """
+        SELECT lote FROM inventario_credocubes
+        WHERE lote LIKE :prefijo
+        ORDER BY lote DESC
+        LIMIT 1
+    """,
+    "inventario.insertar": f"""
+        INSERT INTO inventario_credocubes
+        (modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
+         validacion_limpieza, validacion_goteo, validacion_desinfeccion, categoria,
+         fecha_ingreso, ultima_actualizacion, activo)
+        VALUES (:modelo_id, :nombre_unidad, :rfid, :lote, :estado, :sub_estado,
+                :validacion_limpieza, :validacion_goteo, :validacion_desinfeccion, :categoria,
+                COALESCE(:fecha_ingreso, NOW()), COALESCE(:ultima_actualizacion, NOW()), true)
+        RETURNING {_COLUMNAS_INVENTARIO}
+    """,
+    "inventario.actualizar_estado": f"""
+        UPDATE inventario_credocubes
+        SET estado = :estado, sub_estado = :sub_estado,
+            ultima_actualizacion = CURRENT_TIMESTAMP
+        WHERE id = :id
+        RETURNING {_COLUMNAS_INVENTARIO}
+    """,
+    "inventario.actualizar_estado_y_lote": f"""
+        UPDATE inventario_credocubes
+        SET estado = :estado, sub_estado = :sub_estado, lote = :lote,
+            ultima_actualizacion = CURRENT_TIMESTAMP
+        WHERE id = :id
+        RETURNING {_COLUMNAS_INVENTARIO}
+    """,
+    "inventario.asignar_lote_y_estado": """
+        UPDATE inventario_credocubes
+        SET lote = :lote, estado = :estado, sub_estado = :sub_estado,
+            ultima_actualizacion = CURRENT_TIMESTAMP
+        WHERE rfid = ANY(:rfids) AND activo = true
+        RETURNING id, modelo_id, nombre_unidad, rfid, lote, estado, sub_estado,
+                  categoria, fecha_ingreso, ultima_actualizacion
+    """,
+    "inventario.cambiar_estado_activo": """
+        UPDATE inventario_credocubes
+        SET estado = :estado, sub_estado = :sub_estado,
+            ultima_actualizacion = CURRENT_TIMESTAMP
+        WHERE id = :id AND activo = true
+    """,
+    "inventario.baja": """
+        UPDATE inventario_credocubes
+        SET activo = false, ultima_actualizacion = CURRENT_TIMESTAMP
+        WHERE id = :id
+    """,
+    # --- Dashboard ---
+    "dashboard.metricas": """
+        SELECT
+            COUNT(*) as total_items,
+            COUNT(CASE WHEN LOWER(estado) = 'en bodega' THEN 1 END) as en_bodega,
+            COUNT(CASE WHEN LOWER(estado) IN ('en operacion','en operación') THEN 1 END) as en_operacion,
+            COUNT(CASE WHEN LOWER(estado) = 'en limpieza' THEN 1 END) as en_limpieza,
+            COUNT(CASE WHEN LOWER(estado) IN ('en devolucion','en devolución') THEN 1 END) as en_devolucion,
+            COUNT(CASE WHEN LOWER(estado) NOT IN ('en bodega','en operacion','en operación','en limpieza','en devolucion','en devolución') THEN 1 END) as otros_estados,
+            COUNT(CASE WHEN validacion_limpieza IS NULL OR validacion_goteo IS NULL OR validacion_desinfeccion IS NULL THEN 1 END) as por_validar,
+            COUNT(CASE WHEN validacion_limpieza IS NOT NULL AND validacion_goteo IS NOT NULL AND validacion_desinfeccion IS NOT NULL THEN 1 END) as validados
+        FROM inventario_credocubes
+        WHERE activo = true
+    """,
+    "dashboard.procesamiento": """
+        WITH monthly_data AS (
+            SELECT
+                TO_CHAR(fecha_ingreso, 'Mon') as mes,
+                COUNT(CASE WHEN LOWER(estado) IN ('recepcion','recepción') THEN 1 END) as recepcion,
+                COUNT(CASE WHEN LOWER(estado) IN ('inspeccion','inspección') THEN 1 END) as inspeccion,
+                COUNT(CASE WHEN LOWER(estado) = 'en limpieza' THEN 1 END) as limpieza,
+                COUNT(CASE WHEN LOWER(estado) IN ('en operacion','en operación') THEN 1 END) as operacion
+            FROM inventario_credocubes
+            WHERE activo = true AND fecha_ingreso >= NOW() - INTERVAL '12 months'
+            GROUP BY DATE_TRUNC('month', fecha_ingreso), TO_CHAR(fecha_ingreso, 'Mon')
+            ORDER BY DATE_TRUNC('month', fecha_ingreso)
+        )
+        SELECT mes,
+               COALESCE(recepcion,0) as recepcion,
+               COALESCE(inspeccion,0) as inspeccion,
+               COALESCE(limpieza,0) as limpieza,
+               COALESCE(operacion,0) as operacion
+        FROM monthly_data
+    """,
+    "dashboard.actividad_reciente": """
+        SELECT a.id, a.inventario_id, a.descripcion, a.timestamp,
+               i.nombre_unidad, i.rfid, a.estado_nuevo
+        FROM actividades_operacion a
+        LEFT JOIN inventario_credocubes i ON a.inventario_id = i.id
+        ORDER BY a.timestamp DESC
+        LIMIT 10
+    """,
+    # --- Alertas ---
+    # Filtros opcionales en una sola sentencia: NULL = sin filtro
+    "alertas.listado": f"""
+        SELECT {_COLUMNAS_ALERTA}
+        FROM alertas
+        WHERE (CAST(:inventario_id AS INTEGER) IS NULL OR inventario_id = :inventario_id)
+          AND (CAST(:resuelta AS BOOLEAN) IS NULL OR resuelta = :resuelta)
+        ORDER BY fecha_creacion DESC
+        OFFSET :skip LIMIT :limit
+    """,
+    "alertas.por_id": f"SELECT {_COLUMNAS_ALERTA} FROM alertas WHERE id = :id",
+    "alertas.existe": "SELECT id FROM alertas WHERE id = :id",
+    "alertas.insertar": f"""
+        INSERT INTO alertas (inventario_id, tipo_alerta, descripcion, fecha_creacion, resuelta)
+        VALUES (:inventario_id, :tipo_alerta, :descripcion, NOW(), false)
+        RETURNING {_COLUMNAS_ALERTA}
+    """,
+    "alertas.eliminar": "DELETE FROM alertas WHERE id = :id RETURNING id",
+    "alertas.estadisticas": """
+        SELECT
+            COUNT(*) as total,
+            COUNT(CASE WHEN resuelta = false THEN 1 END) as pendientes,
+            COUNT(CASE WHEN resuelta = true THEN 1 END) as resueltas,
+            COUNT(CASE WHEN fecha_creacion >= NOW() - INTERVAL '24 hours' THEN 1 END) as ultimas_24h
+        FROM alertas
+    """,
+}
+
+CONSULTAS: Dict[str, TextClause] = {nombre: text(sql) for nombre, sql in _SQL.items()}
+
+
+def consulta(nombre: str) -> TextClause:
+    """Sentencia del catálogo por nombre (KeyError si no existe)."""
+    return CONSULTAS[nombre]
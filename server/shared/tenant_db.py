@@ -0,0 +1,65 @@
+import os
+from typing import Any, AsyncIterator, Dict, Iterator
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from shared import database
+from shared.timer_store import _safe_schema
+from shared.utils import get_current_user_from_token
+
+# Schemas que siguen al del tenant en el search_path (p. ej. "public" para extensiones). Vacío
+# por defecto: una tabla que falte en el schema del tenant da error en lugar de resolverse
+# contra otro schema (las consultas de shared.queries van sin calificar). pg_catalog se busca
+# siempre, así que las funciones integradas no lo necesitan.
+TENANT_SEARCH_PATH_SUFFIX = os.getenv("TENANT_SEARCH_PATH_SUFFIX", "").strip()
+
+# set_config(..., true) equivale a SET LOCAL: dura lo que la transacción, así que la conexión
+# vuelve al pool sin el schema del tenant
+_SET_SEARCH_PATH = text("SELECT set_config('search_path', :search_path, true)")
+
+
+def tenant_search_path(tenant: str) -> str:
+    schema = _safe_schema(tenant)
+    return f"{schema}, {TENANT_SEARCH_PATH_SUFFIX}" if TENANT_SEARCH_PATH_SUFFIX else schema
+
+
+def _tenant_info(current_user: Dict[str, Any]) -> Dict[str, str]:
+    tenant = current_user.get("tenant") or "tenant_base"
+    try:
+        return {"tenant": tenant, "search_path": tenant_search_path(tenant)}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@event.listens_for(Session, "after_begin")
+def _aplicar_search_path(session, transaction, connection):
+    """Cada transacción de una sesión de tenant arranca con su search_path (también las que
+    se abren después de un commit)."""
+    search_path = session.info.get("search_path")
+    if search_path:
+        connection.execute(_SET_SEARCH_PATH, {"search_path": search_path})
+
+
+# Sesión síncrona ligada al tenant del token: las consultas de shared.queries (sin schema)
+# se resuelven contra el schema del tenant
+def get_tenant_db(current_user: Dict[str, Any] = Depends(get_current_user_from_token)) -> Iterator[Session]:
+    info = _tenant_info(current_user)
+    database.get_engine()
+    db = database.SessionLocal(info=info)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Igual que get_tenant_db, sobre el engine asíncrono (asyncpg)
+async def get_async_tenant_db(
+    current_user: Dict[str, Any] = Depends(get_current_user_from_token),
+) -> AsyncIterator[AsyncSession]:
+    info = _tenant_info(current_user)
+    database.get_async_engine()
+    async with database.AsyncSessionLocal(info=info) as db:
+        yield db
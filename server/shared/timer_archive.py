@@ -0,0 +1,343 @@
+import gzip
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+
+from shared.timer_store import PostgresTimerStore, _SCHEMA_RE, _safe_schema
+
+logger = logging.getLogger(__name__)
+
+# Segundos que un timer completado sigue en memoria tras su fechaFin; 0 = sin TTL
+TIMER_RETENTION_SECONDS = int(os.getenv("TIMER_RETENTION_SECONDS", "86400"))
+# Máximo de timers en memoria por tenant (se archivan primero los completados más antiguos); 0 = sin límite
+TIMER_RETENTION_MAX_PER_TENANT = int(os.getenv("TIMER_RETENTION_MAX_PER_TENANT", "0"))
+# Intervalo entre pasadas de retención
+TIMER_RETENTION_INTERVAL_SECONDS = int(os.getenv("TIMER_RETENTION_INTERVAL_SECONDS", "60"))
+# Destino del archivo: "postgres" (tabla timers_archivo por tenant) o "file" (JSONL comprimido).
+# Vacío = "postgres" si los timers se persisten en PostgreSQL, si no "file".
+TIMER_ARCHIVE = os.getenv("TIMER_ARCHIVE", "").strip().lower()
+TIMER_ARCHIVE_FILE = os.getenv("TIMER_ARCHIVE_FILE", "timers_archive.jsonl.gz")
+# Con persistencia en PostgreSQL: intervalo entre pasadas que archivan por TTL los completados que
+# quedaron en la tabla `timers` (no se cargan en memoria) y filas movidas por transacción
+TIMER_ARCHIVE_STORED_INTERVAL_SECONDS = int(os.getenv("TIMER_ARCHIVE_STORED_INTERVAL_SECONDS", "3600"))
+TIMER_ARCHIVE_STORED_BATCH = int(os.getenv("TIMER_ARCHIVE_STORED_BATCH", "5000"))
+
+_CREATE_ARCHIVE_SQL = """
+CREATE TABLE IF NOT EXISTS {schema}.timers_archivo (
+    id TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    tipo_operacion TEXT NOT NULL,
+    tiempo_inicial_minutos INTEGER NOT NULL,
+    tiempo_restante_segundos INTEGER NOT NULL,
+    fecha_inicio TIMESTAMPTZ NOT NULL,
+    fecha_fin TIMESTAMPTZ NOT NULL,
+    activo BOOLEAN NOT NULL DEFAULT FALSE,
+    completado BOOLEAN NOT NULL DEFAULT TRUE,
+    rfid TEXT,
+    inventario_id INTEGER,
+    datos JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+    archivado_en TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+_CREATE_ARCHIVE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS timers_archivo_rfid_idx ON {schema}.timers_archivo (rfid, fecha_fin DESC)
+"""
+
+_INSERT_ARCHIVE_SQL = """
+INSERT INTO {schema}.timers_archivo (
+    id, nombre, tipo_operacion, tiempo_inicial_minutos, tiempo_restante_segundos,
+    fecha_inicio, fecha_fin, activo, completado, rfid, inventario_id, datos
+) VALUES (
+    :id, :nombre, :tipo_operacion, :tiempo_inicial_minutos, :tiempo_restante_segundos,
+    :fecha_inicio, :fecha_fin, :activo, :completado, :rfid, :inventario_id, CAST(:datos AS JSONB)
+)
+ON CONFLICT (id) DO NOTHING
+"""
+
+# Completados de la tabla `timers` vencidos por TTL (usa el índice parcial timers_completados_idx)
+_STORED_EXPIRED_SQL = """
+SELECT id FROM {schema}.timers
+WHERE completado AND fecha_fin < NOW() - make_interval(secs => :ttl)
+LIMIT :limite
+"""
+
+# Mover un lote de la tabla `timers` al archivo en una sola sentencia
+_MOVE_STORED_SQL = """
+WITH movidos AS (
+    DELETE FROM {schema}.timers
+    WHERE id IN (""" + _STORED_EXPIRED_SQL + """)
+    RETURNING id, nombre, tipo_operacion, tiempo_inicial_minutos, tiempo_restante_segundos,
+              fecha_inicio, fecha_fin, activo, completado, rfid, inventario_id, datos
+), archivados AS (
+    INSERT INTO {schema}.timers_archivo (
+        id, nombre, tipo_operacion, tiempo_inicial_minutos, tiempo_restante_segundos,
+        fecha_inicio, fecha_fin, activo, completado, rfid, inventario_id, datos
+    )
+    SELECT id, nombre, tipo_operacion, tiempo_inicial_minutos, tiempo_restante_segundos,
+           fecha_inicio, fecha_fin, activo, completado, rfid, inventario_id, datos
+    FROM movidos
+    ON CONFLICT (id) DO NOTHING
+    RETURNING 1
+)
+SELECT (SELECT COUNT(*) FROM movidos), (SELECT COUNT(*) FROM archivados)
+"""
+
+
+def _stored_schemas(conn) -> List[str]:
+    """Schemas de tenant con tabla `timers`."""
+    return [
+        row[0] for row in conn.execute(text(
+            "SELECT table_schema FROM information_schema.tables WHERE table_name = 'timers'"
+        ))
+        if _SCHEMA_RE.match(row[0])
+    ]
+
+
+class TimerRetention:
+    """Política de retención de los timers en memoria.
+
+    Solo se archivan timers completados: los que superan el TTL desde su fechaFin y, si un
+    tenant pasa del máximo de timers en memoria, sus completados más antiguos hasta volver
+    al límite. Los timers en curso o pausados nunca se archivan.
+    """
+
+    def __init__(self, ttl_seconds: Optional[int] = None, max_per_tenant: Optional[int] = None):
+        self.ttl = TIMER_RETENTION_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_per_tenant = TIMER_RETENTION_MAX_PER_TENANT if max_per_tenant is None else max_per_tenant
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 or self.max_per_tenant > 0
+
+    def select(
+        self,
+        completed: Iterable[Any],
+        live_by_tenant: Dict[str, int],
+        tenant_of: Callable[[Any], str],
+        now_ts: float,
+    ) -> List[Any]:
+        """Timers completados a archivar, dado el total de timers en memoria de cada tenant."""
+        expired: List[Any] = []
+        kept: Dict[str, List[Any]] = {}
+        limit = now_ts - self.ttl
+        for timer in completed:
+            if self.ttl > 0 and timer.fechaFin.timestamp() <= limit:
+                expired.append(timer)
+            else:
+                kept.setdefault(tenant_of(timer), []).append(timer)
+
+        if self.max_per_tenant > 0:
+            expired_by_tenant: Dict[str, int] = {}
+            for timer in expired:
+                tenant = tenant_of(timer)
+                expired_by_tenant[tenant] = expired_by_tenant.get(tenant, 0) + 1
+            for tenant, timers in kept.items():
+                excess = live_by_tenant.get(tenant, 0) - expired_by_tenant.get(tenant, 0) - self.max_per_tenant
+                if excess > 0:
+                    timers.sort(key=lambda t: t.fechaFin)
+                    expired.extend(timers[:excess])
+        return expired
+
+    def describe(self) -> Dict[str, int]:
+        return {"ttl_seconds": self.ttl, "max_per_tenant": self.max_per_tenant}
+
+
+class FileTimerArchive:
+    """Archivo de timers en un JSONL comprimido con gzip.
+
+    Cada escritura anexa un miembro gzip nuevo (el formato admite miembros concatenados),
+    así que no se reescribe el archivo. Las consultas lo recorren entero: es para historial
+    ocasional, no para el camino caliente.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or TIMER_ARCHIVE_FILE
+        self.archived: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def refresh_count(self) -> int:
+        count = 0
+        if os.path.exists(self.path):
+            with gzip.open(self.path, "rt") as f:
+                count = sum(1 for line in f if line.strip())
+        self.archived = count
+        return count
+
+    def write(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        lines = "".join(json.dumps(r, default=str, separators=(",", ":")) + "\n" for r in records)
+        with self._lock:
+            with gzip.open(self.path, "at") as f:
+                f.write(lines)
+            if self.archived is not None:
+                self.archived += len(records)
+
+    def query(
+        self,
+        tenant: Optional[str] = None,
+        rfid: Optional[str] = None,
+        inventario_id: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Timers archivados que cumplen los filtros, los más recientes primero."""
+        matches: List[Dict[str, Any]] = []
+        if not os.path.exists(self.path):
+            return matches
+        with gzip.open(self.path, "rt") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if tenant is not None and record.get("tenant") != tenant:
+                    continue
+                if rfid is not None and (record.get("rfid") or record.get("nombre")) != rfid:
+                    continue
+                if inventario_id is not None and record.get("inventario_id") != inventario_id:
+                    continue
+                matches.append(record)
+        matches.sort(key=lambda r: str(r.get("fechaFin")), reverse=True)
+        return matches[:limit]
+
+    def archive_stored(self, engine_factory: Callable, ttl_seconds: int) -> int:
+        """Mover al archivo los completados de la tabla `timers` con más de `ttl_seconds` desde
+        su fechaFin. Cada lote se borra y se escribe en la misma transacción: si el archivo
+        falla, las filas se quedan en la tabla."""
+        moved = 0
+        with engine_factory().connect() as conn:
+            schemas = _stored_schemas(conn)
+        for schema in schemas:
+            while True:
+                with engine_factory().begin() as conn:
+                    rows = conn.execute(
+                        text(f"DELETE FROM {schema}.timers WHERE id IN ({_STORED_EXPIRED_SQL.format(schema=schema)}) RETURNING datos"),
+                        {"ttl": ttl_seconds, "limite": TIMER_ARCHIVE_STORED_BATCH},
+                    ).fetchall()
+                    records = [
+                        {**datos, "tenant": datos.get("tenant") or schema}
+                        for datos in (json.loads(row[0]) if isinstance(row[0], str) else dict(row[0]) for row in rows)
+                    ]
+                    self.write(records)
+                moved += len(records)
+                if len(records) < TIMER_ARCHIVE_STORED_BATCH:
+                    break
+        return moved
+
+
+class PostgresTimerArchive:
+    """Archivo de timers en la tabla `timers_archivo` de cada schema de tenant (mismas
+    columnas que `timers`, con `archivado_en`). Un INSERT por lotes por tenant."""
+
+    def __init__(self, engine_factory: Callable, default_tenant: Optional[str] = None):
+        self.engine_factory = engine_factory
+        self.default_tenant = default_tenant
+        self.archived: Optional[int] = None
+        self.ensured_schemas = set()
+
+    def refresh_count(self) -> int:
+        count = 0
+        with self.engine_factory().connect() as conn:
+            schemas = [
+                row[0] for row in conn.execute(text(
+                    "SELECT table_schema FROM information_schema.tables WHERE table_name = 'timers_archivo'"
+                ))
+            ]
+            for schema in schemas:
+                if _SCHEMA_RE.match(schema):
+                    count += conn.execute(text(f"SELECT COUNT(*) FROM {schema}.timers_archivo")).scalar() or 0
+                    self.ensured_schemas.add(schema)
+        self.archived = count
+        return count
+
+    def write(self, records: List[Dict[str, Any]]):
+        by_tenant: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_tenant.setdefault(record.get("tenant") or self.default_tenant, []).append(
+                PostgresTimerStore._to_row(record)
+            )
+        created = set()
+        with self.engine_factory().begin() as conn:
+            for tenant, rows in by_tenant.items():
+                schema = _safe_schema(tenant)
+                if schema not in self.ensured_schemas:
+                    conn.execute(text(_CREATE_ARCHIVE_SQL.format(schema=schema)))
+                    conn.execute(text(_CREATE_ARCHIVE_INDEX_SQL.format(schema=schema)))
+                    created.add(schema)
+                conn.execute(text(_INSERT_ARCHIVE_SQL.format(schema=schema)), rows)
+        self.ensured_schemas.update(created)
+        if self.archived is not None:
+            self.archived += len(records)
+
+    def archive_stored(self, engine_factory: Callable, ttl_seconds: int) -> int:
+        """Mover al archivo los completados de la tabla `timers` con más de `ttl_seconds` desde
+        su fechaFin, por lotes y en SQL (DELETE ... RETURNING dentro de un INSERT ... SELECT),
+        sin cargarlos en memoria."""
+        moved = 0
+        with engine_factory().connect() as conn:
+            schemas = _stored_schemas(conn)
+        for schema in schemas:
+            while True:
+                with engine_factory().begin() as conn:
+                    if schema not in self.ensured_schemas:
+                        conn.execute(text(_CREATE_ARCHIVE_SQL.format(schema=schema)))
+                        conn.execute(text(_CREATE_ARCHIVE_INDEX_SQL.format(schema=schema)))
+                    borrados, archivados = conn.execute(
+                        text(_MOVE_STORED_SQL.format(schema=schema)),
+                        {"ttl": ttl_seconds, "limite": TIMER_ARCHIVE_STORED_BATCH},
+                    ).one()
+                self.ensured_schemas.add(schema)
+                moved += borrados
+                if self.archived is not None:
+                    self.archived += archivados
+                if borrados < TIMER_ARCHIVE_STORED_BATCH:
+                    break
+        return moved
+
+    def query(
+        self,
+        tenant: Optional[str] = None,
+        rfid: Optional[str] = None,
+        inventario_id: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Timers archivados del tenant que cumplen los filtros, los más recientes primero."""
+        schema = _safe_schema(tenant or self.default_tenant)
+        conditions = []
+        params: Dict[str, Any] = {"limit": limit}
+        if rfid is not None:
+            conditions.append("rfid = :rfid")
+            params["rfid"] = rfid
+        if inventario_id is not None:
+            conditions.append("inventario_id = :inventario_id")
+            params["inventario_id"] = inventario_id
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.engine_factory().connect() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM information_schema.tables WHERE table_schema = :schema AND table_name = 'timers_archivo'"),
+                {"schema": schema},
+            ).first()
+            if exists is None:
+                return []
+            rows = conn.execute(
+                text(f"SELECT datos FROM {schema}.timers_archivo {where} ORDER BY fecha_fin DESC LIMIT :limit"),
+                params,
+            ).fetchall()
+        records = []
+        for row in rows:
+            datos = row[0]
+            records.append(json.loads(datos) if isinstance(datos, str) else dict(datos))
+        return records
+
+
+def build_timer_archive(persistence: str, engine_factory: Callable, default_tenant: Optional[str] = None):
+    """Archivo según TIMER_ARCHIVE (o, si no se configura, según el backend de persistencia)."""
+    backend = TIMER_ARCHIVE or ("postgres" if persistence == "postgres" else "file")
+    if backend == "postgres":
+        return PostgresTimerArchive(engine_factory, default_tenant)
+    return FileTimerArchive()
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cadencia de reporte del tiempo restante en el tick: bandas "umbral:intervalo" (segundos).
+# Con más de `umbral` segundos restantes el timer se reporta cada `intervalo` segundos; por
+# defecto cada 60 s por encima de una hora, cada 10 s por encima de un minuto y cada segundo
+# en el último minuto. "0:1" equivale al comportamiento anterior (todos los segundos).
+TIMER_CADENCE = os.getenv("TIMER_CADENCE", "3600:60,60:10,0:1")
+# Bandas propias por tenant, en JSON: {"tenant_x": "600:30,0:1"}
+TIMER_CADENCE_TENANTS = os.getenv("TIMER_CADENCE_TENANTS", "")
+
+Bands = List[Tuple[int, int]]
+
+
+def parse_cadence(spec: str) -> Bands:
+    """Parsear "umbral:intervalo,..." a bandas ordenadas de mayor a menor umbral."""
+    bands = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        threshold, interval = part.split(":")
+        threshold, interval = int(threshold), int(interval)
+        if threshold < 0 or interval < 1:
+            raise ValueError(f"Banda de cadencia inválida: {part!r}")
+        bands.append((threshold, interval))
+    bands.sort(reverse=True)
+    return bands
+
+
+class CadencePolicy:
+    """Decide cada cuánto se reporta el tiempo restante de un timer en el tick.
+
+    La completación no depende de la cadencia: sale del planificador en el tick en que
+    vence, así que el frame de completación se envía a tiempo aunque el timer solo se
+    reportara cada minuto.
+    """
+
+    def __init__(self, default_spec: Optional[str] = None, tenant_specs: Optional[Dict[str, str]] = None):
+        self.default = self._parse_or_default(default_spec if default_spec is not None else TIMER_CADENCE, "0:1")
+        self.tenants: Dict[str, Bands] = {}
+        if tenant_specs is None:
+            tenant_specs = self._tenant_specs_from_env()
+        for tenant, spec in tenant_specs.items():
+            self.tenants[tenant] = self._parse_or_default(spec, None) or self.default
+
+    @staticmethod
+    def _parse_or_default(spec: str, fallback: Optional[str]) -> Optional[Bands]:
+        try:
+            return parse_cadence(spec)
+        except ValueError as e:
+            logger.warning(f"Cadencia de timers inválida ({spec!r}): {e}; se usa {fallback or 'la cadencia por defecto'}")
+            return parse_cadence(fallback) if fallback else None
+
+    @staticmethod
+    def _tenant_specs_from_env() -> Dict[str, str]:
+        if not TIMER_CADENCE_TENANTS.strip():
+            return {}
+        try:
+            specs = json.loads(TIMER_CADENCE_TENANTS)
+        except ValueError as e:
+            logger.warning(f"TIMER_CADENCE_TENANTS no es JSON válido: {e}")
+            return {}
+        return {str(tenant): str(spec) for tenant, spec in specs.items()}
+
+    def interval(self, remaining: int, tenant: Optional[str] = None) -> int:
+        """Intervalo de reporte (segundos) para un timer con `remaining` segundos restantes."""
+        for threshold, interval in self.tenants.get(tenant, self.default):
+            if remaining > threshold:
+                return interval
+        return 1
+
+    def should_report(self, last_reported: Optional[int], remaining: int, tenant: Optional[str] = None) -> bool:
+        """True si toca reportar `remaining` dado el último valor reportado del timer."""
+        if last_reported is None or remaining >= last_reported:
+            # Primer reporte, o el tiempo restante subió (reanudación / cambio de fechaFin)
+            return last_reported != remaining
+        return last_reported - remaining >= self.interval(remaining, tenant)
+
+    def describe(self) -> Dict[str, str]:
+        def fmt(bands: Bands) -> str:
+            return ",".join(f"{t}:{i}" for t, i in bands)
+        return {"default": fmt(self.default), **{tenant: fmt(b) for tenant, b in self.tenants.items()}}
@@ -0,0 +1,45 @@
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# Número de cambios recientes que se conservan para reanudar clientes con "since_seq"
+TIMER_CHANGELOG_SIZE = int(os.getenv("TIMER_CHANGELOG_SIZE", "4096"))
+
+
+class TimerChangeLog:
+    """Registro acotado (ring buffer) de los cambios de estado de timers.
+
+    Cada mutación recibe un número de secuencia monótono que viaja en el frame como `seq`.
+    Un cliente que se reconecta envía el último `seq` que vio junto con el `epoch` de la
+    instancia; si el hueco sigue en el buffer recibe solo los cambios de su tenant que se
+    perdió, y si no (hueco demasiado antiguo, reinicio u otra instancia) un TIMER_SYNC completo.
+    """
+
+    def __init__(self, epoch: str, size: Optional[int] = None):
+        self.epoch = epoch
+        self.seq = 0
+        # Último seq descartado del buffer: no se puede reanudar desde un seq anterior
+        self.floor = 0
+        self.entries: deque = deque(maxlen=size or TIMER_CHANGELOG_SIZE)
+
+    def record(self, tenant: str, message: Dict[str, Any]) -> int:
+        """Asignar el siguiente seq a `message` (lo marca en el propio mensaje) y guardarlo."""
+        self.seq += 1
+        message["seq"] = self.seq
+        if len(self.entries) == self.entries.maxlen:
+            self.floor = self.entries[0][0]
+        self.entries.append((self.seq, tenant, message))
+        return self.seq
+
+    def invalidate(self):
+        """Olvidar el historial (p. ej. tras reemplazar el estado completo con un snapshot)."""
+        self.entries.clear()
+        self.floor = self.seq
+
+    def since(self, seq: Any, tenant: str, epoch: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Cambios de `tenant` posteriores a `seq`, o None si hace falta un snapshot completo."""
+        if epoch != self.epoch or not isinstance(seq, int) or isinstance(seq, bool):
+            return None
+        if seq < self.floor or seq > self.seq:
+            return None
+        return [message for entry_seq, entry_tenant, message in self.entries if entry_seq > seq and entry_tenant == tenant]
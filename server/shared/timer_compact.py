@@ -0,0 +1,152 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Union
+
+_FIELDS = (
+    "id", "nombre", "tipoOperacion", "tiempoInicialMinutos", "tiempoRestanteSegundos",
+    "inicio_ms", "fin_ms", "activo", "completado", "tenant", "rfid", "inventario_id", "version", "miembros",
+)
+
+
+def to_epoch_ms(value: Union[int, float, str, datetime]) -> int:
+    """Convertir una fecha (datetime, ISO o epoch ms) a milisegundos de época UTC."""
+    if isinstance(value, bool):
+        raise TypeError("Fecha inválida")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+@lru_cache(maxsize=4096)
+def iso_from_ms(ms: int) -> str:
+    """ISO 8601 en UTC de un epoch ms (los timers de un mismo lote comparten fechas: se cachea)."""
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat()
+
+
+class CompactTimer:
+    """Timer en memoria como registro con `__slots__` y fechas en epoch ms (enteros).
+
+    Misma interfaz que el modelo Pydantic `Timer` que usa el TimerManager (atributos,
+    `fechaInicio` / `fechaFin` como datetime, `to_dict()`), pero sin validación por instancia
+    ni dos datetime con zona horaria por timer: la validación se hace una vez en la API y los
+    registros internos (store, MQ, fusión entre instancias) se construyen directamente.
+    """
+
+    __slots__ = _FIELDS
+
+    def __init__(
+        self,
+        id: str,
+        nombre: str,
+        tipoOperacion: str,
+        tiempoInicialMinutos: int,
+        tiempoRestanteSegundos: int,
+        inicio_ms: int,
+        fin_ms: int,
+        activo: bool = True,
+        completado: bool = False,
+        tenant: Optional[str] = None,
+        rfid: Optional[str] = None,
+        inventario_id: Optional[int] = None,
+        version: int = 0,
+        miembros: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.id = id
+        self.nombre = nombre
+        self.tipoOperacion = tipoOperacion
+        self.tiempoInicialMinutos = tiempoInicialMinutos
+        self.tiempoRestanteSegundos = tiempoRestanteSegundos
+        self.inicio_ms = inicio_ms
+        self.fin_ms = fin_ms
+        self.activo = activo
+        self.completado = completado
+        self.tenant = tenant
+        self.rfid = rfid
+        self.inventario_id = inventario_id
+        self.version = version
+        self.miembros = miembros
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompactTimer":
+        """Construir desde un registro interno (to_dict del propio timer); ignora campos extra."""
+        return cls(
+            data["id"],
+            data["nombre"],
+            data["tipoOperacion"],
+            int(data["tiempoInicialMinutos"]),
+            int(data["tiempoRestanteSegundos"]),
+            to_epoch_ms(data["fechaInicio"]),
+            to_epoch_ms(data["fechaFin"]),
+            bool(data.get("activo", True)),
+            bool(data.get("completado", False)),
+            data.get("tenant"),
+            data.get("rfid"),
+            data.get("inventario_id"),
+            data.get("version") or 0,
+            data.get("miembros"),
+        )
+
+    @classmethod
+    def from_model(cls, timer: Any) -> "CompactTimer":
+        """Construir desde un modelo Pydantic ya validado."""
+        return cls(
+            timer.id,
+            timer.nombre,
+            timer.tipoOperacion,
+            timer.tiempoInicialMinutos,
+            timer.tiempoRestanteSegundos,
+            to_epoch_ms(timer.fechaInicio),
+            to_epoch_ms(timer.fechaFin),
+            timer.activo,
+            timer.completado,
+            timer.tenant,
+            timer.rfid,
+            timer.inventario_id,
+            getattr(timer, "version", 0),
+            getattr(timer, "miembros", None),
+        )
+
+    # Compatibilidad con el código que trabaja con datetime (pausa, reanudación, planificador)
+    @property
+    def fechaInicio(self) -> datetime:
+        return datetime.fromtimestamp(self.inicio_ms / 1000, timezone.utc)
+
+    @fechaInicio.setter
+    def fechaInicio(self, value):
+        self.inicio_ms = to_epoch_ms(value)
+
+    @property
+    def fechaFin(self) -> datetime:
+        return datetime.fromtimestamp(self.fin_ms / 1000, timezone.utc)
+
+    @fechaFin.setter
+    def fechaFin(self, value):
+        self.fin_ms = to_epoch_ms(value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable (fechas en ISO), idéntica a la del modelo Pydantic."""
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "tipoOperacion": self.tipoOperacion,
+            "tiempoInicialMinutos": self.tiempoInicialMinutos,
+            "tiempoRestanteSegundos": self.tiempoRestanteSegundos,
+            "fechaInicio": iso_from_ms(self.inicio_ms),
+            "fechaFin": iso_from_ms(self.fin_ms),
+            "activo": self.activo,
+            "completado": self.completado,
+            "tenant": self.tenant,
+            "rfid": self.rfid,
+            "inventario_id": self.inventario_id,
+            "version": self.version,
+            **({"miembros": self.miembros} if self.miembros is not None else {}),
+        }
+
+    def __repr__(self) -> str:
+        return f"CompactTimer(id={self.id!r}, fin_ms={self.fin_ms}, activo={self.activo}, completado={self.completado})"
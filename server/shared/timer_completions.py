@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Publicar timer_completed desde el tick (lo consume alerts_service)
+TIMER_COMPLETED_PUBLISH = os.getenv("TIMER_COMPLETED_PUBLISH", "true").strip().lower() in ("1", "true", "yes", "y")
+# Completaciones recordadas para no publicar dos veces la misma (y máximo de pendientes sin publicar)
+TIMER_COMPLETED_DEDUP_SIZE = int(os.getenv("TIMER_COMPLETED_DEDUP_SIZE", "10000"))
+# Micro-lotes del consumidor: máximo de eventos por lote y espera máxima para completar uno
+TIMER_COMPLETED_BATCH_SIZE = int(os.getenv("TIMER_COMPLETED_BATCH_SIZE", "100"))
+TIMER_COMPLETED_BATCH_WAIT_MS = int(os.getenv("TIMER_COMPLETED_BATCH_WAIT_MS", "200"))
+
+
+def completion_key(timer: Dict[str, Any]) -> Tuple[Any, Any]:
+    """Identidad de una completación: el timer y su fechaFin (un timer reiniciado vuelve a completarse)."""
+    return timer.get("id"), timer.get("fechaFin")
+
+
+def expand_completion(timer: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Un timer de grupo completa a todos sus miembros: un registro por TIC con los datos del grupo."""
+    miembros = timer.get("miembros")
+    if not miembros:
+        return [timer]
+    base = {k: v for k, v in timer.items() if k != "miembros"}
+    return [{**base, **member, "grupo_id": timer.get("id")} for member in miembros]
+
+
+class TimerCompletionPublisher:
+    """Publica en la cola timer_completed las completaciones del tick, sin duplicados.
+
+    `add` se llama desde el tick (solo el dueño del timer lo completa) y descarta las
+    completaciones ya vistas; `flush` publica las pendientes fuera del tick. Si RabbitMQ
+    falla, las pendientes se conservan (hasta TIMER_COMPLETED_DEDUP_SIZE) y se reintentan en
+    el siguiente flush.
+    """
+
+    def __init__(self, publish: Callable[[Dict[str, Any]], Awaitable[Any]], dedup_size: Optional[int] = None):
+        self.publish = publish
+        self.dedup_size = dedup_size or TIMER_COMPLETED_DEDUP_SIZE
+        self._seen: "OrderedDict[Tuple[Any, Any], None]" = OrderedDict()
+        self.pending: List[Dict[str, Any]] = []
+        self._flushing = False
+        self.published = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def add(self, timer: Dict[str, Any]) -> bool:
+        key = completion_key(timer)
+        if key in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+        self.pending.append(timer)
+        if len(self.pending) > self.dedup_size:
+            self.pending.pop(0)
+            self.dropped += 1
+        return True
+
+    def schedule_flush(self):
+        """Lanzar el flush en segundo plano (el tick no espera a RabbitMQ)."""
+        if self.pending and not self._flushing:
+            asyncio.create_task(self.flush())
+
+    async def flush(self):
+        if self._flushing:
+            return
+        self._flushing = True
+        try:
+            while self.pending:
+                timer = self.pending[0]
+                try:
+                    await self.publish(timer)
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"No se pudo publicar timer_completed ({len(self.pending)} pendientes): {e}")
+                    return
+                self.pending.pop(0)
+                self.published += 1
+        finally:
+            self._flushing = False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "published": self.published,
+            "pending": len(self.pending),
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+class MicroBatcher:
+    """Agrupa los mensajes de un consumidor en lotes de hasta `max_size` o `max_wait_ms`.
+
+    Cada `submit` espera a que su lote se procese, de modo que el mensaje se confirma en la
+    cola solo después de `handler`. `handler` puede devolver las posiciones del lote que
+    fallaron (índice -> excepción): solo esos `submit` fallan y el resto se confirma. Los
+    mensajes en vuelo están acotados por el prefetch del canal, así que conviene un prefetch
+    al menos igual a `max_size`.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], Awaitable[Optional[Dict[int, BaseException]]]],
+                 max_size: Optional[int] = None, max_wait_ms: Optional[int] = None):
+        self.handler = handler
+        self.max_size = max_size or TIMER_COMPLETED_BATCH_SIZE
+        self.max_wait = (TIMER_COMPLETED_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._items: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item: Any):
+        loop = asyncio.get_running_loop()
+        if not self._items:
+            self._timer = loop.call_later(self.max_wait, self._flush_soon)
+        done = loop.create_future()
+        self._items.append((item, done))
+        if len(self._items) >= self.max_size:
+            self._flush_soon()
+        await asyncio.shield(done)
+
+    def _flush_soon(self):
+        if not self._items:
+            return
+        batch, self._items = self._items, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            failed = await self.handler([item for item, _ in batch]) or {}
+        except Exception as e:
+            failed = dict.fromkeys(range(len(batch)), e)
+        for i, (_, done) in enumerate(batch):
+            if i in failed:
+                done.set_exception(failed[i])
+            else:
+                done.set_result(None)
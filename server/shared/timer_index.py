@@ -0,0 +1,162 @@
+import base64
+import heapq
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Campos con índice secundario (nombre del filtro en la API -> valor derivado del timer);
+# "miembro" relaciona el id de cada miembro de un timer de grupo con el grupo
+INDEXED_FIELDS = ("rfid", "inventario_id", "tipo", "tenant", "estado", "miembro")
+ESTADOS = ("activo", "pausado", "completado")
+
+
+def timer_estado(timer: Any) -> str:
+    """Estado de completación de un timer: "completado", "activo" (corriendo) o "pausado"."""
+    if timer.completado:
+        return "completado"
+    return "activo" if timer.activo else "pausado"
+
+
+def encode_cursor(timer_id: str) -> str:
+    """Cursor opaco de paginación (el último id de la página; el orden es por id)."""
+    return base64.urlsafe_b64encode(timer_id.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """Id codificado en un cursor; ValueError si el cursor no es válido."""
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {cursor!r}") from e
+
+
+class IndexedTimers(dict):
+    """Diccionario id -> timer que mantiene índices secundarios por rfid, inventario_id,
+    tipoOperacion, tenant y estado de completación.
+
+    Las altas, bajas y sustituciones (`timers[id] = t`, `pop`, `del`, `update`, `clear`) se
+    indexan solas. Los cambios de atributos de un timer ya guardado (pausa, completación,
+    actualización remota) deben avisarse con `reindex(timer)`. El rfid indexado es
+    `timer.rfid` o, en los timers que no lo tienen, `timer.nombre` (el frontend nombra los
+    timers con el RFID). Un timer de grupo se indexa por los rfid / inventario_id de todos
+    sus miembros, de modo que las búsquedas por TIC devuelven el grupo.
+    """
+
+    def __init__(self, tenant_of: Callable[[Any], str], data: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self._tenant_of = tenant_of
+        self._keys: Dict[str, Tuple[Tuple[Any, ...], ...]] = {}
+        self._index: Dict[str, Dict[Any, Set[str]]] = {field: {} for field in INDEXED_FIELDS}
+        if data:
+            self.update(data)
+
+    # ---- Mantenimiento ----
+
+    def _keys_of(self, timer: Any) -> Tuple[Tuple[Any, ...], ...]:
+        miembros = getattr(timer, "miembros", None)
+        if miembros:
+            rfids = tuple(m.get("rfid") or m.get("nombre") for m in miembros)
+            inventario_ids = tuple(m.get("inventario_id") for m in miembros)
+            member_ids = tuple(m.get("id") for m in miembros)
+        else:
+            rfids, inventario_ids, member_ids = (timer.rfid or timer.nombre,), (timer.inventario_id,), ()
+        return (
+            rfids,
+            inventario_ids,
+            (timer.tipoOperacion,),
+            (self._tenant_of(timer),),
+            (timer_estado(timer),),
+            member_ids,
+        )
+
+    def _unindex(self, timer_id: str):
+        keys = self._keys.pop(timer_id, None)
+        if keys is None:
+            return
+        for field, values in zip(INDEXED_FIELDS, keys):
+            for key in values:
+                bucket = self._index[field].get(key)
+                if bucket is None:
+                    continue
+                bucket.discard(timer_id)
+                if not bucket:
+                    del self._index[field][key]
+
+    def _index_one(self, timer_id: str, timer: Any):
+        keys = self._keys_of(timer)
+        if self._keys.get(timer_id) == keys:
+            return
+        self._unindex(timer_id)
+        self._keys[timer_id] = keys
+        for field, values in zip(INDEXED_FIELDS, keys):
+            for key in values:
+                if key is not None:
+                    self._index[field].setdefault(key, set()).add(timer_id)
+
+    def reindex(self, timer: Any):
+        """Actualizar los índices de un timer guardado tras modificar sus atributos."""
+        if dict.get(self, timer.id) is timer:
+            self._index_one(timer.id, timer)
+
+    def __setitem__(self, timer_id: str, timer: Any):
+        super().__setitem__(timer_id, timer)
+        self._index_one(timer_id, timer)
+
+    def __delitem__(self, timer_id: str):
+        super().__delitem__(timer_id)
+        self._unindex(timer_id)
+
+    def pop(self, timer_id: str, *default: Any) -> Any:
+        if timer_id in self:
+            self._unindex(timer_id)
+        return super().pop(timer_id, *default)
+
+    def update(self, *args: Any, **kwargs: Any):
+        for timer_id, timer in dict(*args, **kwargs).items():
+            self[timer_id] = timer
+
+    def clear(self):
+        super().clear()
+        self._keys.clear()
+        for field in INDEXED_FIELDS:
+            self._index[field].clear()
+
+    # ---- Consulta ----
+
+    def group_of(self, member_id: str) -> Optional[str]:
+        """Id del timer de grupo que contiene al miembro `member_id` (None si no es miembro de ninguno)."""
+        bucket = self._index["miembro"].get(member_id)
+        return next(iter(bucket)) if bucket else None
+
+    def ids_matching(self, **filters: Any) -> Iterable[str]:
+        """Ids que cumplen todos los filtros no nulos (rfid=, inventario_id=, tipo=, tenant=, estado=)."""
+        buckets: List[Set[str]] = []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if field not in self._index:
+                raise ValueError(f"Filtro no indexado: {field}")
+            bucket = self._index[field].get(value)
+            if not bucket:
+                return set()
+            buckets.append(bucket)
+        if not buckets:
+            return self.keys()
+        # Intersección partiendo del índice más selectivo
+        buckets.sort(key=len)
+        first, rest = buckets[0], buckets[1:]
+        if not rest:
+            return first
+        return {timer_id for timer_id in first if all(timer_id in bucket for bucket in rest)}
+
+    def page(self, limit: int, after: Optional[str] = None, **filters: Any) -> Tuple[List[Any], Optional[str], int]:
+        """Página de timers ordenada por id a partir del id `after` (exclusivo).
+
+        Devuelve (timers, último id de la página si hay más resultados, total que cumple los filtros).
+        """
+        ids = self.ids_matching(**filters)
+        candidates = ids if after is None else (timer_id for timer_id in ids if timer_id > after)
+        page_ids = heapq.nsmallest(limit + 1, candidates)
+        next_after = page_ids[limit - 1] if len(page_ids) > limit else None
+        return [dict.__getitem__(self, timer_id) for timer_id in page_ids[:limit]], next_after, len(ids)
+
+    def stats(self) -> Dict[str, int]:
+        return {field: len(values) for field, values in self._index.items()}
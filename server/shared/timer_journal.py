@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Intervalo de agrupación de escrituras (un fsync por lote)
+TIMER_JOURNAL_FLUSH_MS = int(os.getenv("TIMER_JOURNAL_FLUSH_MS", "200"))
+# Compactación periódica del diario en el snapshot
+TIMER_JOURNAL_COMPACT_SECONDS = int(os.getenv("TIMER_JOURNAL_COMPACT_SECONDS", "300"))
+TIMER_JOURNAL_COMPACT_RECORDS = int(os.getenv("TIMER_JOURNAL_COMPACT_RECORDS", "5000"))
+
+
+class TimerJournal:
+    """Persistencia de timers como snapshot + diario de cambios de solo anexado.
+
+    Cada cambio se registra en memoria en O(1) y una tarea en segundo plano lo anexa
+    al diario en lotes con un único fsync (en un hilo, sin bloquear el event loop).
+    Periódicamente el estado completo se compacta en el snapshot y el diario se vacía.
+    Al arrancar se lee el snapshot y se reaplica el diario encima.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        journal_path: str,
+        snapshot_provider: Optional[Callable[[], Dict[str, Dict[str, Any]]]] = None,
+    ):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.snapshot_provider = snapshot_provider
+        self.pending: List[str] = []
+        self.journal_records = 0
+        self.last_compaction = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self._lock = asyncio.Lock()
+
+    # ---- Carga ----
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Reconstruir el estado: snapshot + reaplicación del diario."""
+        state: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r") as f:
+                    state = json.load(f) or {}
+            except Exception as e:
+                logger.error(f"Error leyendo snapshot de timers {self.snapshot_path}: {e}")
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Última línea truncada por una caída: se ignora
+                        logger.warning("Registro de diario de timers incompleto ignorado")
+                        continue
+                    self._apply(state, record)
+                    replayed += 1
+        self.journal_records = replayed
+        logger.info(f"Timers cargados: {len(state)} (snapshot + {replayed} registros de diario)")
+        return state
+
+    @staticmethod
+    def _apply(state: Dict[str, Dict[str, Any]], record: Dict[str, Any]):
+        op = record.get("op")
+        if op == "put" and record.get("timer"):
+            state[record["timer"]["id"]] = record["timer"]
+        elif op == "del":
+            state.pop(record.get("id"), None)
+
+    # ---- Registro de cambios (O(1), sin E/S) ----
+
+    def record_put(self, timer_dict: Dict[str, Any]):
+        self._append({"op": "put", "timer": timer_dict})
+
+    def record_delete(self, timer_id: str, tenant: Optional[str] = None, version: int = 0):
+        self._append({"op": "del", "id": timer_id})
+
+    def _append(self, record: Dict[str, Any]):
+        self.pending.append(json.dumps(record, default=str, separators=(",", ":")))
+        self._ensure_task()
+
+    # ---- Escritura en segundo plano ----
+
+    def _ensure_task(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sin event loop (import/arranque): los cambios quedan pendientes hasta start()
+            return
+        self._running = True
+        self._task = loop.create_task(self._run())
+
+    def start(self):
+        self._ensure_task()
+
+    async def _run(self):
+        while self._running:
+            try:
+                await asyncio.sleep(TIMER_JOURNAL_FLUSH_MS / 1000)
+                await self.flush()
+                if self._should_compact():
+                    await self.compact()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en diario de timers: {e}")
+
+    def _should_compact(self) -> bool:
+        if self.snapshot_provider is None or self.journal_records == 0:
+            return False
+        return (
+            self.journal_records >= TIMER_JOURNAL_COMPACT_RECORDS
+            or time.monotonic() - self.last_compaction >= TIMER_JOURNAL_COMPACT_SECONDS
+        )
+
+    async def flush(self):
+        """Anexar los cambios pendientes al diario con un único fsync."""
+        async with self._lock:
+            if not self.pending:
+                return
+            lines, self.pending = self.pending, []
+            await asyncio.to_thread(self._write_lines, lines)
+            self.journal_records += len(lines)
+
+    def _write_lines(self, lines: List[str]):
+        with open(self.journal_path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def compact(self):
+        """Escribir el estado actual como snapshot y vaciar el diario.
+
+        El estado se captura en el event loop justo después de vaciar los pendientes, de
+        modo que el snapshot incluye todo lo que había en el diario; los cambios que
+        lleguen mientras se escribe quedan pendientes y van al diario nuevo.
+        """
+        await self.flush()
+        async with self._lock:
+            state = self.snapshot_provider()
+            await asyncio.to_thread(self._write_snapshot, state)
+            self.journal_records = 0
+            self.last_compaction = time.monotonic()
+        logger.info(f"Diario de timers compactado: {len(state)} timers en {self.snapshot_path}")
+
+    def _write_snapshot(self, state: Dict[str, Dict[str, Any]]):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, default=str, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # El snapshot ya contiene todo lo registrado: se trunca el diario
+        with open(self.journal_path, "w") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def stop(self):
+        """Detener la tarea y persistir lo pendiente (apagado ordenado)."""
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self.flush()
@@ -0,0 +1,180 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Reparto de timers entre instancias por hashing consistente del id
+TIMER_SHARDING = os.getenv("TIMER_SHARDING", "true").strip().lower() in ("1", "true", "yes", "y")
+# Exchange fanout de latidos de las instancias que gestionan timers
+TIMER_MEMBERSHIP_EXCHANGE = os.getenv("TIMER_MEMBERSHIP_EXCHANGE", "timers.membership")
+TIMER_MEMBERSHIP_HEARTBEAT_SECONDS = float(os.getenv("TIMER_MEMBERSHIP_HEARTBEAT_SECONDS", "2"))
+# Una instancia sin latidos durante este tiempo se considera caída y sus timers se reparten
+TIMER_MEMBERSHIP_TIMEOUT_SECONDS = float(os.getenv("TIMER_MEMBERSHIP_TIMEOUT_SECONDS", "7"))
+# Puntos virtuales por instancia en el anillo (reparto más uniforme)
+TIMER_RING_VNODES = int(os.getenv("TIMER_RING_VNODES", "64"))
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Anillo de hashing consistente: al entrar o salir una instancia solo se mueven sus timers."""
+
+    def __init__(self, members: Iterable[str] = (), vnodes: Optional[int] = None):
+        self.vnodes = vnodes or TIMER_RING_VNODES
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.members = sorted(set(members))
+        points = sorted(
+            (_hash(f"{member}#{i}"), member) for member in self.members for i in range(self.vnodes)
+        )
+        self._points = [p for p, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[idx]
+
+
+class ClusterMembership:
+    """Pertenencia de instancias mediante latidos sobre un exchange fanout de RabbitMQ.
+
+    Cada instancia publica un latido periódico y mantiene la lista de instancias vivas; con
+    ella construye un `HashRing` que decide qué instancia es dueña de cada timer. Cuando una
+    instancia entra, sale o deja de latir se invoca `on_change` para que el dueño recalcule
+    sus timers. Hasta recibir el primer ciclo de latidos la instancia no se declara dueña de
+    nada (evita completar timers que ya tiene otra instancia). Si el reparto está desactivado
+    o no hay broker, la instancia es dueña de todos los timers.
+    """
+
+    def __init__(
+        self,
+        instance_id: str,
+        message_queue,
+        on_change: Optional[Callable[[], Awaitable[None]]] = None,
+        role: str = "",
+    ):
+        self.instance_id = instance_id
+        self.message_queue = message_queue
+        self.on_change = on_change
+        self.role = role
+        self.enabled = False
+        self.ready = False
+        self.last_seen: Dict[str, float] = {}
+        self.ring = HashRing([instance_id])
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- Consulta ----
+
+    def owns(self, timer_id: str) -> bool:
+        if not self.enabled:
+            return True
+        if not self.ready:
+            return False
+        return self.ring.owner(timer_id) == self.instance_id
+
+    @property
+    def members(self) -> List[str]:
+        return self.ring.members
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sharding": self.enabled,
+            "ready": self.ready,
+            "instance_id": self.instance_id,
+            "members": self.members,
+        }
+
+    # ---- Ciclo de vida ----
+
+    async def start(self):
+        """Suscribirse a los latidos y empezar a publicar los propios (requiere MQ conectado)."""
+        if not TIMER_SHARDING:
+            return
+        await self.message_queue.consume_fanout(TIMER_MEMBERSHIP_EXCHANGE, self._on_message)
+        self.enabled = True
+        self.last_seen[self.instance_id] = time.monotonic()
+        # Soltar los timers cargados al arrancar hasta conocer a las demás instancias
+        if self.on_change is not None:
+            await self.on_change()
+        await self._publish("JOIN")
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Reparto de timers por hashing consistente activo (instancia {self.instance_id})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.enabled:
+            try:
+                await self._publish("LEAVE")
+            except Exception:
+                pass
+
+    async def _publish(self, event: str):
+        await self.message_queue.publish_fanout(TIMER_MEMBERSHIP_EXCHANGE, {
+            "event": event,
+            "instance": self.instance_id,
+            "role": self.role,
+        }, persistent=False)
+
+    async def _run(self):
+        # Primer ciclo completo de latidos antes de reclamar timers
+        await asyncio.sleep(TIMER_MEMBERSHIP_HEARTBEAT_SECONDS)
+        self.ready = True
+        await self._rebuild(force=True)
+        while True:
+            try:
+                self.last_seen[self.instance_id] = time.monotonic()
+                await self._publish("HEARTBEAT")
+                limit = time.monotonic() - TIMER_MEMBERSHIP_TIMEOUT_SECONDS
+                dead = [m for m, seen in self.last_seen.items() if seen < limit and m != self.instance_id]
+                for member in dead:
+                    logger.warning(f"Instancia de timers sin latidos, se reparten sus timers: {member}")
+                    self.last_seen.pop(member, None)
+                if dead:
+                    await self._rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en latidos de timers: {e}")
+            await asyncio.sleep(TIMER_MEMBERSHIP_HEARTBEAT_SECONDS)
+
+    async def _on_message(self, msg: Dict[str, Any]):
+        member = msg.get("instance")
+        if not member or member == self.instance_id:
+            return
+        event = msg.get("event")
+        if event == "LEAVE":
+            if self.last_seen.pop(member, None) is not None:
+                await self._rebuild()
+            return
+        known = member in self.last_seen
+        self.last_seen[member] = time.monotonic()
+        if not known:
+            if event == "JOIN":
+                # Responder al recién llegado para que nos conozca sin esperar al siguiente latido
+                await self._publish("HEARTBEAT")
+            await self._rebuild()
+
+    async def _rebuild(self, force: bool = False):
+        members = sorted(self.last_seen)
+        if not force and members == self.ring.members:
+            return
+        self.ring = HashRing(members)
+        if not self.ready:
+            return
+        logger.info(f"Miembros de timers: {len(members)} instancias")
+        if self.on_change is not None:
+            try:
+                await self.on_change()
+            except Exception as e:
+                logger.error(f"Error reasignando timers: {e}")
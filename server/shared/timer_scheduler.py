@@ -0,0 +1,76 @@
+import heapq
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class CompletionScheduler:
+    """Planificador de completación de timers basado en un min-heap sobre fechaFin.
+
+    Solo contiene timers activos. Reprogramar o cancelar un timer no toca el heap:
+    la entrada antigua queda obsoleta y se ignora al extraerla (invalidación perezosa),
+    de modo que cada evento cuesta O(log n) y el tick no recorre timers completados.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._deadlines: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, timer_id: str) -> bool:
+        return timer_id in self._deadlines
+
+    def schedule(self, timer_id: str, fecha_fin: datetime):
+        """Programar (o reprogramar) la completación de un timer."""
+        deadline = fecha_fin.timestamp()
+        if self._deadlines.get(timer_id) == deadline:
+            return
+        self._deadlines[timer_id] = deadline
+        heapq.heappush(self._heap, (deadline, timer_id))
+        self._maybe_compact()
+
+    def cancel(self, timer_id: str):
+        """Quitar un timer del planificador (pausado, completado o eliminado)."""
+        self._deadlines.pop(timer_id, None)
+
+    def sync(self, timer_id: str, fecha_fin: datetime, activo: bool, completado: bool):
+        """Alinear el planificador con el estado actual de un timer."""
+        if activo and not completado:
+            self.schedule(timer_id, fecha_fin)
+        else:
+            self.cancel(timer_id)
+
+    def rebuild(self, timers: Iterable):
+        """Reconstruir desde cero a partir de un conjunto de timers (carga o snapshot)."""
+        self._deadlines = {
+            t.id: t.fechaFin.timestamp() for t in timers if t.activo and not t.completado
+        }
+        self._heap = [(deadline, tid) for tid, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def pop_due(self, now: datetime) -> List[str]:
+        """Extraer los timers cuya fechaFin ya pasó."""
+        now_ts = now.timestamp()
+        due = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            deadline, timer_id = heapq.heappop(self._heap)
+            if self._deadlines.get(timer_id) == deadline:
+                del self._deadlines[timer_id]
+                due.append(timer_id)
+        return due
+
+    def next_deadline(self) -> Optional[float]:
+        """Epoch (segundos) de la próxima completación válida, o None."""
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def active_ids(self) -> List[str]:
+        return list(self._deadlines)
+
+    def _maybe_compact(self):
+        # Evitar que las entradas obsoletas crezcan sin límite tras muchas reprogramaciones
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._deadlines):
+            self._heap = [(d, tid) for tid, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
@@ -0,0 +1,122 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+# Operaciones por lote del protocolo de timers (mensaje WS -> acción)
+BATCH_ACTIONS = {
+    "PAUSE_TIMERS_BATCH": "pause",
+    "RESUME_TIMERS_BATCH": "resume",
+    "DELETE_TIMERS_BATCH": "delete",
+}
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+class TimerSelector:
+    """Selección de timers para PAUSE/RESUME/DELETE_TIMERS_BATCH.
+
+    Un timer se selecciona si coincide con cualquiera de los criterios: id, inventario_id o
+    rfid. Los lotes se guardan aparte: el timer no conoce su lote, así que quien tenga acceso
+    al inventario los traduce a inventario_ids con `add_inventario_ids` antes de seleccionar.
+    Un selector vacío no selecciona nada. En los timers de grupo (lote) el criterio se aplica
+    a cada miembro y se devuelven los ids de los miembros que coinciden, salvo que se
+    seleccione el grupo por su propio id.
+    """
+
+    def __init__(
+        self,
+        ids: Optional[Iterable[str]] = None,
+        inventario_ids: Optional[Iterable[int]] = None,
+        rfids: Optional[Iterable[str]] = None,
+        lotes: Optional[Iterable[str]] = None,
+    ):
+        self.ids: Set[str] = {str(v) for v in ids or () if v}
+        self.inventario_ids: Set[int] = set()
+        self.add_inventario_ids(inventario_ids or ())
+        self.rfids: Set[str] = {str(v).strip() for v in rfids or () if v and str(v).strip()}
+        self.lotes: List[str] = [str(v).strip() for v in lotes or () if v and str(v).strip()]
+
+    @classmethod
+    def from_message(cls, data: Dict[str, Any]) -> "TimerSelector":
+        """Construir desde el `data` de un mensaje WS o el cuerpo REST.
+
+        Acepta `timerIds`, `inventario_ids`, `rfids` y `lote` / `lotes` (valor o lista).
+        """
+        return cls(
+            ids=_as_list(data.get("timerIds")),
+            inventario_ids=_as_list(data.get("inventario_ids")),
+            rfids=_as_list(data.get("rfids")),
+            lotes=_as_list(data.get("lotes")) + _as_list(data.get("lote")),
+        )
+
+    def add_inventario_ids(self, inventario_ids: Iterable[Any]):
+        for value in inventario_ids:
+            try:
+                self.inventario_ids.add(int(value))
+            except (TypeError, ValueError):
+                continue
+
+    def is_empty(self) -> bool:
+        return not (self.ids or self.inventario_ids or self.rfids or self.lotes)
+
+    def matches(self, timer: Any) -> bool:
+        return (
+            timer.id in self.ids
+            or (timer.inventario_id is not None and timer.inventario_id in self.inventario_ids)
+            or (timer.rfid is not None and timer.rfid in self.rfids)
+        )
+
+    def matches_member(self, member: Dict[str, Any]) -> bool:
+        return (
+            member.get("id") in self.ids
+            or (member.get("inventario_id") is not None and member.get("inventario_id") in self.inventario_ids)
+            or (member.get("rfid") is not None and member.get("rfid") in self.rfids)
+        )
+
+    def select(self, timers: Dict[str, Any], tenant: str, tenant_of: Callable[[Any], str]) -> List[str]:
+        """Ids de los timers (o miembros de timers de grupo) de `tenant` que coinciden con el selector.
+
+        Con un `IndexedTimers` los candidatos salen de sus índices (rfid, inventario_id, tenant
+        y miembro -> grupo); con un diccionario normal se recorren todos los timers.
+        """
+        candidates = self._candidates(timers, tenant)
+        selected: List[str] = []
+        for timer in candidates:
+            if tenant_of(timer) != tenant:
+                continue
+            if self.matches(timer):
+                selected.append(timer.id)
+                continue
+            for member in getattr(timer, "miembros", None) or ():
+                if self.matches_member(member):
+                    selected.append(member["id"])
+        return selected
+
+    def _candidates(self, timers: Dict[str, Any], tenant: str) -> Iterable[Any]:
+        group_of = getattr(timers, "group_of", None)
+        ids_matching = getattr(timers, "ids_matching", None)
+        if ids_matching is None and (self.inventario_ids or self.rfids):
+            return timers.values()
+        candidate_ids: Dict[str, None] = {}
+        for timer_id in self.ids:
+            owner = timer_id if timer_id in timers else (group_of(timer_id) if group_of else None)
+            if owner is not None:
+                candidate_ids[owner] = None
+        # Los grupos están indexados por el rfid / inventario_id de cada miembro
+        for inventario_id in self.inventario_ids:
+            candidate_ids.update(dict.fromkeys(ids_matching(inventario_id=inventario_id, tenant=tenant)))
+        for rfid in self.rfids:
+            candidate_ids.update(dict.fromkeys(ids_matching(rfid=rfid, tenant=tenant)))
+        return [timers[timer_id] for timer_id in candidate_ids if timer_id in timers]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "timerIds": sorted(self.ids),
+            "inventario_ids": sorted(self.inventario_ids),
+            "rfids": sorted(self.rfids),
+            "lotes": self.lotes,
+        }
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from shared.timer_versions import TIMER_TOMBSTONE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Intervalo de vaciado de la cola de upserts hacia PostgreSQL
+TIMER_STORE_FLUSH_MS = int(os.getenv("TIMER_STORE_FLUSH_MS", "300"))
+DEFAULT_TENANT_SCHEMA = os.getenv("DEFAULT_TENANT_SCHEMA", "tenant_base")
+# Cada cuánto se purgan las lápidas más antiguas que TIMER_TOMBSTONE_TTL_SECONDS
+_PURGE_INTERVAL_SECONDS = 3600
+
+_SCHEMA_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Columnas explícitas; el resto de campos del timer viaja en `datos` (JSONB)
+_CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {schema}.timers (
+    id TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    tipo_operacion TEXT NOT NULL,
+    tiempo_inicial_minutos INTEGER NOT NULL,
+    tiempo_restante_segundos INTEGER NOT NULL,
+    fecha_inicio TIMESTAMPTZ NOT NULL,
+    fecha_fin TIMESTAMPTZ NOT NULL,
+    activo BOOLEAN NOT NULL DEFAULT TRUE,
+    completado BOOLEAN NOT NULL DEFAULT FALSE,
+    rfid TEXT,
+    inventario_id INTEGER,
+    datos JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+    version BIGINT NOT NULL DEFAULT 0,
+    actualizado_en TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+# Tablas creadas antes de guardar la versión: sus filas quedan en 0 hasta la siguiente escritura
+_ADD_VERSION_SQL = """
+ALTER TABLE {schema}.timers ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0
+"""
+
+# Lápidas de los timers eliminados: una escritura atrasada de otra instancia no los vuelve a insertar
+_CREATE_TOMBSTONES_SQL = """
+CREATE TABLE IF NOT EXISTS {schema}.timers_lapidas (
+    id TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    eliminado_en TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+# Índice parcial para la carga de arranque (timers en curso o pausados)
+_CREATE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS timers_no_completados_idx
+ON {schema}.timers (fecha_fin) WHERE NOT completado
+"""
+
+# Índice parcial para archivar por TTL los completados que quedaron en la tabla (no se cargan)
+_CREATE_COMPLETED_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS timers_completados_idx
+ON {schema}.timers (fecha_fin) WHERE completado
+"""
+
+_UPSERT_SQL = """
+INSERT INTO {schema}.timers AS t (
+    id, nombre, tipo_operacion, tiempo_inicial_minutos, tiempo_restante_segundos,
+    fecha_inicio, fecha_fin, activo, completado, rfid, inventario_id, datos, version, actualizado_en
+) VALUES (
+    :id, :nombre, :tipo_operacion, :tiempo_inicial_minutos, :tiempo_restante_segundos,
+    :fecha_inicio, :fecha_fin, :activo, :completado, :rfid, :inventario_id, CAST(:datos AS JSONB), :version, NOW()
+)
+ON CONFLICT (id) DO UPDATE SET
+    nombre = EXCLUDED.nombre,
+    tipo_operacion = EXCLUDED.tipo_operacion,
+    tiempo_inicial_minutos = EXCLUDED.tiempo_inicial_minutos,
+    tiempo_restante_segundos = EXCLUDED.tiempo_restante_segundos,
+    fecha_inicio = EXCLUDED.fecha_inicio,
+    fecha_fin = EXCLUDED.fecha_fin,
+    activo = EXCLUDED.activo,
+    completado = EXCLUDED.completado,
+    rfid = EXCLUDED.rfid,
+    inventario_id = EXCLUDED.inventario_id,
+    datos = EXCLUDED.datos,
+    version = EXCLUDED.version,
+    actualizado_en = NOW()
+WHERE t.version < EXCLUDED.version
+"""
+
+_TOMBSTONE_SQL = """
+INSERT INTO {schema}.timers_lapidas AS l (id, version, eliminado_en) VALUES (:id, :version, NOW())
+ON CONFLICT (id) DO UPDATE SET
+    version = GREATEST(l.version, EXCLUDED.version),
+    eliminado_en = NOW()
+"""
+
+_DELETE_SQL = """
+DELETE FROM {schema}.timers t
+USING {schema}.timers_lapidas l
+WHERE t.id = l.id AND t.id = ANY(:ids) AND t.version <= l.version
+"""
+
+_LIVE_TOMBSTONES_SQL = """
+SELECT id, version FROM {schema}.timers_lapidas WHERE id = ANY(:ids)
+"""
+
+_PURGE_TOMBSTONES_SQL = """
+DELETE FROM {schema}.timers_lapidas WHERE eliminado_en < NOW() - make_interval(secs => :ttl)
+"""
+
+_LOAD_SQL = """
+SELECT datos, id, nombre, tipo_operacion, tiempo_inicial_minutos, tiempo_restante_segundos,
+       fecha_inicio, fecha_fin, activo, completado, rfid, inventario_id
+FROM {schema}.timers
+WHERE NOT completado
+"""
+
+
+def _safe_schema(tenant: Optional[str]) -> str:
+    schema = tenant or DEFAULT_TENANT_SCHEMA
+    if not _SCHEMA_RE.match(schema):
+        raise ValueError(f"Schema de tenant inválido: {schema!r}")
+    return schema
+
+
+class PostgresTimerStore:
+    """Persistencia de timers en la tabla `timers` de cada schema de tenant.
+
+    Las escrituras se acumulan en una cola en memoria (el último estado de cada timer
+    reemplaza al anterior) y se vacían cada TIMER_STORE_FLUSH_MS con un upsert por lotes
+    por tenant, en un hilo para no bloquear el event loop. Misma interfaz que
+    `TimerJournal` (record_put / record_delete / load / start / stop).
+
+    La tabla es compartida por todas las instancias y cada una vacía su propia cola, así que
+    las escrituras pueden llegar desordenadas: el upsert solo reemplaza una fila con versión
+    menor, y las eliminaciones dejan una lápida con su versión en `timers_lapidas` que descarta
+    los upserts atrasados del mismo timer. Con versiones empatadas gana la primera escritura.
+    """
+
+    def __init__(self, engine_factory: Callable, default_tenant: Optional[str] = None):
+        self.engine_factory = engine_factory
+        self.default_tenant = default_tenant or DEFAULT_TENANT_SCHEMA
+        self.pending: Dict[Tuple[str, str], Any] = {}
+        self.ensured_schemas = set()
+        self.purged_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self._lock = asyncio.Lock()
+
+    # ---- Registro de cambios (O(1), sin E/S) ----
+
+    def record_put(self, timer_dict: Dict[str, Any]):
+        tenant = timer_dict.get("tenant") or self.default_tenant
+        self.pending[(tenant, timer_dict["id"])] = timer_dict
+        self._ensure_task()
+
+    def record_delete(self, timer_id: str, tenant: Optional[str] = None, version: int = 0):
+        # Una eliminación en cola es la versión de su lápida (un entero en lugar del registro)
+        self.pending[(tenant or self.default_tenant, timer_id)] = version
+        self._ensure_task()
+
+    # ---- Carga de arranque ----
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Cargar los timers no completados de todos los tenants que tienen tabla `timers`.
+
+        Los completados que siguen en la tabla no se cargan: los archiva por TTL
+        `PostgresTimerArchive.archive_stored`, sin pasar por memoria.
+        """
+        engine = self.engine_factory()
+        state: Dict[str, Dict[str, Any]] = {}
+        with engine.begin() as conn:
+            schemas = [
+                row[0] for row in conn.execute(text(
+                    "SELECT table_schema FROM information_schema.tables WHERE table_name = 'timers'"
+                ))
+            ]
+            for schema in schemas:
+                if not _SCHEMA_RE.match(schema):
+                    continue
+                self._ensure_schema(conn, schema)
+                for row in conn.execute(text(_LOAD_SQL.format(schema=schema))):
+                    m = row._mapping
+                    datos = m["datos"] or {}
+                    if isinstance(datos, str):
+                        datos = json.loads(datos)
+                    state[m["id"]] = {
+                        **datos,
+                        "id": m["id"],
+                        "nombre": m["nombre"],
+                        "tipoOperacion": m["tipo_operacion"],
+                        "tiempoInicialMinutos": m["tiempo_inicial_minutos"],
+                        "tiempoRestanteSegundos": m["tiempo_restante_segundos"],
+                        "fechaInicio": m["fecha_inicio"].isoformat(),
+                        "fechaFin": m["fecha_fin"].isoformat(),
+                        "activo": m["activo"],
+                        "completado": m["completado"],
+                        "rfid": m["rfid"],
+                        "inventario_id": m["inventario_id"],
+                        "tenant": schema,
+                    }
+        logger.info(f"Timers cargados desde PostgreSQL: {len(state)} ({len(schemas)} tenants)")
+        return state
+
+    # ---- Vaciado en segundo plano ----
+
+    def _ensure_task(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._running = True
+        self._task = loop.create_task(self._run())
+
+    def start(self):
+        self._ensure_task()
+
+    async def _run(self):
+        while self._running:
+            try:
+                await asyncio.sleep(TIMER_STORE_FLUSH_MS / 1000)
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error vaciando timers a PostgreSQL: {e}")
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception:
+                # Reencolar lo que no se escribió sin pisar cambios más recientes
+                for key, value in batch.items():
+                    self.pending.setdefault(key, value)
+                raise
+
+    def _ensure_schema(self, conn, schema: str):
+        conn.execute(text(_CREATE_TABLE_SQL.format(schema=schema)))
+        conn.execute(text(_ADD_VERSION_SQL.format(schema=schema)))
+        conn.execute(text(_CREATE_INDEX_SQL.format(schema=schema)))
+        conn.execute(text(_CREATE_COMPLETED_INDEX_SQL.format(schema=schema)))
+        conn.execute(text(_CREATE_TOMBSTONES_SQL.format(schema=schema)))
+
+    def _write_batch(self, batch: Dict[Tuple[str, str], Any]):
+        by_tenant: Dict[str, Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = {}
+        for (tenant, timer_id), value in batch.items():
+            upserts, deletes = by_tenant.setdefault(tenant, ([], []))
+            if isinstance(value, dict):
+                upserts.append(self._to_row(value))
+            else:
+                deletes.append({"id": timer_id, "version": value or 0})
+
+        engine = self.engine_factory()
+        created = set()
+        purged = set()
+        now = time.monotonic()
+        with engine.begin() as conn:
+            for tenant, (upserts, deletes) in by_tenant.items():
+                schema = _safe_schema(tenant)
+                if schema not in self.ensured_schemas:
+                    self._ensure_schema(conn, schema)
+                    created.add(schema)
+                if deletes:
+                    conn.execute(text(_TOMBSTONE_SQL.format(schema=schema)), deletes)
+                    conn.execute(text(_DELETE_SQL.format(schema=schema)), {"ids": [d["id"] for d in deletes]})
+                    if now - self.purged_at.get(schema, 0.0) >= _PURGE_INTERVAL_SECONDS:
+                        conn.execute(text(_PURGE_TOMBSTONES_SQL.format(schema=schema)), {"ttl": TIMER_TOMBSTONE_TTL_SECONDS})
+                        purged.add(schema)
+                if upserts:
+                    upserts = self._drop_tombstoned(conn, schema, upserts)
+                if upserts:
+                    conn.execute(text(_UPSERT_SQL.format(schema=schema)), upserts)
+        # Solo se recuerdan las tablas creadas si la transacción confirmó
+        self.ensured_schemas.update(created)
+        self.purged_at.update(dict.fromkeys(purged, now))
+
+    @staticmethod
+    def _drop_tombstoned(conn, schema: str, upserts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Descartar los upserts de timers cuya lápida tiene una versión igual o mayor."""
+        lapidas = dict(conn.execute(
+            text(_LIVE_TOMBSTONES_SQL.format(schema=schema)), {"ids": [row["id"] for row in upserts]}
+        ).all())
+        return [row for row in upserts if row["version"] > lapidas.get(row["id"], -1)]
+
+    @staticmethod
+    def _to_row(timer_dict: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": timer_dict["id"],
+            "nombre": timer_dict["nombre"],
+            "tipo_operacion": timer_dict["tipoOperacion"],
+            "tiempo_inicial_minutos": timer_dict["tiempoInicialMinutos"],
+            "tiempo_restante_segundos": timer_dict["tiempoRestanteSegundos"],
+            "fecha_inicio": timer_dict["fechaInicio"],
+            "fecha_fin": timer_dict["fechaFin"],
+            "activo": timer_dict["activo"],
+            "completado": timer_dict["completado"],
+            "rfid": timer_dict.get("rfid"),
+            "inventario_id": timer_dict.get("inventario_id"),
+            "datos": json.dumps(timer_dict, default=str),
+            "version": timer_dict.get("version") or 0,
+        }
+
+    async def stop(self):
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self.flush()
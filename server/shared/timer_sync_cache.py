@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# A partir de este número de timers la serialización del snapshot se hace en un hilo
+TIMER_SYNC_ENCODE_THREAD_MIN = int(os.getenv("TIMER_SYNC_ENCODE_THREAD_MIN", "2000"))
+
+
+def _encode_records(records: List[Dict[str, Any]]) -> str:
+    return json.dumps(records, default=str, separators=(",", ":"))
+
+
+class TimerSyncCache:
+    """Cache de la lista de timers del TIMER_SYNC, ya serializada, por tenant y versión.
+
+    Cada mutación real del estado (crear, pausar, reanudar, eliminar, completar) llama a
+    `touch(tenant)` y sube la versión; mientras la versión de un tenant no cambie, todas las
+    conexiones que piden su snapshot reciben el mismo payload sin volver a llamar a
+    `to_dict()` ni a `json.dumps`. Las peticiones concurrentes de la misma versión esperan
+    a una única construcción.
+
+    Los registros no deben depender del reloj (ni tiempo restante de los timers en curso ni
+    server_timestamp): el cliente descuenta con fechaFin y el server_timestamp de la cabecera,
+    que se pone al enviar. Así el tick no invalida nada.
+
+    `collect(tenant)` devuelve los registros del snapshot y un marcador tomado en el mismo
+    instante (p. ej. el seq del registro de cambios), que acompaña al payload.
+    """
+
+    def __init__(self, collect: Callable[[Optional[str]], Tuple[List[Dict[str, Any]], Any]]):
+        self.collect = collect
+        self.version = 0
+        self.tenant_versions: Dict[Optional[str], int] = {}
+        self._entries: Dict[Optional[str], Tuple[int, str, Any]] = {}
+        self._building: Dict[Tuple[Optional[str], int], asyncio.Future] = {}
+        self.hits = 0
+        self.builds = 0
+        self.shared = 0
+
+    # ---- Versionado ----
+
+    def touch(self, tenant: Optional[str]):
+        """Invalidar el snapshot de `tenant` (y el global) tras una mutación."""
+        self.version += 1
+        self.tenant_versions[tenant] = self.version
+
+    def version_of(self, tenant: Optional[str]) -> int:
+        if tenant is None:
+            return self.version
+        return self.tenant_versions.get(tenant, 0)
+
+    # ---- Consulta ----
+
+    async def get(self, tenant: Optional[str]) -> Tuple[str, Any]:
+        """Payload JSON de la lista de timers de `tenant` (None = todos) y su marcador."""
+        version = self.version_of(tenant)
+        entry = self._entries.get(tenant)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1], entry[2]
+
+        key = (tenant, version)
+        pending = self._building.get(key)
+        if pending is not None:
+            self.shared += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._building[key] = future
+        try:
+            records, marker = self.collect(tenant)
+            if len(records) >= TIMER_SYNC_ENCODE_THREAD_MIN:
+                payload = await asyncio.to_thread(_encode_records, records)
+            else:
+                payload = _encode_records(records)
+            self.builds += 1
+            current = self._entries.get(tenant)
+            if current is None or current[0] <= version:
+                self._entries[tenant] = (version, payload, marker)
+            future.set_result((payload, marker))
+            return payload, marker
+        except Exception as e:
+            future.set_exception(e)
+            # Marcar la excepción como consumida si nadie más esperaba esta construcción
+            future.exception()
+            raise
+        finally:
+            self._building.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "cached_tenants": len(self._entries),
+            "hits": self.hits,
+            "builds": self.builds,
+            "shared_builds": self.shared,
+        }
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from shared.timer_completions import expand_completion
+from shared.timer_store import _safe_schema
+
+logger = logging.getLogger(__name__)
+
+# Transición de estado del inventario al completarse un timer, por tipoOperacion (JSON):
+#   {"atemperamiento": {"estado": null, "sub_estado": "Atemperado", "desde_sub_estado": ["Atemperamiento"]}}
+# "estado": null conserva el estado actual; "desde_sub_estado" (opcional) limita la transición a
+# los items que siguen en esos sub_estados (un item que ya avanzó no retrocede).
+# Vacío = transición por defecto; "off" = sin transiciones automáticas.
+TIMER_COMPLETION_TRANSITIONS = os.getenv("TIMER_COMPLETION_TRANSITIONS", "").strip()
+# Espera antes de reintentar las transiciones que fallaron
+TIMER_COMPLETION_RETRY_SECONDS = float(os.getenv("TIMER_COMPLETION_RETRY_SECONDS", "30"))
+
+# Mismo criterio que aplicaba el frontend al terminar el cronómetro de atemperamiento
+DEFAULT_TRANSITIONS: Dict[str, Dict[str, Any]] = {
+    "atemperamiento": {"estado": None, "sub_estado": "Atemperado", "desde_sub_estado": ["Atemperamiento"]},
+}
+
+# Una sola sentencia por tenant: UPDATE por lotes con las transiciones de cada tipo y las
+# actividades de los items realmente actualizados
+_TRANSITION_SQL = """
+WITH cambios AS (
+    SELECT * FROM unnest(CAST(:inventario_ids AS INTEGER[]), CAST(:rfids AS TEXT[]), CAST(:tipos AS TEXT[]))
+        AS c(inventario_id, rfid, tipo)
+), transiciones AS (
+    SELECT * FROM (VALUES {transiciones}) AS t(tipo, estado, sub_estado, desde)
+), actualizados AS (
+    UPDATE {schema}.inventario_credocubes i
+    SET estado = COALESCE(t.estado, i.estado),
+        sub_estado = t.sub_estado,
+        ultima_actualizacion = CURRENT_TIMESTAMP
+    FROM cambios c
+    JOIN transiciones t ON t.tipo = c.tipo
+    WHERE (i.id = c.inventario_id OR (c.inventario_id IS NULL AND i.rfid = c.rfid))
+      AND (t.desde IS NULL OR i.sub_estado = ANY(t.desde))
+    RETURNING i.id, i.rfid, i.estado, i.sub_estado, c.tipo
+), actividades AS (
+    INSERT INTO {schema}.actividades_operacion
+        (inventario_id, usuario_id, descripcion, estado_nuevo, sub_estado_nuevo, timestamp)
+    SELECT id, NULL, 'Timer de ' || tipo || ' completado: transición automática a ' || sub_estado,
+           estado, sub_estado, CURRENT_TIMESTAMP
+    FROM actualizados
+)
+SELECT id, rfid, estado, sub_estado, tipo FROM actualizados
+"""
+
+
+def parse_transitions(raw: str) -> Dict[str, Dict[str, Any]]:
+    """Transiciones por tipoOperacion desde TIMER_COMPLETION_TRANSITIONS."""
+    if not raw:
+        return dict(DEFAULT_TRANSITIONS)
+    if raw.lower() in ("off", "false", "0", "none"):
+        return {}
+    config = json.loads(raw)
+    transitions: Dict[str, Dict[str, Any]] = {}
+    for tipo, spec in config.items():
+        if not spec or not spec.get("sub_estado"):
+            raise ValueError(f"Transición de {tipo!r} sin sub_estado")
+        desde = spec.get("desde_sub_estado")
+        transitions[tipo] = {
+            "estado": spec.get("estado"),
+            "sub_estado": spec["sub_estado"],
+            "desde_sub_estado": [desde] if isinstance(desde, str) else desde,
+        }
+    return transitions
+
+
+class CompletionTransitions:
+    """Aplica en el inventario la transición configurada de cada timer completado.
+
+    El tick encola con `add` las completaciones propias (un timer de grupo aporta todos sus
+    miembros) y `flush` las aplica fuera del tick: en una transacción, una sentencia por
+    tenant que actualiza todos sus items y escribe sus actividades_operacion. Si falla, las
+    pendientes se reintentan tras TIMER_COMPLETION_RETRY_SECONDS.
+    """
+
+    def __init__(self, engine_factory: Callable, transitions: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.engine_factory = engine_factory
+        self.transitions = parse_transitions(TIMER_COMPLETION_TRANSITIONS) if transitions is None else transitions
+        self.pending: Dict[str, List[Tuple[Optional[int], Optional[str], str]]] = {}
+        self.retry_at = 0.0
+        self._flushing = False
+        self.applied = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.transitions)
+
+    def add(self, tenant: str, timer: Dict[str, Any]):
+        tipo = timer.get("tipoOperacion")
+        if tipo not in self.transitions:
+            return
+        items = self.pending.setdefault(tenant, [])
+        for record in expand_completion(timer):
+            inventario_id = record.get("inventario_id")
+            rfid = record.get("rfid") or record.get("nombre")
+            if inventario_id is not None or rfid:
+                items.append((inventario_id, rfid, tipo))
+
+    def due(self, now_ts: Optional[float] = None) -> bool:
+        now_ts = time.time() if now_ts is None else now_ts
+        return bool(self.pending) and not self._flushing and now_ts >= self.retry_at
+
+    def _apply(self, pending: Dict[str, List[Tuple[Optional[int], Optional[str], str]]]) -> Dict[str, List[Dict[str, Any]]]:
+        changed: Dict[str, List[Dict[str, Any]]] = {}
+        with self.engine_factory().begin() as conn:
+            for tenant, items in pending.items():
+                if not items:
+                    continue
+                schema = _safe_schema(tenant)
+                items = list(dict.fromkeys(items))
+                tipos = sorted({tipo for _, _, tipo in items})
+                values = []
+                params: Dict[str, Any] = {
+                    "inventario_ids": [i[0] for i in items],
+                    "rfids": [i[1] for i in items],
+                    "tipos": [i[2] for i in items],
+                }
+                for n, tipo in enumerate(tipos):
+                    spec = self.transitions[tipo]
+                    values.append(
+                        f"(CAST(:tipo_{n} AS TEXT), CAST(:estado_{n} AS TEXT), CAST(:sub_estado_{n} AS TEXT), "
+                        f"CAST(:desde_{n} AS TEXT[]))"
+                    )
+                    params[f"tipo_{n}"] = tipo
+                    params[f"estado_{n}"] = spec["estado"]
+                    params[f"sub_estado_{n}"] = spec["sub_estado"]
+                    params[f"desde_{n}"] = spec["desde_sub_estado"]
+                rows = conn.execute(
+                    text(_TRANSITION_SQL.format(schema=schema, transiciones=", ".join(values))), params
+                ).fetchall()
+                changed[schema] = [
+                    {"id": r[0], "rfid": r[1], "estado": r[2], "sub_estado": r[3], "tipoOperacion": r[4]}
+                    for r in rows
+                ]
+        return changed
+
+    async def flush(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Aplicar las transiciones pendientes; devuelve los items actualizados por tenant."""
+        if self._flushing or not self.pending:
+            return {}
+        self._flushing = True
+        pending, self.pending = self.pending, {}
+        try:
+            changed = await asyncio.to_thread(self._apply, pending)
+        except Exception as e:
+            self.failures += 1
+            for tenant, items in pending.items():
+                self.pending.setdefault(tenant, []).extend(items)
+            self.retry_at = time.time() + TIMER_COMPLETION_RETRY_SECONDS
+            logger.error(f"Error aplicando transiciones de timers completados (se reintentará): {e}")
+            return {}
+        finally:
+            self._flushing = False
+        self.applied += sum(len(items) for items in changed.values())
+        return changed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tipos": sorted(self.transitions),
+            "pending": sum(len(items) for items in self.pending.values()),
+            "applied": self.applied,
+            "failures": self.failures,
+        }
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+# Tiempo que se conserva la lápida de un timer eliminado para ganar a copias antiguas
+TIMER_TOMBSTONE_TTL_SECONDS = int(os.getenv("TIMER_TOMBSTONE_TTL_SECONDS", "86400"))
+
+# Bits bajos de la versión reservados al id de instancia (desempate entre escritores)
+_NODE_BITS = 10
+
+
+class TimerVersionClock:
+    """Reloj de versiones por timer para fusión last-writer-wins entre instancias.
+
+    La versión combina milisegundos de época (bits altos) con un identificador de instancia
+    (bits bajos): es estrictamente creciente para cada timer y ordena escrituras de distintas
+    instancias por tiempo. Dentro del mismo milisegundo desempata el nodo, pero el nodo son
+    solo _NODE_BITS bits del hash del id de instancia (la versión debe caber en un número
+    JSON exacto, < 2**53): dos instancias pueden compartirlo (1 entre 1024 por pareja) y
+    entonces dos escrituras concurrentes del mismo timer en el mismo milisegundo empatan.
+
+    Regla de empate: una versión igual nunca gana (`is_newer`, `merge_remote` y el digest
+    comparan de forma estricta), así que cada instancia conserva su copia y no hay ganador
+    arbitrario. Las copias pueden diferir hasta la siguiente escritura del timer, que lleva
+    una versión mayor y converge en todas.
+    """
+
+    def __init__(self, instance_id: str):
+        digest = hashlib.md5(instance_id.encode()).digest()
+        self.node = int.from_bytes(digest[:2], "big") % (1 << _NODE_BITS)
+
+    def next(self, current: Optional[int] = 0) -> int:
+        """Versión siguiente a `current` para una escritura hecha en esta instancia."""
+        ms = max(int(time.time() * 1000), ((current or 0) >> _NODE_BITS) + 1)
+        return (ms << _NODE_BITS) | self.node
+
+
+def is_newer(incoming: Any, current: Optional[int]) -> bool:
+    """True si una escritura con versión `incoming` gana a la copia local (`current`).
+
+    Estricto: en un empate se queda la copia local (ver TimerVersionClock). Los eventos sin
+    versión (instancias que aún no la envían) se aplican como antes.
+    """
+    if not isinstance(incoming, int) or isinstance(incoming, bool):
+        return True
+    return incoming > (current or 0)
+
+
+class TimerTombstones:
+    """Versiones de los timers eliminados, para que una copia antigua no los resucite."""
+
+    def __init__(self, ttl: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else TIMER_TOMBSTONE_TTL_SECONDS
+        self.versions: Dict[str, int] = {}
+        self.deleted_at: Dict[str, float] = {}
+
+    def add(self, timer_id: str, version: int):
+        if version >= self.versions.get(timer_id, 0):
+            self.versions[timer_id] = version
+            self.deleted_at[timer_id] = time.monotonic()
+
+    def version(self, timer_id: str) -> int:
+        return self.versions.get(timer_id, 0)
+
+    def discard(self, timer_id: str):
+        self.versions.pop(timer_id, None)
+        self.deleted_at.pop(timer_id, None)
+
+    def prune(self):
+        limit = time.monotonic() - self.ttl
+        for timer_id in [tid for tid, at in self.deleted_at.items() if at < limit]:
+            self.discard(timer_id)
+
+    def snapshot(self) -> Dict[str, int]:
+        self.prune()
+        return dict(self.versions)
+
+    def __len__(self) -> int:
+        return len(self.versions)
+
+
+def diff_digest(
+    local: Dict[str, int],
+    local_tombstones: Dict[str, int],
+    remote: Dict[str, int],
+    remote_tombstones: Dict[str, int],
+) -> Dict[str, Any]:
+    """Comparar el digest local (id -> versión) con el de otra instancia.
+
+    Devuelve:
+      - "send": ids cuya copia local es más reciente (o que la otra instancia no tiene).
+      - "tombstones": eliminaciones locales que la otra instancia aún no ha aplicado.
+      - "want": ids cuya copia remota es más reciente que la local.
+      - "delete": ids locales que la otra instancia eliminó después de nuestra última escritura.
+    """
+    send: List[str] = []
+    tombstones: Dict[str, int] = {}
+    want: List[str] = []
+    delete: Dict[str, int] = {}
+
+    for timer_id, version in local.items():
+        remote_deleted = remote_tombstones.get(timer_id, 0)
+        if remote_deleted >= version:
+            delete[timer_id] = remote_deleted
+        elif version > remote.get(timer_id, -1):
+            send.append(timer_id)
+
+    for timer_id, deleted in local_tombstones.items():
+        if timer_id in remote and remote[timer_id] <= deleted:
+            tombstones[timer_id] = deleted
+
+    for timer_id, version in remote.items():
+        if version > local.get(timer_id, -1) and version > local_tombstones.get(timer_id, -1):
+            want.append(timer_id)
+
+    return {"send": send, "tombstones": tombstones, "want": want, "delete": delete}
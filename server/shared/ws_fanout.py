@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo (segundos) que se espera a un cliente antes de descartarlo
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "2.0"))
+# Número de muestras de latencia que se conservan para calcular percentiles
+WS_FANOUT_LATENCY_WINDOW = int(os.getenv("WS_FANOUT_LATENCY_WINDOW", "1000"))
+# Máximo de frames pendientes por conexión antes de considerarla irrecuperable
+WS_OUTBOX_MAX_FRAMES = int(os.getenv("WS_OUTBOX_MAX_FRAMES", "256"))
+
+# Frames de tiempo que pueden reemplazarse por uno más reciente si el cliente va atrasado.
+# Cualquier otro tipo (TIMER_CREATED, TIMER_DELETED, completados, sync...) nunca se descarta.
+COALESCIBLE_TYPES = ("TIMER_TIME_UPDATE", "TIMER_BATCH_UPDATE")
+
+
+def encode_message(message: Dict[Any, Any]) -> str:
+    """Serializar un mensaje una sola vez para todas las conexiones."""
+    return json.dumps(message, default=str, separators=(",", ":"))
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def _coalesce_key(message: Dict[Any, Any]):
+    """Clave de agrupación para frames reemplazables; None si el frame es de estado."""
+    msg_type = message.get("type")
+    if msg_type not in COALESCIBLE_TYPES:
+        return None
+    # Un frame numerado (`seq`) lleva cambios de estado (completaciones) y no se combina ni descarta
+    if message.get("seq") is not None:
+        return None
+    if msg_type == "TIMER_TIME_UPDATE":
+        data = message.get("data") or {}
+        # Un TIMER_TIME_UPDATE que reporta la completación es un cambio de estado
+        if data.get("completado"):
+            return None
+        return (msg_type, data.get("timerId"))
+    # Un lote que incluye una completación tampoco puede descartarse
+    if any(u.get("completado") for u in (message.get("data") or {}).get("updates", [])):
+        return None
+    return (msg_type,)
+
+
+def _merge_frames(older: Dict[Any, Any], newer: Dict[Any, Any]) -> Dict[Any, Any]:
+    """Combinar dos frames con la misma clave conservando el estado más reciente de cada timer."""
+    if newer.get("type") != "TIMER_BATCH_UPDATE":
+        return newer
+    merged = {u.get("timerId"): u for u in (older.get("data") or {}).get("updates", [])}
+    for u in (newer.get("data") or {}).get("updates", []):
+        merged[u.get("timerId")] = u
+    return {
+        **newer,
+        "data": {**(newer.get("data") or {}), "updates": list(merged.values())},
+    }
+
+
+class _OutboundFrame:
+    __slots__ = ("key", "message", "payload", "enqueued_at")
+
+    def __init__(self, key, message: Dict[Any, Any], payload: str):
+        self.key = key
+        self.message = message
+        self.payload = payload
+        self.enqueued_at = time.perf_counter()
+
+
+class ConnectionOutbox:
+    """Cola de salida acotada con tarea escritora propia para una conexión WebSocket.
+
+    Si el cliente se atrasa, los frames de tiempo pendientes para el mismo timer se
+    combinan en lugar de encolarse; con la cola llena se descartan primero los frames
+    de tiempo más antiguos (el siguiente tick los corrige). Un frame combinado nunca se
+    adelanta a un frame de estado encolado antes que él. Si la cola se llena solo con
+    frames de estado, la conexión se cierra (el cliente se reconecta y recibe un
+    TIMER_SYNC completo) en vez de descartar cambios de estado o crecer sin límite.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        fanout: "WebSocketFanout",
+        on_dead: Optional[Callable[[Any], Awaitable[None]]] = None,
+        max_frames: Optional[int] = None,
+    ):
+        self.websocket = websocket
+        self.fanout = fanout
+        self.on_dead = on_dead
+        self.max_frames = max_frames or WS_OUTBOX_MAX_FRAMES
+        self.frames: deque = deque()
+        self.coalesced_total = 0
+        self.evicted_total = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._writer())
+
+    def enqueue(self, message: Dict[Any, Any], payload: str) -> bool:
+        """Encolar un frame sin bloquear; devuelve False si la conexión debe descartarse."""
+        if self.closed:
+            return False
+        key = _coalesce_key(message)
+        full = len(self.frames) >= self.max_frames
+        if key is not None:
+            # Solo se combina con la cola si no hay frames de estado posteriores (preserva el orden);
+            # con la cola llena se combina con el pendiente más reciente de la misma clave.
+            candidates = [self.frames[-1]] if self.frames else []
+            if full:
+                candidates = [f for f in reversed(self.frames) if f.key == key][:1]
+            for pending in candidates:
+                if pending.key == key:
+                    merged = _merge_frames(pending.message, message)
+                    pending.message = merged
+                    pending.payload = payload if merged is message else encode_message(merged)
+                    if pending is not self.frames[-1]:
+                        # El combinado es más reciente que los frames de estado posteriores: va al final
+                        self.frames.remove(pending)
+                        self.frames.append(pending)
+                    self.coalesced_total += 1
+                    return True
+        if full and not self._evict_oldest_time_frame():
+            logger.warning(
+                f"Cola de salida WebSocket llena ({self.max_frames} frames de estado); se cierra la conexión lenta"
+            )
+            return False
+        self.frames.append(_OutboundFrame(key, message, payload))
+        self._wakeup.set()
+        return True
+
+    def _evict_oldest_time_frame(self) -> bool:
+        """Liberar espacio descartando el frame de tiempo más antiguo (nunca uno de estado)."""
+        for frame in self.frames:
+            if frame.key is not None:
+                self.frames.remove(frame)
+                self.evicted_total += 1
+                return True
+        return False
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self.frames:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                frame = self.frames.popleft()
+                await asyncio.wait_for(self.websocket.send_text(frame.payload), timeout=self.fanout.send_timeout)
+                self.fanout.latencies_ms.append((time.perf_counter() - frame.enqueued_at) * 1000)
+        except asyncio.CancelledError:
+            return
+        except asyncio.TimeoutError:
+            logger.warning(f"Cliente WebSocket superó el plazo de envío ({self.fanout.send_timeout}s); se descarta")
+        except Exception as e:
+            logger.error(f"Error enviando a conexión WebSocket: {e}")
+        await self.fanout.drop(self.websocket)
+
+    def close(self):
+        self.closed = True
+        self.frames.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
+
+class WebSocketFanout:
+    """Fan-out de mensajes a muchas conexiones WebSocket.
+
+    Cada mensaje se serializa una vez y se deposita en la cola de salida acotada de
+    cada conexión; una tarea escritora por conexión lo envía con su propio plazo.
+    Las conexiones que fallan, no cumplen el plazo o desbordan su cola se descartan
+    sin bloquear al resto.
+    """
+
+    def __init__(self, send_timeout: Optional[float] = None, latency_window: Optional[int] = None):
+        self.send_timeout = send_timeout if send_timeout is not None else WS_SEND_TIMEOUT_SECONDS
+        self.latencies_ms = deque(maxlen=latency_window or WS_FANOUT_LATENCY_WINDOW)
+        self.outboxes: Dict[Any, ConnectionOutbox] = {}
+        self.dropped_total = 0
+        self.messages_total = 0
+
+    def register(self, websocket, on_dead: Optional[Callable[[Any], Awaitable[None]]] = None) -> ConnectionOutbox:
+        """Crear la cola de salida de una conexión; `on_dead` se invoca al descartarla."""
+        outbox = self.outboxes.get(websocket)
+        if outbox is None:
+            outbox = ConnectionOutbox(websocket, self, on_dead=on_dead)
+            self.outboxes[websocket] = outbox
+        return outbox
+
+    def unregister(self, websocket):
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+
+    async def drop(self, websocket):
+        """Descartar una conexión lenta o rota: cerrar su cola, el socket y avisar al dueño."""
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is None:
+            return
+        outbox.close()
+        self.dropped_total += 1
+        asyncio.ensure_future(self._close_quietly(websocket))
+        if outbox.on_dead is not None:
+            try:
+                await outbox.on_dead(websocket)
+            except Exception as e:
+                logger.error(f"Error notificando conexión descartada: {e}")
+
+    async def send(self, connections: Iterable, message: Dict[Any, Any], exclude=None, payload: Optional[str] = None) -> Set:
+        """Encolar `message` para `connections` y devolver las conexiones descartadas.
+
+        `payload` permite pasar el mensaje ya serializado (p. ej. un snapshot cacheado); en ese
+        caso `message` solo se usa para clasificar el frame en la cola de salida.
+        """
+        targets = [c for c in connections if c is not exclude]
+        if not targets:
+            return set()
+
+        if payload is None:
+            payload = encode_message(message)
+        self.messages_total += 1
+        failed = set()
+        for ws in targets:
+            outbox = self.outboxes.get(ws) or self.register(ws)
+            if not outbox.enqueue(message, payload):
+                failed.add(ws)
+        for ws in failed:
+            outbox = self.outboxes.pop(ws, None)
+            if outbox is not None:
+                outbox.close()
+                self.dropped_total += 1
+            asyncio.ensure_future(self._close_quietly(ws))
+        return failed
+
+    async def _close_quietly(self, websocket):
+        try:
+            await asyncio.wait_for(websocket.close(), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    def latency_stats(self) -> Dict[str, Any]:
+        """Percentiles de latencia encolado→enviado (ms) y estado de las colas de salida."""
+        values = sorted(self.latencies_ms)
+        return {
+            "p50_ms": round(_percentile(values, 50), 3),
+            "p99_ms": round(_percentile(values, 99), 3),
+            "samples": len(values),
+            "messages_total": self.messages_total,
+            "dropped_connections_total": self.dropped_total,
+            "queued_frames": sum(len(o.frames) for o in self.outboxes.values()),
+            "max_queue_depth": max((len(o.frames) for o in self.outboxes.values()), default=0),
+            "coalesced_frames_total": sum(o.coalesced_total for o in self.outboxes.values()),
+            "evicted_time_frames_total": sum(o.evicted_total for o in self.outboxes.values()),
+        }
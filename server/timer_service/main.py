@@ -9,18 +9,41 @@ import json
 import logging
 import os
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Set
+from typing import Any, Dict, Iterable, List, Optional, Set
 import uuid
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import uvicorn
-from shared.message_queue import message_queue
+from shared.message_queue import message_queue, publish_timer_completed
+from shared.ws_fanout import WebSocketFanout, encode_message
+from shared.timer_scheduler import CompletionScheduler
+from shared.timer_changelog import TimerChangeLog
+from shared.timer_membership import ClusterMembership
+from shared.timer_sync_cache import TimerSyncCache
+from shared.timer_cadence import CadencePolicy
+from shared.timer_selector import BATCH_ACTIONS, TimerSelector
+from shared.timer_versions import TimerTombstones, TimerVersionClock, diff_digest, is_newer
+from shared.clock_sync import ClockSyncState
+from shared.timer_completions import TIMER_COMPLETED_PUBLISH, TimerCompletionPublisher
+from shared.timer_transitions import CompletionTransitions
+from shared.utils import get_current_user_from_token
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "batch" (por defecto): TIMER_BATCH_UPDATE por tick con los timers que cambiaron.
+# "local": el cliente descuenta con fechaFin + server_timestamp y solo se envían cambios de estado.
+TIMER_TICK_MODE = os.getenv("TIMER_TICK_MODE", "batch").strip().lower()
+# Espera mínima entre despertares del tick (evita girar en vacío alrededor de una completación)
+TIMER_TICK_MIN_SLEEP_SECONDS = float(os.getenv("TIMER_TICK_MIN_SLEEP_SECONDS", "0.01"))
+# "postgres": persistir timers en la tabla timers de cada tenant; vacío = solo memoria
+TIMER_PERSISTENCE = os.getenv("TIMER_PERSISTENCE", "").strip().lower()
+DEFAULT_TENANT_SCHEMA = os.getenv("DEFAULT_TENANT_SCHEMA", "tenant_base")
+# /ws/timers exige JWT para unirse a la sala del tenant; "false" admite conexiones anónimas en el tenant por defecto
+WS_TIMERS_REQUIRE_AUTH = os.getenv("WS_TIMERS_REQUIRE_AUTH", "true").strip().lower() in ("1", "true", "yes", "y")
+
 def get_utc_now():
     """Obtener tiempo UTC actual con zona horaria"""
     return datetime.now(timezone.utc)
@@ -57,6 +80,11 @@ def parse_iso_datetime(iso_string):
         logger.error(f"Error parseando fecha {iso_string}: {e}")
         return get_utc_now()
 
+def _archive_engine():
+    """Engine de PostgreSQL para el archivo de timers (SQLAlchemy solo se importa si se usa)"""
+    from shared.database import get_engine
+    return get_engine()
+
 app = FastAPI(
     title="Timer Service",
     description="Servicio de temporizadores sincronizados en tiempo real",
@@ -84,6 +112,13 @@ class Timer(BaseModel):
     activo: bool = True
     completado: bool = False
     tiempoPausadoSegundos: Optional[int] = None
+    tenant: Optional[str] = None
+    rfid: Optional[str] = None
+    inventario_id: Optional[int] = None
+    # Versión de la última escritura (fusión last-writer-wins entre instancias)
+    version: int = 0
+    # Miembros de un timer de grupo (lote) creado por el API gateway; se conservan al replicarlo
+    miembros: Optional[List[Dict[str, Any]]] = None
     
     def to_dict(self):
         """Convertir a diccionario con fechas en formato ISO string"""
@@ -97,7 +132,12 @@ class Timer(BaseModel):
             "fechaFin": self.fechaFin.isoformat() if isinstance(self.fechaFin, datetime) else self.fechaFin,
             "activo": self.activo,
             "completado": self.completado,
-            "tiempoPausadoSegundos": self.tiempoPausadoSegundos
+            "tiempoPausadoSegundos": self.tiempoPausadoSegundos,
+            "tenant": self.tenant,
+            "rfid": self.rfid,
+            "inventario_id": self.inventario_id,
+            "version": self.version,
+            **({"miembros": self.miembros} if self.miembros is not None else {})
         }
 
 class WebSocketMessage(BaseModel):
@@ -109,10 +149,86 @@ class TimerManager:
     def __init__(self):
         self.timers: Dict[str, Timer] = {}
         self.connections: Set[WebSocket] = set()
+        # Salas por tenant: cada conexión solo recibe los eventos de los timers de su tenant
+        self.rooms: Dict[str, Set[WebSocket]] = {}
+        self.connection_tenants: Dict[WebSocket, str] = {}
+        self.fanout = WebSocketFanout()
+        # Sincronización de reloj por conexión (PING/PONG): decide si puede descontar en local
+        self.clock_sync: Dict[WebSocket, ClockSyncState] = {}
+        self.scheduler = CompletionScheduler()
         self.running = True
         self.server_start_time = get_utc_now()
         self.instance_id = str(uuid.uuid4())
+        # Secuencia de cambios para reanudación delta (REQUEST_SYNC con since_seq)
+        self.changelog = TimerChangeLog(epoch=self.instance_id)
+        # Reparto de timers entre instancias: solo el dueño de un timer lo descuenta y lo completa
+        self.membership = ClusterMembership(self.instance_id, message_queue, on_change=self.rebalance, role="timer_service")
+        # Versiones por timer y lápidas de eliminados para fusionar el estado con otras instancias
+        self.clock = TimerVersionClock(self.instance_id)
+        self.tombstones = TimerTombstones()
+        # Lista de timers del TIMER_SYNC ya serializada por tenant; se invalida con cada mutación
+        self.sync_cache = TimerSyncCache(self.sync_records)
+        # Cadencia de reporte del tiempo restante (por tenant) y último valor reportado de cada timer
+        self.cadence = CadencePolicy()
+        self.reported_remaining: Dict[str, int] = {}
+        # Completaciones propias pendientes de publicar en la cola timer_completed (sin duplicados)
+        self.completions = TimerCompletionPublisher(publish_timer_completed)
+        # Transición de estado del inventario de los items completados (requiere la base de datos:
+        # solo con TIMER_PERSISTENCE=postgres; si no, la aplica el API gateway)
+        self.transitions = CompletionTransitions(
+            _archive_engine, None if TIMER_PERSISTENCE == "postgres" else {}
+        )
         self.last_tick_time = get_utc_now()
+        self.store = None
+        if TIMER_PERSISTENCE == "postgres":
+            from shared.database import get_engine
+            from shared.timer_store import PostgresTimerStore
+            self.store = PostgresTimerStore(get_engine)
+        # Retención: los completados vencidos (TTL / máximo por tenant) salen de memoria al archivo
+        from shared.timer_archive import TimerRetention, build_timer_archive
+        self.retention = TimerRetention()
+        self.archive = build_timer_archive(TIMER_PERSISTENCE, _archive_engine, DEFAULT_TENANT_SCHEMA)
+        self.evicted = 0
+        
+    def persist_timer(self, timer: Timer):
+        """Encolar el estado del timer en el store (upsert por lotes)"""
+        if self.store is not None:
+            self.store.record_put(timer.to_dict())
+            
+    def persist_delete(self, timer: Timer):
+        if self.store is not None:
+            # La lápida ya lleva la versión de la eliminación (mayor que la del último estado)
+            self.store.record_delete(timer.id, timer.tenant, max(timer.version, self.tombstones.version(timer.id)))
+
+    def persist_remote(self, timer: Timer):
+        """Persistir un cambio recibido de otra instancia: la tabla es compartida y solo la
+        escribe la instancia dueña del timer."""
+        if self.membership.owns(timer.id):
+            self.persist_timer(timer)
+
+    def persist_remote_delete(self, timer: Timer):
+        if self.membership.owns(timer.id):
+            self.persist_delete(timer)
+            
+    async def start_persistence(self):
+        """Cargar los timers no completados desde PostgreSQL e iniciar el vaciado por lotes"""
+        if self.store is None:
+            return
+        try:
+            stored = await asyncio.to_thread(self.store.load)
+            for data in stored.values():
+                for date_field in ("fechaInicio", "fechaFin"):
+                    if isinstance(data.get(date_field), str):
+                        data[date_field] = parse_iso_datetime(data[date_field])
+                t = Timer(**data)
+                self.timers[t.id] = t
+            self.rebuild_schedule()
+            for tenant in {self.timer_tenant(t) for t in self.timers.values()}:
+                self.sync_cache.touch(tenant)
+            logger.info(f"Timers restaurados desde PostgreSQL: {len(stored)}")
+        except Exception as e:
+            logger.error(f"Error cargando timers persistidos: {e}")
+        self.store.start()
         
     def get_server_timestamp(self):
         """Obtener timestamp del servidor en milisegundos"""
@@ -134,60 +250,372 @@ class TimerManager:
         remaining_seconds = int((timer.fechaFin - server_now).total_seconds())
         return max(0, remaining_seconds)
         
-    async def add_connection(self, websocket: WebSocket):
-        """Agregar nueva conexión WebSocket"""
-        self.connections.add(websocket)
-        logger.info(f"Nueva conexión WebSocket. Total: {len(self.connections)}")
+    @staticmethod
+    def timer_tenant(timer: Timer) -> str:
+        """Tenant dueño del timer (los timers sin tenant pertenecen al tenant por defecto)"""
+        return timer.tenant or DEFAULT_TENANT_SCHEMA
+
+    def belongs_to(self, timer_id: str, tenant: str) -> bool:
+        timer = self.timers.get(timer_id)
+        return timer is not None and self.timer_tenant(timer) == tenant
         
-        # Enviar estado actual con tiempo del servidor
-        server_timestamp = self.get_server_timestamp()
+    def sync_records(self, tenant: Optional[str] = None):
+        """Timers del TIMER_SYNC y el seq en que se tomaron.
+
+        Los timers en curso van sin tiempo restante (el cliente lo deriva de fechaFin y del
+        server_timestamp de la cabecera): los registros no dependen del reloj y el snapshot
+        cacheado solo se invalida con mutaciones reales.
+        """
         timers_data = []
         
         for timer in self.timers.values():
-            remaining_time = self.calculate_remaining_time(timer)
-            timers_data.append({
-                **timer.to_dict(),
-                "server_remaining_time": remaining_time,
-                "server_timestamp": server_timestamp
-            })
-        
-        await self.send_to_client(websocket, {
-            "type": "TIMER_SYNC",
+            if tenant is not None and self.timer_tenant(timer) != tenant:
+                continue
+            record = timer.to_dict()
+            if timer.activo and not timer.completado:
+                record.pop("tiempoRestanteSegundos", None)
+            else:
+                record["server_remaining_time"] = self.calculate_remaining_time(timer)
+            timers_data.append(record)
+        return timers_data, self.changelog.seq
+
+    def sync_header(self, seq: int) -> Dict:
+        return {
+            "server_timestamp": self.get_server_timestamp(),
+            "tick_mode": TIMER_TICK_MODE,
+            "seq": seq,
+            "epoch": self.changelog.epoch
+        }
+
+    def build_sync_message(self, tenant: Optional[str] = None) -> Dict:
+        """Construir el mensaje TIMER_SYNC (de un tenant, si se indica) sin pasar por el cache"""
+        timers_data, seq = self.sync_records(tenant)
+        return {"type": "TIMER_SYNC", "data": {"timers": timers_data, **self.sync_header(seq)}}
+
+    async def encoded_sync_message(self, tenant: Optional[str] = None) -> str:
+        """TIMER_SYNC serializado: lista de timers del cache versionado y cabecera con server_timestamp actual"""
+        timers_json, seq = await self.sync_cache.get(tenant)
+        header = encode_message(self.sync_header(seq))
+        return '{"type":"TIMER_SYNC","data":{"timers":%s,%s}}' % (timers_json, header[1:-1])
+
+    async def send_sync(self, websocket: WebSocket, tenant: str):
+        await self.send_to_client(websocket, {"type": "TIMER_SYNC"}, payload=await self.encoded_sync_message(tenant))
+
+    def build_resync_message(self, tenant: str, since_seq=None, epoch: Optional[str] = None) -> Optional[Dict]:
+        """Delta con los cambios perdidos desde `since_seq`, o None si hace falta el TIMER_SYNC completo"""
+        changes = self.changelog.since(since_seq, tenant, epoch) if since_seq is not None else None
+        if changes is None:
+            return None
+        return {
+            "type": "TIMER_DELTA_SYNC",
             "data": {
-                "timers": timers_data,
-                "server_timestamp": server_timestamp
+                "changes": changes,
+                "seq": self.changelog.seq,
+                "epoch": self.changelog.epoch,
+                "server_timestamp": self.get_server_timestamp(),
+                "tick_mode": TIMER_TICK_MODE
             }
+        }
+
+    def sync_schedule(self, timer: Timer):
+        """Mantener el planificador de completación alineado con el estado del timer (solo timers propios)"""
+        if self.membership.owns(timer.id):
+            self.scheduler.sync(timer.id, timer.fechaFin, timer.activo, timer.completado)
+        else:
+            self.scheduler.cancel(timer.id)
+
+    def rebuild_schedule(self):
+        self.scheduler.rebuild(t for t in self.timers.values() if self.membership.owns(t.id))
+
+    async def rebalance(self):
+        """Recalcular los timers propios tras un cambio de miembros del reparto"""
+        self.rebuild_schedule()
+        logger.info(f"Timers reasignados: {len(self.scheduler)} activos propios de {len(self.timers)}")
+
+    # ---- Retención y archivo de timers completados ----
+
+    async def apply_retention(self) -> int:
+        """Archivar y sacar de memoria los timers completados que ya no se retienen (ver API gateway):
+        solo el dueño escribe en el archivo, todas las instancias desalojan y dejan lápida"""
+        completed = [t for t in self.timers.values() if t.completado]
+        if not completed:
+            return 0
+        live_by_tenant: Dict[str, int] = {}
+        for timer in self.timers.values():
+            tenant = self.timer_tenant(timer)
+            live_by_tenant[tenant] = live_by_tenant.get(tenant, 0) + 1
+        expired = self.retention.select(completed, live_by_tenant, self.timer_tenant, get_utc_now().timestamp())
+        if not expired:
+            return 0
+        
+        records = [t.to_dict() for t in expired if self.membership.owns(t.id)]
+        if records:
+            try:
+                await asyncio.to_thread(self.archive.write, records)
+            except Exception as e:
+                logger.error(f"Error archivando {len(records)} timers completados: {e}")
+                return 0
+        
+        por_tenant: Dict[str, List[str]] = {}
+        for timer in expired:
+            if self.timers.get(timer.id) is not timer or not timer.completado:
+                continue
+            del self.timers[timer.id]
+            self.scheduler.cancel(timer.id)
+            self.reported_remaining.pop(timer.id, None)
+            self.tombstones.add(timer.id, timer.version)
+            self.persist_delete(timer)
+            por_tenant.setdefault(self.timer_tenant(timer), []).append(timer.id)
+        evicted = sum(len(ids) for ids in por_tenant.values())
+        self.evicted += evicted
+        for tenant, ids in por_tenant.items():
+            await self.publish_change({
+                "type": "TIMERS_DELETED_BATCH",
+                "data": {"timerIds": ids}
+            }, tenant)
+        logger.info(f"Retención: {evicted} timers completados archivados ({len(records)} escritos por esta instancia)")
+        return evicted
+        
+    async def archive_stored_completed(self):
+        """Archivar por TTL los completados que quedaron en la tabla `timers` (la carga de
+        arranque no los trae a memoria), con una pasada en SQL por lotes."""
+        if self.store is None or self.retention.ttl <= 0:
+            return
+        try:
+            moved = await asyncio.to_thread(self.archive.archive_stored, _archive_engine, self.retention.ttl)
+        except Exception as e:
+            logger.error(f"Error archivando los timers completados de la tabla: {e}")
+            return
+        if moved:
+            logger.info(f"Retención: {moved} timers completados archivados desde la tabla timers")
+        
+    async def run_retention(self):
+        """Pasada de retención periódica"""
+        from shared.timer_archive import TIMER_ARCHIVE_STORED_INTERVAL_SECONDS, TIMER_RETENTION_INTERVAL_SECONDS
+        if not self.retention.enabled:
+            return
+        try:
+            await asyncio.to_thread(self.archive.refresh_count)
+        except Exception as e:
+            logger.error(f"No se pudo contar el archivo de timers: {e}")
+        loop = asyncio.get_running_loop()
+        await self.archive_stored_completed()
+        stored_at = loop.time()
+        while self.running:
+            await asyncio.sleep(TIMER_RETENTION_INTERVAL_SECONDS)
+            try:
+                await self.apply_retention()
+            except Exception as e:
+                logger.error(f"Error en la retención de timers: {e}")
+            if loop.time() - stored_at >= TIMER_ARCHIVE_STORED_INTERVAL_SECONDS:
+                await self.archive_stored_completed()
+                stored_at = loop.time()
+                
+    def retention_stats(self) -> Dict[str, Any]:
+        return {
+            **self.retention.describe(),
+            "live": len(self.timers),
+            "live_completed": sum(1 for t in self.timers.values() if t.completado),
+            "archived": self.archive.archived,
+            "evicted": self.evicted,
+        }
+
+    # ---- Fusión de estado entre instancias (last-writer-wins por versión) ----
+
+    def stamp_new(self, timer: Timer):
+        """Versión de un timer recién creado (por encima de una lápida previa del mismo id)"""
+        timer.version = self.clock.next(self.tombstones.version(timer.id))
+        self.tombstones.discard(timer.id)
+
+    def accepts_remote(self, timer_id: Optional[str], version: Any) -> bool:
+        """True si un evento remoto sobre `timer_id` gana a la copia y lápida locales"""
+        if not timer_id:
+            return False
+        if isinstance(version, int) and version <= self.tombstones.version(timer_id):
+            return False
+        current = self.timers.get(timer_id)
+        return current is None or is_newer(version, current.version)
+
+    def accepts_delete(self, timer_id: str, version: Any) -> bool:
+        """True si una eliminación remota con `version` gana a la copia local"""
+        current = self.timers.get(timer_id)
+        return current is not None and (not isinstance(version, int) or current.version <= version)
+
+    def build_digest_message(self) -> Dict[str, Any]:
+        """Digest compacto (id -> versión, más lápidas) que se anuncia al arrancar"""
+        return {
+            "event": "TIMERS_DIGEST",
+            "origin": self.instance_id,
+            "digest": {timer_id: t.version for timer_id, t in self.timers.items()},
+            "tombstones": self.tombstones.snapshot(),
+        }
+
+    async def handle_digest(self, msg: Dict[str, Any]):
+        """Responder al digest de otra instancia con solo los timers y lápidas que difieren"""
+        plan = diff_digest(
+            {timer_id: t.version for timer_id, t in self.timers.items()},
+            self.tombstones.snapshot(),
+            msg.get("digest") or {},
+            msg.get("tombstones") or {},
+        )
+        if plan["delete"]:
+            await self.merge_remote([], plan["delete"])
+        if not (plan["send"] or plan["tombstones"] or plan["want"]):
+            return
+        logger.info(
+            f"Fusión con {msg.get('origin')}: {len(plan['send'])} timers y {len(plan['tombstones'])} "
+            f"lápidas enviados, {len(plan['want'])} solicitados"
+        )
+        await message_queue.publish_fanout("timers.events", {
+            "event": "TIMERS_MERGE",
+            "origin": self.instance_id,
+            "target": msg.get("origin"),
+            "timers": [self.timers[timer_id].to_dict() for timer_id in plan["send"]],
+            "tombstones": plan["tombstones"],
+            "want": plan["want"],
         })
+
+    async def handle_merge(self, msg: Dict[str, Any]):
+        """Aplicar un TIMERS_MERGE y devolver los timers pedidos si iba dirigido a esta instancia"""
+        await self.merge_remote(msg.get("timers") or [], msg.get("tombstones") or {})
+        want = [timer_id for timer_id in msg.get("want") or [] if timer_id in self.timers]
+        if msg.get("target") == self.instance_id and want:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_MERGE",
+                "origin": self.instance_id,
+                "target": msg.get("origin"),
+                "timers": [self.timers[timer_id].to_dict() for timer_id in want],
+                "tombstones": {},
+                "want": [],
+            })
+
+    async def merge_remote(self, timers_data: List[Dict], tombstones: Dict[str, int]):
+        """Fusionar timers y lápidas de otra instancia (gana la versión más alta) y emitir
+        a cada sala solo lo que cambió"""
+        server_timestamp = self.get_server_timestamp()
+        creados: Dict[str, List[Dict]] = {}
+        actualizados: Dict[str, List[Dict]] = {}
+        eliminados: Dict[str, List[str]] = {}
+
+        for data in timers_data:
+            timer_id = data.get("id")
+            version = data.get("version") or 0
+            current = self.timers.get(timer_id)
+            if not timer_id or version <= self.tombstones.version(timer_id):
+                continue
+            if current is not None and version <= current.version:
+                continue
+            for date_field in ("fechaInicio", "fechaFin"):
+                if isinstance(data.get(date_field), str):
+                    data[date_field] = parse_iso_datetime(data[date_field])
+            timer = Timer(**data)
+            self.timers[timer_id] = timer
+            self.sync_schedule(timer)
+            self.persist_remote(timer)
+            destino = creados if current is None else actualizados
+            destino.setdefault(self.timer_tenant(timer), []).append({**timer.to_dict(), "server_timestamp": server_timestamp})
+
+        for timer_id, version in tombstones.items():
+            self.tombstones.add(timer_id, version)
+            current = self.timers.get(timer_id)
+            if current is None or current.version > version:
+                continue
+            del self.timers[timer_id]
+            self.scheduler.cancel(timer_id)
+            self.reported_remaining.pop(timer_id, None)
+            self.persist_remote_delete(current)
+            eliminados.setdefault(self.timer_tenant(current), []).append(timer_id)
+
+        for tenant, timers in creados.items():
+            await self.publish_change({
+                "type": "TIMERS_CREATED_BATCH",
+                "data": {"timers": timers, "server_timestamp": server_timestamp}
+            }, tenant)
+        for tenant, timers in actualizados.items():
+            await self.publish_change({
+                "type": "TIMERS_UPDATED_BATCH",
+                "data": {"timers": timers, "server_timestamp": server_timestamp}
+            }, tenant)
+        for tenant, ids in eliminados.items():
+            await self.publish_change({
+                "type": "TIMERS_DELETED_BATCH",
+                "data": {"timerIds": ids}
+            }, tenant)
+        
+    async def add_connection(self, websocket: WebSocket, tenant: Optional[str] = None, send_sync: bool = True):
+        """Agregar nueva conexión WebSocket a la sala de su tenant"""
+        tenant = tenant or DEFAULT_TENANT_SCHEMA
+        self.connections.add(websocket)
+        self.rooms.setdefault(tenant, set()).add(websocket)
+        self.connection_tenants[websocket] = tenant
+        self.fanout.register(websocket, on_dead=self.remove_connection)
+        logger.info(f"Nueva conexión WebSocket (tenant={tenant}). Total: {len(self.connections)}")
+        
+        # Enviar estado actual del tenant con tiempo del servidor (salvo que el cliente pida su propio sync)
+        if send_sync:
+            await self.send_sync(websocket, tenant)
         
     async def remove_connection(self, websocket: WebSocket):
         """Remover conexión WebSocket"""
         self.connections.discard(websocket)
+        tenant = self.connection_tenants.pop(websocket, None)
+        room = self.rooms.get(tenant)
+        if room is not None:
+            room.discard(websocket)
+            if not room:
+                del self.rooms[tenant]
+        self.fanout.unregister(websocket)
+        self.clock_sync.pop(websocket, None)
         logger.info(f"Conexión WebSocket removida. Total: {len(self.connections)}")
         
-    async def send_to_client(self, websocket: WebSocket, message: Dict):
-        """Enviar mensaje a un cliente específico"""
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            logger.error(f"Error enviando mensaje a cliente: {e}")
+    async def send_to_client(self, websocket: WebSocket, message: Dict, payload: Optional[str] = None):
+        """Enviar mensaje a un cliente específico (a través de su cola de salida)"""
+        if await self.fanout.send([websocket], message, payload=payload):
+            logger.error("Error enviando mensaje a cliente: cola de salida desbordada")
             await self.remove_connection(websocket)
             
-    async def broadcast(self, message: Dict, exclude: Optional[WebSocket] = None):
-        """Enviar mensaje a todos los clientes conectados"""
-        disconnected = set()
-        
-        for connection in self.connections:
-            if connection == exclude:
-                continue
-                
-            try:
-                await connection.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error en broadcast: {e}")
-                disconnected.add(connection)
+    async def handle_ping(self, websocket: WebSocket, data: Dict[str, Any]):
+        """Responder a un PING de sincronización de reloj con t0/t1/t2 y si la conexión puede descontar en local"""
+        received_ms = self.get_server_timestamp()
+        state = self.clock_sync.setdefault(websocket, ClockSyncState())
+        await self.send_to_client(websocket, {
+            "type": "PONG",
+            "data": state.pong(data, received_ms, self.get_server_timestamp())
+        })
+
+    def local_countdown_connections(self, tenant: str) -> Set[WebSocket]:
+        """Conexiones de la sala que descuentan en local y no necesitan los reportes periódicos"""
+        local = set()
+        for websocket in self.rooms.get(tenant, ()):
+            state = self.clock_sync.get(websocket)
+            if state is not None and state.local_countdown_allowed():
+                local.add(websocket)
+        return local
+
+    async def broadcast(self, message: Dict, exclude: Optional[WebSocket] = None, tenant: Optional[str] = None,
+                        payload: Optional[str] = None, connections: Optional[Iterable[WebSocket]] = None):
+        """Enviar mensaje a la sala de `tenant` (o a todos si no se indica, o solo a `connections`),
+        serializado una vez y vía la cola de salida de cada conexión"""
+        if connections is not None:
+            targets = connections
+        else:
+            targets = self.connections if tenant is None else self.rooms.get(tenant, ())
+        disconnected = await self.fanout.send(list(targets), message, exclude=exclude, payload=payload)
                 
         for conn in disconnected:
             await self.remove_connection(conn)
+
+    async def publish_change(self, message: Dict, tenant: str):
+        """Numerar un cambio de estado, guardarlo en el registro de cambios y emitirlo a la sala"""
+        self.changelog.record(tenant, message)
+        self.sync_cache.touch(tenant)
+        await self.broadcast(message, tenant=tenant)
+
+    async def broadcast_sync(self):
+        """Enviar a cada sala el TIMER_SYNC (cacheado) con los timers de su tenant"""
+        for tenant in list(self.rooms):
+            payload = await self.encoded_sync_message(tenant)
+            await self.broadcast({"type": "TIMER_SYNC"}, tenant=tenant, payload=payload)
             
     async def create_timer(self, timer_data: Dict, websocket: Optional[WebSocket] = None, 
                           aligned_start: Optional[datetime] = None):
@@ -224,14 +652,17 @@ class TimerManager:
         timer_data['tipoOperacion'] = timer_data.get('tipoOperacion', 'congelamiento')
         
         timer = Timer(**timer_data)
+        self.stamp_new(timer)
         self.timers[timer.id] = timer
+        self.sync_schedule(timer)
+        self.persist_timer(timer)
         
         logger.info(f"Timer creado: {timer.nombre} ({timer.id}) - {duracion_minutos} minutos - Inicio: {server_now.isoformat()}")
         
         server_timestamp = self.get_server_timestamp()
         # Importante: NO excluir al websocket origen para que el cliente que crea el timer
         # reciba inmediatamente el evento y lo refleje en su UI (evita esperas y desfaces).
-        await self.broadcast({
+        await self.publish_change({
             "type": "TIMER_CREATED",
             "data": {
                 "timer": {
@@ -239,7 +670,7 @@ class TimerManager:
                     "server_timestamp": server_timestamp
                 }
             }
-        })
+        }, self.timer_tenant(timer))
 
         try:
             await message_queue.publish_fanout("timers.events", {
@@ -262,6 +693,7 @@ class TimerManager:
         aligned_start = get_aligned_time()
         logger.info(f"Creando lote de {len(timers_data)} timers con inicio sincronizado: {aligned_start.isoformat()}")
         nuevos: List[Dict] = []
+        por_tenant: Dict[str, List[Dict]] = {}
         server_timestamp = self.get_server_timestamp()
 
         # Construir todos los timers primero (evita múltiples broadcasts secuenciales)
@@ -285,30 +717,33 @@ class TimerManager:
                     'tipoOperacion': timer_data.get('tipoOperacion', 'congelamiento')
                 }
                 t = Timer(**data)
+                self.stamp_new(t)
                 self.timers[t.id] = t
+                self.sync_schedule(t)
+                self.persist_timer(t)
                 nuevos.append({ **t.to_dict(), 'server_timestamp': server_timestamp })
+                por_tenant.setdefault(self.timer_tenant(t), []).append(nuevos[-1])
             except Exception as e:
                 logger.error(f"Error creando timer en batch: {e}")
 
         if nuevos:
-            # Broadcast único con todos los timers creados
-            await self.broadcast({
-                'type': 'TIMERS_CREATED_BATCH',
-                'data': { 'timers': nuevos, 'server_timestamp': server_timestamp }
-            })
+            # Broadcast único por sala con los timers creados de ese tenant
+            for tenant, creados in por_tenant.items():
+                await self.publish_change({
+                    'type': 'TIMERS_CREATED_BATCH',
+                    'data': { 'timers': creados, 'server_timestamp': server_timestamp }
+                }, tenant)
 
-            # Publicar cada evento en MQ (para replicación entre instancias)
-            for t in nuevos:
-                try:
-                    base = {k: v for k, v in t.items() if k != 'server_timestamp'}
-                    await message_queue.publish_fanout('timers.events', {
-                        'event': 'TIMER_CREATED',
-                        'origin': self.instance_id,
-                        'timer': base,
-                        'server_timestamp': server_timestamp
-                    })
-                except Exception as e:
-                    logger.error(f"MQ publish TIMER_CREATED (batch) error: {e}")
+            # Un único evento MQ con todo el lote (replicación entre instancias)
+            try:
+                await message_queue.publish_fanout('timers.events', {
+                    'event': 'TIMERS_CREATED_BATCH',
+                    'origin': self.instance_id,
+                    'timers': [{k: v for k, v in t.items() if k != 'server_timestamp'} for t in nuevos],
+                    'server_timestamp': server_timestamp
+                })
+            except Exception as e:
+                logger.error(f"MQ publish TIMERS_CREATED_BATCH error: {e}")
         
     async def update_timer(self, timer_id: str, updates: Dict, websocket: Optional[WebSocket] = None):
         """Actualizar temporizador existente"""
@@ -319,19 +754,22 @@ class TimerManager:
         timer = self.timers[timer_id]
         
         for key, value in updates.items():
-            if hasattr(timer, key):
+            if key != "version" and hasattr(timer, key):
                 # Convertir fechas si es necesario
                 if key in ['fechaInicio', 'fechaFin'] and isinstance(value, str):
                     value = parse_iso_datetime(value)
                 setattr(timer, key, value)
+        timer.version = self.clock.next(timer.version)
+        self.sync_schedule(timer)
+        self.persist_timer(timer)
                 
         logger.info(f"Timer actualizado: {timer.nombre} ({timer_id})")
         
         # Incluir siempre al origen para que vea inmediatamente la pausa / reanudación / cambios.
-        await self.broadcast({
+        await self.publish_change({
             "type": "TIMER_UPDATED",
             "data": {"timer": timer.to_dict()}
-        })
+        }, self.timer_tenant(timer))
 
         try:
             await message_queue.publish_fanout("timers.events", {
@@ -348,20 +786,25 @@ class TimerManager:
         """Eliminar temporizador"""
         if timer_id in self.timers:
             timer = self.timers.pop(timer_id)
+            self.scheduler.cancel(timer_id)
+            version = self.clock.next(timer.version)
+            self.tombstones.add(timer_id, version)
+            self.persist_delete(timer)
             
             logger.info(f"Timer eliminado: {timer.nombre} ({timer_id})")
             
             # Incluir origen para que el cliente que borra elimine su copia local sin esperar sync.
-            await self.broadcast({
+            await self.publish_change({
                 "type": "TIMER_DELETED",
                 "data": {"timerId": timer_id}
-            })
+            }, self.timer_tenant(timer))
 
             try:
                 await message_queue.publish_fanout("timers.events", {
                     "event": "TIMER_DELETED",
                     "origin": self.instance_id,
-                    "timerId": timer_id
+                    "timerId": timer_id,
+                    "version": version
                 })
             except Exception as e:
                 logger.error(f"MQ publish TIMER_DELETED error: {e}")
@@ -369,6 +812,84 @@ class TimerManager:
             return True
         return False
         
+    async def update_timers_batch(self, updates_by_id: Dict[str, Dict]) -> List[Timer]:
+        """Aplicar cambios a varios timers con un frame TIMERS_UPDATED_BATCH por sala y un único evento MQ"""
+        actualizados: List[Timer] = []
+        por_tenant: Dict[str, List[Dict]] = {}
+        for timer_id, updates in updates_by_id.items():
+            timer = self.timers.get(timer_id)
+            if timer is None:
+                continue
+            for key, value in updates.items():
+                if key != "version" and hasattr(timer, key):
+                    if key in ['fechaInicio', 'fechaFin'] and isinstance(value, str):
+                        value = parse_iso_datetime(value)
+                    setattr(timer, key, value)
+            timer.version = self.clock.next(timer.version)
+            self.sync_schedule(timer)
+            self.persist_timer(timer)
+            actualizados.append(timer)
+            por_tenant.setdefault(self.timer_tenant(timer), []).append(timer.to_dict())
+        
+        if not actualizados:
+            return actualizados
+        logger.info(f"Lote de timers actualizado: {len(actualizados)} timers")
+        
+        server_timestamp = self.get_server_timestamp()
+        for tenant, timers in por_tenant.items():
+            await self.publish_change({
+                "type": "TIMERS_UPDATED_BATCH",
+                "data": {"timers": timers, "server_timestamp": server_timestamp}
+            }, tenant)
+        
+        try:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_UPDATED_BATCH",
+                "origin": self.instance_id,
+                "timers": [t.to_dict() for t in actualizados],
+                "server_timestamp": server_timestamp
+            })
+        except Exception as e:
+            logger.error(f"MQ publish TIMERS_UPDATED_BATCH error: {e}")
+        return actualizados
+        
+    async def delete_timers_batch(self, timer_ids: List[str]) -> List[str]:
+        """Eliminar varios timers con un frame TIMERS_DELETED_BATCH por sala y un único evento MQ"""
+        eliminados: List[str] = []
+        versiones: Dict[str, int] = {}
+        por_tenant: Dict[str, List[str]] = {}
+        for timer_id in timer_ids:
+            timer = self.timers.pop(timer_id, None)
+            if timer is None:
+                continue
+            self.scheduler.cancel(timer_id)
+            versiones[timer_id] = self.clock.next(timer.version)
+            self.tombstones.add(timer_id, versiones[timer_id])
+            self.persist_delete(timer)
+            eliminados.append(timer_id)
+            por_tenant.setdefault(self.timer_tenant(timer), []).append(timer_id)
+        
+        if not eliminados:
+            return eliminados
+        logger.info(f"Lote de timers eliminado: {len(eliminados)} timers")
+        
+        for tenant, ids in por_tenant.items():
+            await self.publish_change({
+                "type": "TIMERS_DELETED_BATCH",
+                "data": {"timerIds": ids}
+            }, tenant)
+        
+        try:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_DELETED_BATCH",
+                "origin": self.instance_id,
+                "timerIds": eliminados,
+                "versions": versiones
+            })
+        except Exception as e:
+            logger.error(f"MQ publish TIMERS_DELETED_BATCH error: {e}")
+        return eliminados
+        
     async def pause_timer(self, timer_id: str, websocket: Optional[WebSocket] = None):
         """Pausar temporizador: guardar tiempo restante actual"""
         if timer_id not in self.timers:
@@ -417,57 +938,234 @@ class TimerManager:
         logger.info(f"Reanudando timer {timer_id} con {restante} segundos")
         return await self.update_timer(timer_id, updates, websocket)
         
+    async def pause_timers_batch(self, timer_ids: List[str]) -> List[Timer]:
+        """Pausar varios timers con un único TIMERS_UPDATED_BATCH; los ya pausados o completados se omiten"""
+        updates: Dict[str, Dict] = {}
+        for timer_id in timer_ids:
+            timer = self.timers.get(timer_id)
+            if timer is None or not timer.activo or timer.completado:
+                continue
+            remaining = self.calculate_remaining_time(timer)
+            updates[timer_id] = {
+                "activo": False,
+                "tiempoPausadoSegundos": remaining,
+                "tiempoRestanteSegundos": remaining
+            }
+        return await self.update_timers_batch(updates)
+        
+    async def resume_timers_batch(self, timer_ids: List[str]) -> List[Timer]:
+        """Reanudar varios timers pausados, todos alineados al mismo segundo, con un único TIMERS_UPDATED_BATCH"""
+        new_start = get_aligned_time()
+        updates: Dict[str, Dict] = {}
+        for timer_id in timer_ids:
+            timer = self.timers.get(timer_id)
+            if timer is None or timer.activo or timer.completado:
+                continue
+            restante = timer.tiempoPausadoSegundos if timer.tiempoPausadoSegundos is not None else timer.tiempoRestanteSegundos
+            restante = max(0, restante)
+            updates[timer_id] = {
+                "activo": True,
+                "fechaInicio": new_start,
+                "fechaFin": new_start + timedelta(seconds=restante),
+                "tiempoPausadoSegundos": None,
+                "tiempoRestanteSegundos": restante
+            }
+        return await self.update_timers_batch(updates)
+        
+    async def control_timers_batch(self, action: str, timer_ids: List[str]) -> List[str]:
+        """Aplicar "pause" / "resume" / "delete" a todos los timers de una vez (sin ceder el bucle
+        de eventos entre timers): una escritura en el store, un frame por sala y un evento MQ"""
+        if action == "pause":
+            return [timer.id for timer in await self.pause_timers_batch(timer_ids)]
+        if action == "resume":
+            return [timer.id for timer in await self.resume_timers_batch(timer_ids)]
+        if action == "delete":
+            return await self.delete_timers_batch(timer_ids)
+        raise ValueError(f"Acción de lote desconocida: {action}")
+        
+    async def publish_tick(self, updates: List[Dict], server_timestamp: int):
+        """Publicar el tick de los timers propios en MQ (solo si hay otras instancias)"""
+        if not self.membership.enabled or len(self.membership.members) < 2:
+            return
+        try:
+            await message_queue.publish_fanout("timers.events", {
+                "event": "TIMERS_TICK",
+                "origin": self.instance_id,
+                # Los seq son locales: el receptor asigna los suyos
+                "updates": [{k: v for k, v in u.items() if k != "seq"} for u in updates],
+                "server_timestamp": server_timestamp
+            }, persistent=False)
+        except Exception as e:
+            logger.error(f"MQ publish TIMERS_TICK error: {e}")
+
+    async def apply_remote_tick(self, updates: List[Dict], server_timestamp: int):
+        """Aplicar el tick de la instancia dueña y retransmitirlo a las salas locales"""
+        por_tenant: Dict[str, List[Dict]] = {}
+        for update in updates:
+            timer = self.timers.get(update.get("timerId"))
+            if timer is None:
+                continue
+            timer.tiempoRestanteSegundos = update.get("tiempoRestanteSegundos", timer.tiempoRestanteSegundos)
+            tenant = self.timer_tenant(timer)
+            if update.get("completado") and not timer.completado:
+                timer.completado = True
+                timer.activo = False
+                if isinstance(update.get("version"), int):
+                    timer.version = max(timer.version, update["version"])
+                self.scheduler.cancel(timer.id)
+                self.persist_remote(timer)
+                seq = self.changelog.record(tenant, {
+                    "type": "TIMER_UPDATED",
+                    "data": {"timer": timer.to_dict()}
+                })
+                self.sync_cache.touch(tenant)
+                update = {**update, "seq": seq}
+            por_tenant.setdefault(tenant, []).append(update)
+        
+        for tenant, tenant_updates in por_tenant.items():
+            await self.broadcast_tick_updates(tenant, tenant_updates, server_timestamp)
+
+    async def broadcast_tick_updates(self, tenant: str, updates: List[Dict], server_timestamp: int):
+        """Enviar las actualizaciones de un tick en un solo TIMER_BATCH_UPDATE a la sala del tenant.
+
+        Con completaciones el frame lleva su seq más alto y no se combina en la cola de salida.
+        Las conexiones con cuenta atrás local solo reciben las completaciones.
+        """
+        local = self.local_countdown_connections(tenant) if TIMER_TICK_MODE != "local" else set()
+        remote = self.rooms.get(tenant, set()) - local
+        if remote:
+            await self.broadcast(self._tick_frame(updates, server_timestamp), connections=remote)
+        completions = [u for u in updates if u.get("completado")]
+        if local and completions:
+            await self.broadcast(self._tick_frame(completions, server_timestamp), connections=local)
+
+    def _tick_frame(self, updates: List[Dict], server_timestamp: int) -> Dict:
+        message = {
+            "type": "TIMER_BATCH_UPDATE",
+            "data": {"updates": updates, "server_timestamp": server_timestamp}
+        }
+        seqs = [u["seq"] for u in updates if "seq" in u]
+        if seqs:
+            message["seq"] = max(seqs)
+        return message
+        
+    def tick_delay(self, now_ts: float, next_scan_ts: float) -> float:
+        """Segundos hasta el siguiente recorrido completo o la próxima completación propia, lo que llegue antes"""
+        wake = next_scan_ts
+        deadline = self.scheduler.next_deadline()
+        if deadline is not None and deadline < wake:
+            wake = deadline
+        return max(TIMER_TICK_MIN_SLEEP_SECONDS, wake - now_ts)
+        
+    async def apply_completion_transitions(self):
+        """Aplicar la transición de inventario de los timers completados y avisar a cada sala
+        con un único inventory_updated"""
+        changed = await self.transitions.flush()
+        for tenant, items in changed.items():
+            if not items:
+                continue
+            logger.info(f"Transición automática de {len(items)} items por timers completados (tenant={tenant})")
+            await self.broadcast({
+                "type": "inventory_updated",
+                "data": {"origen": "timer_completed", "items": items, "timestamp": get_utc_now().isoformat()}
+            }, tenant=tenant)
+        
     async def tick_timers(self):
-        """Actualizar todos los timers activos cada segundo"""
+        """Recorrer los timers activos propios cada segundo (reportándolos según la cadencia de su
+        tenant) y despertar además en cada completación para emitirla a tiempo"""
+        next_scan_ts = 0.0
         while self.running:
             try:
-                await asyncio.sleep(1)  # Esperar exactamente 1 segundo
+                await asyncio.sleep(self.tick_delay(get_utc_now().timestamp(), next_scan_ts))
                 
                 current_time = get_utc_now()
                 server_timestamp = self.get_server_timestamp()
+                now_ts = current_time.timestamp()
+                scan = now_ts >= next_scan_ts
+                if scan:
+                    # Paso fijo de 1 s sin acumular la deriva del procesamiento
+                    next_scan_ts = next_scan_ts + 1 if now_ts - next_scan_ts < 1 else now_ts + 1
+                
+                updates_to_broadcast: Dict[str, List[Dict]] = {}
                 
-                # Solo procesar timers activos
-                active_timers = [t for t in self.timers.values() if t.activo and not t.completado]
+                # Completaciones desde el min-heap: O(log n) por timer vencido
+                for timer_id in self.scheduler.pop_due(current_time):
+                    timer = self.timers.get(timer_id)
+                    if timer is None or timer.completado:
+                        continue
+                    timer.completado = True
+                    timer.activo = False
+                    timer.tiempoRestanteSegundos = 0
+                    timer.version = self.clock.next(timer.version)
+                    logger.info(f"Timer completado: {timer.nombre} ({timer.id})")
+                    self.reported_remaining.pop(timer_id, None)
+                    self.persist_timer(timer)
+                    # La completación queda en el registro de cambios para la reanudación delta
+                    seq = self.changelog.record(self.timer_tenant(timer), {
+                        "type": "TIMER_UPDATED",
+                        "data": {"timer": timer.to_dict()}
+                    })
+                    self.sync_cache.touch(self.timer_tenant(timer))
+                    completed = {**timer.to_dict(), "tenant": self.timer_tenant(timer), "timestamp": current_time.isoformat()}
+                    if TIMER_COMPLETED_PUBLISH:
+                        self.completions.add(completed)
+                    self.transitions.add(completed["tenant"], completed)
+                    updates_to_broadcast.setdefault(self.timer_tenant(timer), []).append({
+                        "timerId": timer.id,
+                        "tiempoRestanteSegundos": 0,
+                        "completado": True,
+                        "activo": False,
+                        # La versión viaja con la completación para que las demás instancias la adopten
+                        "version": timer.version,
+                        "seq": seq
+                    })
                 
-                updates_to_broadcast = []
+                # Solo los timers activos siguen en el planificador
+                active_ids = self.scheduler.active_ids()
                 
-                for timer in active_timers:
-                    # Calcular tiempo restante
-                    remaining_time = self.calculate_remaining_time(timer)
-                    
-                    # Actualizar el timer
-                    old_remaining = timer.tiempoRestanteSegundos
-                    timer.tiempoRestanteSegundos = remaining_time
-                    
-                    # Verificar si se completó
-                    if remaining_time <= 0:
-                        timer.completado = True
-                        timer.activo = False
-                        timer.tiempoRestanteSegundos = 0
-                        logger.info(f"Timer completado: {timer.nombre} ({timer.id})")
-                    
-                    # Agregar a la lista de actualizaciones
-                    if old_remaining != remaining_time or timer.completado:
-                        updates_to_broadcast.append({
-                            "timerId": timer.id,
-                            "tiempoRestanteSegundos": remaining_time,
-                            "completado": timer.completado,
-                            "activo": timer.activo
-                        })
+                if TIMER_TICK_MODE != "local" and scan:
+                    for timer_id in active_ids:
+                        timer = self.timers.get(timer_id)
+                        if timer is None:
+                            self.scheduler.cancel(timer_id)
+                            continue
+                        
+                        # Calcular tiempo restante
+                        remaining_time = self.calculate_remaining_time(timer)
+                        
+                        if timer.tiempoRestanteSegundos == remaining_time:
+                            continue
+                        timer.tiempoRestanteSegundos = remaining_time
+                        tenant = self.timer_tenant(timer)
+                        if self.cadence.should_report(self.reported_remaining.get(timer_id), remaining_time, tenant):
+                            self.reported_remaining[timer_id] = remaining_time
+                            updates_to_broadcast.setdefault(tenant, []).append({
+                                "timerId": timer.id,
+                                "tiempoRestanteSegundos": remaining_time,
+                                "completado": timer.completado,
+                                "activo": timer.activo
+                            })
+                
+                # Enviar las actualizaciones en un solo mensaje por sala de tenant
+                for tenant, updates in updates_to_broadcast.items():
+                    await self.broadcast_tick_updates(tenant, updates, server_timestamp)
                 
-                # Enviar todas las actualizaciones en un solo mensaje
+                # Las demás instancias retransmiten el tick de nuestros timers a sus salas
                 if updates_to_broadcast:
-                    await self.broadcast({
-                        "type": "TIMER_BATCH_UPDATE",
-                        "data": {
-                            "updates": updates_to_broadcast,
-                            "server_timestamp": server_timestamp
-                        }
-                    })
+                    await self.publish_tick(
+                        [u for updates in updates_to_broadcast.values() for u in updates], server_timestamp
+                    )
+                # Las completaciones van a alerts_service por la cola timer_completed
+                self.completions.schedule_flush()
+                if self.transitions.due(now_ts):
+                    asyncio.create_task(self.apply_completion_transitions())
                 
                 # Log periódico cada 10s (aunque no haya activos) para verificar que el loop vive
-                if int(current_time.timestamp()) % 10 == 0:
-                    logger.info(f"[TICK] activos={len(active_timers)} total={len(self.timers)} conexiones={len(self.connections)}")
+                if scan and int(now_ts) % 10 == 0:
+                    logger.info(f"[TICK] activos={len(active_ids)} total={len(self.timers)} conexiones={len(self.connections)}")
+                    self.tombstones.prune()
+                    for timer_id in [tid for tid in self.reported_remaining if tid not in self.scheduler]:
+                        del self.reported_remaining[timer_id]
                 
             except Exception as e:
                 logger.error(f"Error en tick_timers: {e}", exc_info=True)
@@ -478,7 +1176,9 @@ timer_manager = TimerManager()
 @app.on_event("startup")
 async def startup_event():
     """Iniciar el loop de actualización de timers"""
+    await timer_manager.start_persistence()
     asyncio.create_task(timer_manager.tick_timers())
+    asyncio.create_task(timer_manager.run_retention())
     logger.info(f"Timer service iniciado - instance_id: {timer_manager.instance_id}")
     
     async def init_mq():
@@ -495,7 +1195,7 @@ async def startup_event():
                     
                     if evt == "TIMER_CREATED":
                         data = msg.get("timer")
-                        if data:
+                        if data and timer_manager.accepts_remote(data.get("id"), data.get("version")):
                             # Convertir fechas
                             for date_field in ["fechaInicio", "fechaFin"]:
                                 if date_field in data and isinstance(data[date_field], str):
@@ -506,9 +1206,11 @@ async def startup_event():
                             
                             t = Timer(**data)
                             timer_manager.timers[t.id] = t
+                            timer_manager.sync_schedule(t)
+                            timer_manager.persist_remote(t)
                             logger.info(f"[MQ] TIMER_CREATED replicado: {t.id}")
                             
-                            await timer_manager.broadcast({
+                            await timer_manager.publish_change({
                                 "type": "TIMER_CREATED",
                                 "data": {
                                     "timer": {
@@ -516,11 +1218,84 @@ async def startup_event():
                                         "server_timestamp": msg.get("server_timestamp")
                                     }
                                 }
-                            })
+                            }, timer_manager.timer_tenant(t))
+                            
+                    elif evt == "TIMERS_CREATED_BATCH":
+                        por_tenant: Dict[str, List[Dict]] = {}
+                        for data in msg.get("timers", []):
+                            if not timer_manager.accepts_remote(data.get("id"), data.get("version")):
+                                continue
+                            for date_field in ["fechaInicio", "fechaFin"]:
+                                if date_field in data and isinstance(data[date_field], str):
+                                    data[date_field] = parse_iso_datetime(data[date_field])
+                            data.setdefault('tiempoPausadoSegundos', None)
+                            t = Timer(**data)
+                            timer_manager.timers[t.id] = t
+                            timer_manager.sync_schedule(t)
+                            timer_manager.persist_remote(t)
+                            por_tenant.setdefault(timer_manager.timer_tenant(t), []).append(
+                                {**t.to_dict(), "server_timestamp": msg.get("server_timestamp")}
+                            )
+                        logger.info(f"[MQ] TIMERS_CREATED_BATCH replicado: {sum(len(v) for v in por_tenant.values())} timers")
+                        
+                        for tenant, creados in por_tenant.items():
+                            await timer_manager.publish_change({
+                                "type": "TIMERS_CREATED_BATCH",
+                                "data": {"timers": creados, "server_timestamp": msg.get("server_timestamp")}
+                            }, tenant)
+                            
+                    elif evt == "TIMERS_TICK":
+                        await timer_manager.apply_remote_tick(msg.get("updates", []), msg.get("server_timestamp"))
+                    
+                    elif evt == "TIMERS_CHANGED_BATCH":
+                        # Lote de pausa/reanudación/eliminación del gateway: timers y lápidas con su versión
+                        await timer_manager.merge_remote(msg.get("timers", []), msg.get("tombstones") or {})
+                            
+                    elif evt == "TIMERS_UPDATED_BATCH":
+                        por_tenant_upd: Dict[str, List[Dict]] = {}
+                        for data in msg.get("timers", []):
+                            timer = timer_manager.timers.get(data.get("id"))
+                            if timer is None or not timer_manager.accepts_remote(timer.id, data.get("version")):
+                                continue
+                            for k, v in data.items():
+                                if k in ("fechaInicio", "fechaFin") and isinstance(v, str):
+                                    v = parse_iso_datetime(v)
+                                if hasattr(timer, k):
+                                    setattr(timer, k, v)
+                            timer_manager.sync_schedule(timer)
+                            timer_manager.persist_remote(timer)
+                            por_tenant_upd.setdefault(timer_manager.timer_tenant(timer), []).append(timer.to_dict())
+                        
+                        for tenant, timers in por_tenant_upd.items():
+                            await timer_manager.publish_change({
+                                "type": "TIMERS_UPDATED_BATCH",
+                                "data": {"timers": timers, "server_timestamp": msg.get("server_timestamp")}
+                            }, tenant)
+                            
+                    elif evt == "TIMERS_DELETED_BATCH":
+                        por_tenant_del: Dict[str, List[str]] = {}
+                        versiones = msg.get("versions") or {}
+                        for tid in msg.get("timerIds", []):
+                            if isinstance(versiones.get(tid), int):
+                                timer_manager.tombstones.add(tid, versiones[tid])
+                            if not timer_manager.accepts_delete(tid, versiones.get(tid)):
+                                continue
+                            t = timer_manager.timers.pop(tid)
+                            timer_manager.scheduler.cancel(tid)
+                            timer_manager.reported_remaining.pop(tid, None)
+                            timer_manager.persist_remote_delete(t)
+                            por_tenant_del.setdefault(timer_manager.timer_tenant(t), []).append(tid)
+                        
+                        for tenant, ids in por_tenant_del.items():
+                            await timer_manager.publish_change({
+                                "type": "TIMERS_DELETED_BATCH",
+                                "data": {"timerIds": ids}
+                            }, tenant)
                             
                     elif evt == "TIMER_UPDATED":
                         data = msg.get("timer")
-                        if data and data.get("id") in timer_manager.timers:
+                        if (data and data.get("id") in timer_manager.timers
+                                and timer_manager.accepts_remote(data["id"], data.get("version"))):
                             tid = data["id"]
                             timer = timer_manager.timers[tid]
                             
@@ -529,24 +1304,37 @@ async def startup_event():
                                     v = parse_iso_datetime(v)
                                 if hasattr(timer, k):
                                     setattr(timer, k, v)
+                            timer_manager.sync_schedule(timer)
+                            timer_manager.persist_remote(timer)
                                     
                             logger.info(f"[MQ] TIMER_UPDATED replicado: {tid}")
                             
-                            await timer_manager.broadcast({
+                            await timer_manager.publish_change({
                                 "type": "TIMER_UPDATED",
                                 "data": {"timer": timer.to_dict()}
-                            })
+                            }, timer_manager.timer_tenant(timer))
                             
                     elif evt == "TIMER_DELETED":
                         tid = msg.get("timerId")
-                        if tid and tid in timer_manager.timers:
-                            timer_manager.timers.pop(tid, None)
+                        if tid and isinstance(msg.get("version"), int):
+                            timer_manager.tombstones.add(tid, msg["version"])
+                        if tid and timer_manager.accepts_delete(tid, msg.get("version")):
+                            t = timer_manager.timers.pop(tid)
+                            timer_manager.scheduler.cancel(tid)
+                            timer_manager.reported_remaining.pop(tid, None)
+                            timer_manager.persist_remote_delete(t)
                             logger.info(f"[MQ] TIMER_DELETED replicado: {tid}")
                             
-                            await timer_manager.broadcast({
+                            await timer_manager.publish_change({
                                 "type": "TIMER_DELETED",
                                 "data": {"timerId": tid}
-                            })
+                            }, timer_manager.timer_tenant(t))
+                    
+                    elif evt == "TIMERS_DIGEST":
+                        await timer_manager.handle_digest(msg)
+                    
+                    elif evt == "TIMERS_MERGE":
+                        await timer_manager.handle_merge(msg)
                             
                 except Exception as e:
                     logger.error(f"Error procesando evento MQ: {e}", exc_info=True)
@@ -554,6 +1342,12 @@ async def startup_event():
             await message_queue.consume_fanout("timers.events", on_event)
             logger.info("Suscrito a fanout timers.events")
             
+            # Latidos de pertenencia para repartir los timers entre instancias vivas
+            await timer_manager.membership.start()
+            
+            # Anunciar el digest (id -> versión): las demás instancias responden solo con lo que difiere
+            await message_queue.publish_fanout("timers.events", timer_manager.build_digest_message())
+            
         except Exception as e:
             logger.error(f"No se pudo inicializar MQ: {e}")
 
@@ -563,13 +1357,38 @@ async def startup_event():
 async def shutdown_event():
     """Detener el servicio"""
     timer_manager.running = False
+    await timer_manager.membership.stop()
+    if timer_manager.store is not None:
+        await timer_manager.store.stop()
     logger.info("Servicio de timers detenido")
 
+def _ws_tenant_from_token(websocket: WebSocket) -> Optional[str]:
+    """Tenant del JWT de la conexión (query ?token= o cabecera Authorization: Bearer); None si no es válido"""
+    token = websocket.query_params.get("token")
+    if not token:
+        auth = websocket.headers.get("authorization", "")
+        if auth.lower().startswith("bearer "):
+            token = auth[7:].strip()
+    if not token:
+        return None
+    try:
+        return get_current_user_from_token(token).get("tenant") or DEFAULT_TENANT_SCHEMA
+    except HTTPException:
+        return None
+
 @app.websocket("/ws/timers")
 async def websocket_endpoint(websocket: WebSocket):
-    """Endpoint principal de WebSocket para timers"""
+    """Endpoint principal de WebSocket para timers (una sala por tenant)"""
+    tenant = _ws_tenant_from_token(websocket)
+    if tenant is None:
+        if WS_TIMERS_REQUIRE_AUTH:
+            logger.warning("Conexión WebSocket rechazada: token ausente o inválido")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        tenant = DEFAULT_TENANT_SCHEMA
     await websocket.accept()
-    await timer_manager.add_connection(websocket)
+    # ?sync=request: el cliente enviará su propio REQUEST_SYNC (con since_seq) en lugar del snapshot inicial
+    await timer_manager.add_connection(websocket, tenant, send_sync=websocket.query_params.get("sync") != "request")
     
     try:
         while True:
@@ -580,59 +1399,61 @@ async def websocket_endpoint(websocket: WebSocket):
             message_data = message.get("data", {})
             
             if message_type in ("REQUEST_SYNC", "SYNC_REQUEST"):
-                server_timestamp = timer_manager.get_server_timestamp()
-                timers_data = []
+                # Delta desde since_seq si sigue en el registro de cambios; si no, TIMER_SYNC completo
+                resync = timer_manager.build_resync_message(tenant, message_data.get("since_seq"), message_data.get("epoch"))
+                logger.info(f"Sync solicitado ({resync['type'] if resync else 'TIMER_SYNC'})")
                 
-                for timer in timer_manager.timers.values():
-                    remaining_time = timer_manager.calculate_remaining_time(timer)
-                    timers_data.append({
-                        **timer.to_dict(),
-                        "server_remaining_time": remaining_time,
-                        "server_timestamp": server_timestamp
-                    })
-                
-                logger.info(f"Sync solicitado - enviando {len(timers_data)} timers")
-                
-                await timer_manager.send_to_client(websocket, {
-                    "type": "TIMER_SYNC",
-                    "data": {
-                        "timers": timers_data,
-                        "server_timestamp": server_timestamp
-                    }
-                })
+                if resync is None:
+                    await timer_manager.send_sync(websocket, tenant)
+                else:
+                    await timer_manager.send_to_client(websocket, resync)
                 
             elif message_type == "CREATE_TIMER":
                 timer_data = message_data.get("timer")
                 if timer_data:
-                    await timer_manager.create_timer(timer_data, websocket)
+                    # El timer pertenece siempre al tenant de la conexión
+                    timer_data["tenant"] = tenant
+                    if timer_data.get("id") in timer_manager.timers and not timer_manager.belongs_to(timer_data["id"], tenant):
+                        logger.warning(f"CREATE_TIMER ignorado: timer {timer_data['id']} de otro tenant")
+                    else:
+                        await timer_manager.create_timer(timer_data, websocket)
                     
             elif message_type == "CREATE_TIMERS_BATCH":
                 # Nuevo mensaje para crear múltiples timers sincronizados
                 timers_data = message_data.get("timers", [])
                 if timers_data:
+                    for timer_data in timers_data:
+                        timer_data["tenant"] = tenant
                     await timer_manager.create_timers_batch(timers_data, websocket)
                     
             elif message_type == "PAUSE_TIMER":
                 timer_id = message_data.get("timerId")
-                if timer_id:
+                if timer_id and timer_manager.belongs_to(timer_id, tenant):
                     await timer_manager.pause_timer(timer_id, websocket)
                     
             elif message_type == "RESUME_TIMER":
                 timer_id = message_data.get("timerId")
-                if timer_id:
+                if timer_id and timer_manager.belongs_to(timer_id, tenant):
                     await timer_manager.resume_timer(timer_id, websocket)
                     
             elif message_type == "DELETE_TIMER":
                 timer_id = message_data.get("timerId")
-                if timer_id:
+                if timer_id and timer_manager.belongs_to(timer_id, tenant):
                     await timer_manager.delete_timer(timer_id, websocket)
                     
+            elif message_type in BATCH_ACTIONS:
+                # Pausar / reanudar / eliminar por lista de ids, inventario_ids o rfids
+                selector = TimerSelector.from_message(message_data)
+                if selector.lotes:
+                    # Este servicio no tiene acceso al inventario: el lote se resuelve en el API gateway
+                    logger.warning(f"{message_type}: selector por lote no soportado aquí, se ignora {selector.lotes}")
+                timer_ids = selector.select(timer_manager.timers, tenant, timer_manager.timer_tenant)
+                if timer_ids:
+                    await timer_manager.control_timers_batch(BATCH_ACTIONS[message_type], timer_ids)
+                    
             elif message_type == "PING":
-                # Responder al ping para mantener la conexión viva
-                await timer_manager.send_to_client(websocket, {
-                    "type": "PONG",
-                    "data": {"timestamp": timer_manager.get_server_timestamp()}
-                })
+                # Keepalive y sincronización de reloj estilo NTP (t0/t1/t2 + cuenta atrás local)
+                await timer_manager.handle_ping(websocket, message_data)
                 
             else:
                 logger.warning(f"Tipo de mensaje no reconocido: {message_type}")
@@ -652,6 +1473,12 @@ async def health_check():
         "timers_count": len(timer_manager.timers),
         "active_timers": len([t for t in timer_manager.timers.values() if t.activo]),
         "connections_count": len(timer_manager.connections),
+        "fanout": timer_manager.fanout.latency_stats(),
+        "cluster": {**timer_manager.membership.stats(), "owned_active_timers": len(timer_manager.scheduler)},
+        "sync_cache": timer_manager.sync_cache.stats(),
+        "retention": timer_manager.retention_stats(),
+        "completions": timer_manager.completions.stats(),
+        "transitions": timer_manager.transitions.stats(),
         "timestamp": get_utc_now().isoformat(),
         "instance_id": timer_manager.instance_id
     }
@@ -681,31 +1508,13 @@ async def get_timers():
 async def force_sync():
     """Forzar sincronización de todos los timers"""
     current_time = get_utc_now()
-    server_timestamp = timer_manager.get_server_timestamp()
-    timers_actualizados = []
     
-    for timer in timer_manager.timers.values():
-        tiempo_restante = timer_manager.calculate_remaining_time(timer)
-        
-        timer_dict = timer.to_dict()
-        timer_dict['tiempoRestanteSegundos'] = tiempo_restante
-        timer_dict['server_remaining_time'] = tiempo_restante
-        timer_dict['server_timestamp'] = server_timestamp
-        
-        timers_actualizados.append(timer_dict)
-    
-    # Broadcast a todos los clientes conectados
-    await timer_manager.broadcast({
-        "type": "TIMER_SYNC",
-        "data": {
-            "timers": timers_actualizados,
-            "server_timestamp": server_timestamp
-        }
-    })
+    # Cada sala recibe solo el TIMER_SYNC de su tenant
+    await timer_manager.broadcast_sync()
     
     return {
         "message": "Sincronización forzada completada",
-        "timers_synced": len(timers_actualizados),
+        "timers_synced": len(timer_manager.timers),
         "server_time": current_time.isoformat()
     }
 